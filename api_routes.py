@@ -1,23 +1,19 @@
 import os
 import json
 import logging
-import threading
+import uuid
 from flask import request, jsonify
 from werkzeug.utils import secure_filename
 from app import app, db
-from models import Book, BookPage, ProcessingJob, Figure, FileHash
+from models import Book, BookPage, ProcessingJob, Figure, insert_file_hashes
 from datetime import datetime
-from utils import compute_image_hash
+from utils import compute_image_hash, store_file_by_hash
 from processing_service import process_book
+from routes import allowed_file, invalidate_book_status, discard_stored_uploads, log_job_failure
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
-
 @app.route('/api/upload-chunk', methods=['POST'])
 def upload_chunk():
     """API endpoint для загрузки файлов по частям"""
@@ -61,7 +57,7 @@ def upload_chunk():
         
         # Сохраняем файл во временную директорию для обработки
         temp_filename = secure_filename(file.filename)
-        temp_filepath = os.path.join('/tmp', temp_filename)
+        temp_filepath = os.path.join(app.config['UPLOAD_TEMP_FOLDER'], f"{uuid.uuid4().hex}_{temp_filename}")
         file.save(temp_filepath)
         
         # Проверка хеша файла (упрощенная, без проверки дубликатов)
@@ -73,9 +69,11 @@ def upload_chunk():
             file_hash = None
             
         # Сохраняем файл в постоянную директорию
+        file_path = None
+        page_saved = False
         try:
-            # Обеспечиваем безопасное имя файла и не слишком длинный путь
-            safe_filename = secure_filename(file.filename)
+            # Безопасное имя уже вычислено выше, ограничиваем длину пути
+            safe_filename = temp_filename
             if len(safe_filename) > 50:  # Ограничиваем длину имени файла
                 extension = safe_filename.rsplit('.', 1)[1] if '.' in safe_filename else ''
                 safe_filename = safe_filename[:40] + '.' + extension if extension else safe_filename[:50]
@@ -83,51 +81,36 @@ def upload_chunk():
             # Формируем окончательный путь к файлу
             filename = f"{book_id}_{file_index}_{safe_filename}"
             uploads_folder = app.config['UPLOAD_FOLDER']
-            if not os.path.exists(uploads_folder):
-                os.makedirs(uploads_folder, exist_ok=True)
-                
-            file_path = os.path.join(uploads_folder, filename)
             
-            # Копируем файл
-            import shutil
-            shutil.copy2(temp_filepath, file_path)
-            app.logger.info(f"Файл {file_index} успешно скопирован в {file_path}")
+            file_path = os.path.join(uploads_folder, filename)
             
-            # Удаляем временный файл
-            os.remove(temp_filepath)
-            app.logger.info(f"Временный файл удален: {temp_filepath}")
+            # Содержимое хранится один раз по хешу, итоговый путь - жесткая ссылка на него
+            store_file_by_hash(temp_filepath, file_path, file_hash, app.config['UPLOAD_CAS_FOLDER'])
+            app.logger.info(f"Файл {file_index} успешно перемещен в {file_path}")
             
             # Создаем запись страницы в БД
             page = BookPage(
                 book_id=book_id,
                 page_number=file_index + 1,  # Страница начиная с 1
                 image_path=file_path,
+                content_hash=file_hash,
                 status='pending'
             )
             db.session.add(page)
             
-            # Если у нас есть хеш файла, проверяем, существует ли он уже
+            # Сохраняем хеш файла; если он уже существует, обновляем связи (одним INSERT ... ON CONFLICT)
             if file_hash:
-                existing_hash = FileHash.query.filter_by(file_hash=file_hash).first()
-                
-                if not existing_hash:
-                    # Хеш не существует, добавляем новую запись
-                    file_hash_record = FileHash(
-                        file_hash=file_hash,
-                        original_filename=safe_filename,
-                        content_type='image',
-                        book_id=book_id,
-                        page_id=page.id if page.id else None
-                    )
-                    db.session.add(file_hash_record)
-                else:
-                    # Хеш уже существует, обновляем связи
-                    existing_hash.book_id = book_id
-                    existing_hash.page_id = page.id if page.id else existing_hash.page_id
-                    
-                    app.logger.info(f"Найден существующий хеш файла, обновляем связи: {file_hash[:10]}...")
+                db.session.flush()  # Получаем page.id для связи с хешем
+                insert_file_hashes([{
+                    'file_hash': file_hash,
+                    'original_filename': safe_filename,
+                    'content_type': 'image',
+                    'book_id': book_id,
+                    'page_id': page.id
+                }], update_links=True)
             
             db.session.commit()
+            page_saved = True
             
             # Если это последний файл, запускаем обработку
             if is_last_file or file_index == total_files - 1:
@@ -143,8 +126,11 @@ def upload_chunk():
                 
                 db.session.commit()
                 
-                # Запускаем обработку в отдельном потоке
-                threading.Thread(target=process_book, args=(book_id, job.id, False)).start()
+                invalidate_book_status(book_id)
+                
+                # Ставим обработку в общий пул фоновых задач
+                future = app.job_executor.submit(process_book, book_id, job.id, False)
+                future.add_done_callback(log_job_failure)
                 
                 return jsonify({
                     'success': True, 
@@ -165,6 +151,10 @@ def upload_chunk():
                 
         except Exception as e:
             app.logger.error(f"Ошибка при обработке файла: {str(e)}")
+            if file_path and not page_saved:
+                # Страница не записана в БД - удаляем файл и освобождаем содержимое в хранилище
+                db.session.rollback()
+                discard_stored_uploads([(file_path, file_hash)])
             return jsonify({'success': False, 'error': str(e)}), 500
             
     except Exception as e:
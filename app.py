@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -28,18 +29,39 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 
 # Configure upload settings
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
+ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'pdf'})
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Временные файлы загрузок держим внутри uploads, чтобы перенос в итоговый путь был rename без копирования
+app.config['UPLOAD_TEMP_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'tmp')
+# Хранилище содержимого по хешу: uploads/cas/<hash[:2]>/<hash>, файлы страниц - жесткие ссылки на него
+app.config['UPLOAD_CAS_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'cas')
 app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload (увеличен для массовой загрузки файлов)
 
 # Увеличиваем максимальное количество файлов и размер запроса для Werkzeug
 app.config['MAX_CONTENT_PATH'] = 1024 * 1024 * 1024  # 1GB для путей
 app.config['MAX_FORM_MEMORY_SIZE'] = 500 * 1024 * 1024  # 500MB для форм
+app.config['UPLOAD_CHUNK_SIZE'] = 1 << 20  # 1MB блоки при сохранении больших загрузок (PDF)
 
-# Ensure upload folder exists
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Отдача файлов фронтенд-сервером через X-Sendfile (sendfile(2) без копирования через Python).
+# Для nginx дополнительно задайте XACCEL_REDIRECT_PREFIX - internal location, указывающий на корень проекта
+app.config["USE_X_SENDFILE"] = bool(os.environ.get("USE_XSENDFILE"))
+app.config['XACCEL_REDIRECT_PREFIX'] = os.environ.get("XACCEL_REDIRECT_PREFIX")
+# /images/ и /output/ отдает nginx (alias); в приложение попадают только отсутствующие файлы
+app.config['NGINX_STATIC'] = bool(os.environ.get("NGINX_STATIC"))
+# Отладка: при отсутствии готового PDF отдавать сгенерированный файл-заменитель
+app.config['DEBUG_FAKE_PDFS'] = bool(os.environ.get("DEBUG_FAKE_PDFS"))
+
+# Общий ограниченный пул для фоновой обработки книг (вместо отдельного потока на каждую загрузку)
+PROCESSING_WORKERS = int(os.environ.get("PROCESSING_WORKERS", os.cpu_count() or 2))
+app.job_executor = ThreadPoolExecutor(max_workers=PROCESSING_WORKERS, thread_name_prefix="book-processing")
+# Отдельный поток для удаления файлов книг, чтобы очистка не ждала в очереди за обработкой
+app.cleanup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-cleanup")
+
+# Ensure upload folder exists (once at startup, upload handlers rely on it)
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(app.config['UPLOAD_TEMP_FOLDER'], exist_ok=True)
+os.makedirs(app.config['UPLOAD_CAS_FOLDER'], exist_ok=True)
 
 # Initialize the database with the app
 db.init_app(app)
@@ -55,4 +77,30 @@ from api_routes import *
 
 # Create database tables
 with app.app_context():
-    db.create_all()
\ No newline at end of file
+    db.create_all()
+    
+    # db.create_all() не добавляет новые колонки в существующие таблицы,
+    # поэтому для старых баз добавляем book.is_pdf вручную и заполняем по первой странице
+    try:
+        book_columns = {column['name'] for column in db.inspect(db.engine).get_columns('book')}
+        if 'is_pdf' not in book_columns:
+            with db.engine.begin() as connection:
+                connection.execute(db.text("ALTER TABLE book ADD COLUMN is_pdf BOOLEAN DEFAULT FALSE"))
+                connection.execute(db.text(
+                    "UPDATE book SET is_pdf = TRUE WHERE id IN "
+                    "(SELECT book_id FROM book_page WHERE LOWER(image_path) LIKE '%.pdf')"
+                ))
+            app.logger.info("Добавлена колонка book.is_pdf")
+        
+        # book_page.content_hash: у страниц старых баз остается NULL, их содержимое
+        # при удалении книги освобождается по строкам FileHash
+        page_columns = {column['name'] for column in db.inspect(db.engine).get_columns('book_page')}
+        if 'content_hash' not in page_columns:
+            with db.engine.begin() as connection:
+                connection.execute(db.text("ALTER TABLE book_page ADD COLUMN content_hash VARCHAR(64)"))
+                connection.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_book_page_content_hash ON book_page (content_hash)"
+                ))
+            app.logger.info("Добавлена колонка book_page.content_hash")
+    except Exception as e:
+        app.logger.error(f"Ошибка при обновлении схемы базы данных: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+One-time backfill of FileHash rows for books uploaded before content hashing.
+
+PDF duplicate detection relies only on the FileHash table, so books that were
+uploaded earlier (with the old filename+size hash or without any hash) are
+hashed by content here and recorded once.
+"""
+
+import os
+import logging
+import argparse
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Import app components
+from app import app, db
+from models import Book, BookPage, FileHash
+from utils import compute_file_content_hash, compute_image_hash
+
+# Длина hex-строки старого упрощенного MD5-хеша "имя_размер" для PDF
+LEGACY_PDF_HASH_LENGTH = 32
+
+def backfill_file_hashes(dry_run=False):
+    """
+    Insert missing FileHash rows for existing book files.
+    
+    Args:
+        dry_run: Only report what would be inserted
+        
+    Returns:
+        int: Number of inserted hashes
+    """
+    inserted = 0
+    
+    # Старые PDF-хеши не описывают содержимое файла и больше никогда не совпадут
+    legacy_rows = FileHash.query.filter(
+        FileHash.content_type == 'pdf',
+        db.func.length(FileHash.file_hash) == LEGACY_PDF_HASH_LENGTH
+    ).all()
+    logger.info(f"Found {len(legacy_rows)} legacy PDF hashes to replace")
+    if not dry_run:
+        for row in legacy_rows:
+            db.session.delete(row)
+        db.session.flush()
+    
+    known_hashes = {h for (h,) in db.session.query(FileHash.file_hash).all()}
+    hashed_pages = {p for (p,) in db.session.query(FileHash.page_id).filter(FileHash.page_id.isnot(None)).all()}
+    hashed_pdf_books = {
+        b for (b,) in db.session.query(FileHash.book_id).filter(FileHash.content_type == 'pdf').all()
+    }
+    
+    rows = (db.session.query(BookPage.id, BookPage.book_id, BookPage.image_path, Book.is_pdf)
+            .join(Book, Book.id == BookPage.book_id)
+            .order_by(BookPage.book_id, BookPage.page_number)
+            .all())
+    
+    for page_id, book_id, image_path, is_pdf in rows:
+        if page_id in hashed_pages or (is_pdf and book_id in hashed_pdf_books):
+            continue
+        if not image_path or not os.path.exists(image_path):
+            continue
+        
+        if is_pdf:
+            file_hash = compute_file_content_hash(image_path)
+            content_type = 'pdf'
+        else:
+            file_hash = compute_image_hash(image_path)
+            content_type = 'image'
+        
+        if not file_hash or file_hash in known_hashes:
+            continue
+        
+        logger.info(f"Book {book_id}: recording {content_type} hash {file_hash[:10]}... for {image_path}")
+        if not dry_run:
+            db.session.add(FileHash(
+                file_hash=file_hash,
+                original_filename=os.path.basename(image_path),
+                content_type=content_type,
+                book_id=book_id,
+                page_id=page_id
+            ))
+        known_hashes.add(file_hash)
+        if is_pdf:
+            hashed_pdf_books.add(book_id)
+        inserted += 1
+    
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    
+    logger.info(f"Backfill complete. {'Would insert' if dry_run else 'Inserted'} {inserted} hashes.")
+    return inserted
+
+def create_argparser():
+    """Create argument parser for command line options."""
+    parser = argparse.ArgumentParser(description="Backfill FileHash rows for previously uploaded books")
+    parser.add_argument("--dry-run", action="store_true", help="Only report missing hashes without writing")
+    return parser
+
+if __name__ == "__main__":
+    parser = create_argparser()
+    args = parser.parse_args()
+    
+    with app.app_context():
+        backfill_file_hashes(args.dry_run)
@@ -44,7 +44,8 @@ def get_files_to_process(input_dir, extensions=None):
 def create_book_entry(filename, session):
     """Create a new book entry in the database."""
     title = os.path.basename(filename)
-    book = Book(title=title, description=f"Batch processed on {datetime.now()}")
+    book = Book(title=title, description=f"Batch processed on {datetime.now()}",
+                is_pdf=filename.lower().endswith('.pdf'))
     session.add(book)
     session.commit()
     
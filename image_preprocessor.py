@@ -39,8 +39,9 @@ class ImagePreprocessor:
                 scale_factor = 1000 / width
                 img = cv2.resize(img, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
             
-            # Copy original for later use
-            original_resized = img.copy()
+            # Original for later use. Копия не нужна: дальше img не изменяется
+            # (cvtColor и фильтры возвращают новые массивы)
+            original_resized = img
             
             # Convert to grayscale
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
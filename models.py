@@ -8,7 +8,11 @@ class Book(db.Model):
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(50), default='new')  # new, processing, completed, error
-    pages = db.relationship('BookPage', backref='book', lazy=True, cascade='all, delete-orphan')
+    is_pdf = db.Column(db.Boolean, default=False)  # Книга загружена одним PDF-файлом
+    pages = db.relationship('BookPage', backref='book', lazy=True, cascade='all, delete-orphan',
+                            order_by='BookPage.page_number')
+    jobs = db.relationship('ProcessingJob', backref='book', lazy=True, cascade='all, delete-orphan',
+                           order_by='ProcessingJob.created_at.desc()')  # Последняя задача первой
     
     def __repr__(self):
         return f'<Book {self.title}>'
@@ -20,6 +24,7 @@ class Book(db.Model):
             'description': self.description,
             'created_at': self.created_at.isoformat(),
             'status': self.status,
+            'is_pdf': bool(self.is_pdf),
             'page_count': len(self.pages)
         }
 
@@ -29,6 +34,9 @@ class BookPage(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     page_number = db.Column(db.Integer, nullable=True)
     image_path = db.Column(db.String(255), nullable=False)
+    # Хеш содержимого файла страницы (ключ в хранилище по хешам): по нему при удалении книги
+    # освобождается содержимое, даже если строка FileHash принадлежит другой книге
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
     processed_image_path = db.Column(db.String(255), nullable=True)
     text_content = db.Column(db.Text, nullable=True)
     translated_content = db.Column(db.Text, nullable=True)
@@ -92,7 +100,7 @@ class Figure(db.Model):
 class FileHash(db.Model):
     """Model for storing file hashes to detect duplicates"""
     id = db.Column(db.Integer, primary_key=True)
-    file_hash = db.Column(db.String(64), nullable=False, unique=True)  # MD5 hash
+    file_hash = db.Column(db.String(64), nullable=False, unique=True)  # Content hash (hex)
     original_filename = db.Column(db.String(255), nullable=True)
     content_type = db.Column(db.String(50), nullable=True)  # image, pdf, etc.
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=True)
@@ -100,4 +108,51 @@ class FileHash(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<FileHash {self.file_hash[:8]}>'
\ No newline at end of file
+        return f'<FileHash {self.file_hash[:8]}>'
+
+def insert_file_hashes(rows, update_links=False):
+    """
+    Insert FileHash rows in a single statement, resolving duplicates in the database.
+    
+    Uses INSERT ... ON CONFLICT (file_hash) on SQLite/PostgreSQL, so concurrent
+    uploads of the same file cannot race between a SELECT and an INSERT.
+    
+    Args:
+        rows (list): Dicts with FileHash column values
+        update_links (bool): Re-point book_id/page_id of an existing hash to the new row
+                             instead of leaving it untouched
+    """
+    if not rows:
+        return
+    
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+    
+    now = datetime.utcnow()
+    rows = [dict(row, created_at=row.get('created_at') or now) for row in rows]
+    
+    if insert is not None:
+        stmt = insert(FileHash).values(rows)
+        if update_links:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['file_hash'],
+                set_={'book_id': stmt.excluded.book_id, 'page_id': stmt.excluded.page_id}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=['file_hash'])
+        db.session.execute(stmt)
+        return
+    
+    # Другие СУБД: проверка и вставка по одной строке
+    for row in rows:
+        existing = FileHash.query.filter_by(file_hash=row['file_hash']).first()
+        if not existing:
+            db.session.add(FileHash(**row))
+        elif update_links:
+            existing.book_id = row.get('book_id')
+            existing.page_id = row.get('page_id') or existing.page_id
\ No newline at end of file
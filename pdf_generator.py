@@ -11,6 +11,7 @@ import cv2
 from PIL import Image
 import numpy as np
 import unicodedata
+from datetime import datetime
 # Import text sanitization functions
 from text_sanitizer import sanitize_text_for_pdf, aggressive_text_cleanup
 
@@ -23,10 +24,35 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
+from reportlab.pdfgen import canvas
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def make_test_pdf(output_path, book_id, language):
+    """
+    Create a placeholder PDF used for debugging downloads when the real file is missing.
+    
+    Args:
+        output_path (str): Path of the PDF to create
+        book_id (int): Book ID printed on the page
+        language (str): Language code printed on the page
+        
+    Returns:
+        str: Path to the created PDF
+    """
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    
+    c = canvas.Canvas(output_path)
+    c.setFont("Helvetica", 12)
+    c.drawString(100, 750, f"Тестовый PDF для книги ID: {book_id}")
+    c.drawString(100, 730, f"Язык: {language}")
+    c.drawString(100, 710, f"Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    c.drawString(100, 690, "Настоящий файл не найден, это временный заменитель.")
+    c.save()
+    
+    return output_path
+
 class PDFGenerator:
     """Handles generation of PDF files from processed content."""
     
@@ -1,16 +1,22 @@
 import os
+import re
 import json
 import logging
-import threading
+import shutil
+import time
 import traceback
-import cv2
-import pytesseract
-from flask import render_template, request, redirect, url_for, flash, send_file, jsonify, session
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import render_template, request, redirect, url_for, flash, send_file, session, Response
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import FileWrapper
 from app import app, db
-from models import Book, BookPage, ProcessingJob, Figure, FileHash
+from models import Book, BookPage, ProcessingJob, Figure, FileHash, insert_file_hashes
 from datetime import datetime
 from processing_service import process_book
+from pdf_generator import make_test_pdf
+from utils import (compute_image_hash, new_content_hasher, store_file_by_hash, release_stored_file,
+                   content_store_path)
 
 # Подключаем специализированные логгеры
 try:
@@ -23,18 +29,311 @@ except ImportError:
     pdf_logger = logging.getLogger('pdf_operations')
     app_logger = logging.getLogger('app')
 
+# orjson сериализует словари и datetime на C; без него используем стандартный json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Add context processor to provide current date/time to all templates
 @app.context_processor
 def inject_now():
     return {'now': datetime.utcnow()}
 
+def json_bytes(data):
+    """
+    Сериализует данные в JSON (datetime - в формате ISO 8601)
+    
+    Args:
+        data (dict): Данные для сериализации
+        
+    Returns:
+        bytes: JSON в UTF-8
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(data)
+    return json.dumps(data, default=datetime.isoformat).encode('utf-8')
+
+# Размер блока при отдаче файлов встроенным FileWrapper Werkzeug (по умолчанию 8 KiB)
+SEND_FILE_BUFFER_SIZE = 1 << 20
+
+@app.after_request
+def enlarge_file_buffer(response):
+    """
+    Увеличивает блок чтения при потоковой отдаче файлов через FileWrapper Werkzeug:
+    меньше системных вызовов read/write на один PDF. Обертки сервера (wsgi.file_wrapper
+    gunicorn, использующий sendfile) не трогаем
+    """
+    if type(response.response) is FileWrapper and response.response.buffer_size < SEND_FILE_BUFFER_SIZE:
+        response.response.buffer_size = SEND_FILE_BUFFER_SIZE
+    return response
+
+@app.after_request
+def rewrite_x_sendfile(response):
+    """
+    Для nginx заменяет X-Sendfile (Apache/lighttpd) на X-Accel-Redirect с внутренним location,
+    чтобы файл отдавался фронтенд-сервером через sendfile(2), минуя Python
+    """
+    prefix = app.config.get('XACCEL_REDIRECT_PREFIX')
+    if prefix and 'X-Sendfile' in response.headers:
+        file_path = response.headers.pop('X-Sendfile')
+        relative_path = os.path.relpath(file_path, app.root_path).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{relative_path}"
+    return response
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    dot = filename.rfind('.')
+    return dot != -1 and filename[dot + 1:].lower() in app.config['ALLOWED_EXTENSIONS']
+
+# Скомпилированный один раз запрос: возвращает только строки хешей, без создания ORM-объектов FileHash
+EXISTING_HASHES_STMT = db.text(
+    "SELECT file_hash FROM file_hash WHERE file_hash IN :hashes"
+).bindparams(db.bindparam('hashes', expanding=True))
+
+def find_existing_hashes(hashes):
+    """
+    Находит, какие из хешей уже есть в таблице FileHash, одним запросом
+    
+    Args:
+        hashes: Итерируемый набор строк хешей
+        
+    Returns:
+        set: Хеши, уже сохраненные в базе данных
+    """
+    hashes = list(set(hashes))
+    if not hashes:
+        return set()
+    try:
+        return {row[0] for row in db.session.execute(EXISTING_HASHES_STMT, {'hashes': hashes})}
+    except Exception as e:
+        app.logger.error(f"Ошибка при проверке хешей в БД: {str(e)}")
+        return set()
+
+# Количество потоков для параллельного сохранения и хеширования файлов одной загрузки
+UPLOAD_HASH_WORKERS = 4
+
+def save_and_hash_upload(item):
+    """
+    Сохраняет загруженное изображение во временную папку и вычисляет его хеш
+    
+    Args:
+        item (tuple): (порядковый номер файла, FileStorage)
+        
+    Returns:
+        tuple: (idx, безопасное имя файла, путь к временному файлу, хеш или None)
+    """
+    idx, file = item
+    # Secure filename and save file to a temporary location for checking
+    temp_filename = secure_filename(file.filename)
+    temp_filepath = os.path.join(app.config['UPLOAD_TEMP_FOLDER'], f"{uuid.uuid4().hex}_{temp_filename}")
+    file.save(temp_filepath)
+    
+    # OCR на этапе загрузки не выполняется: текст извлекается в фоновой обработке (process_book)
+    file_hash = compute_image_hash(temp_filepath)
+    if file_hash:
+        app.logger.info(f"Вычислен хеш файла {temp_filename}: {file_hash[:10]}...")
+    else:
+        app.logger.info(f"Не удалось вычислить хеш файла {temp_filename}")
+    return idx, temp_filename, temp_filepath, file_hash
+
+def stat_or_none(path):
+    """
+    Возвращает os.stat для пути или None, если файл недоступен
+    
+    Args:
+        path (str): Путь к файлу
+        
+    Returns:
+        os.stat_result или None
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+# Кратковременный кеш результатов stat для GET-запросов к файлам (в т.ч. отрицательных):
+# галерея страниц запрашивает одни и те же пути много раз подряд
+PATH_STAT_CACHE_TTL = 1.0  # секунды
+PATH_STAT_CACHE_SIZE = 4096
+_path_stat_cache = {}
+
+def cached_stat(path):
+    """
+    То же, что stat_or_none, но с кешированием результата на PATH_STAT_CACHE_TTL секунд.
+    Использовать только на путях чтения; после записи/удаления файлов вызывать invalidate_path_cache
+    
+    Args:
+        path (str): Путь к файлу
+        
+    Returns:
+        os.stat_result или None
+    """
+    now = time.monotonic()
+    cached = _path_stat_cache.get(path)
+    if cached is not None and now - cached[0] < PATH_STAT_CACHE_TTL:
+        return cached[1]
+    
+    st = stat_or_none(path)
+    if len(_path_stat_cache) >= PATH_STAT_CACHE_SIZE:
+        _path_stat_cache.clear()
+    _path_stat_cache[path] = (now, st)
+    return st
+
+def invalidate_path_cache(path=None):
+    """
+    Сбрасывает кеш stat для одного пути или целиком
+    
+    Args:
+        path (str): Путь к файлу или None для полного сброса
+    """
+    if path is None:
+        _path_stat_cache.clear()
+    else:
+        _path_stat_cache.pop(path, None)
+
+# Шаблоны имен готовых PDF по языку для поиска в каталоге книги
+PDF_LANGUAGE_PATTERNS = {
+    'en': re.compile(r'_en\.pdf$', re.IGNORECASE),
+    'ru': re.compile(r'_ru\.pdf$', re.IGNORECASE),
+}
+
+# Кратковременный кеш ответов book_status: страница книги опрашивает статус каждые несколько
+# секунд, и запросы из нескольких вкладок обслуживаются без обращения к базе
+BOOK_STATUS_CACHE_TTL = 2.0  # секунды
+BOOK_STATUS_CACHE_SIZE = 1024  # книг
+_book_status_cache = {}
+
+def invalidate_book_status(book_id=None):
+    """
+    Сбрасывает кешированный статус книги (или всех книг)
+    
+    Args:
+        book_id (int): ID книги или None для полного сброса
+    """
+    if book_id is None:
+        _book_status_cache.clear()
+    else:
+        _book_status_cache.pop(book_id, None)
+
+def remove_file_if_exists(path):
+    """
+    Удаляет файл без отдельной проверки существования (один системный вызов вместо двух)
+    
+    Args:
+        path (str): Путь к файлу
+        
+    Returns:
+        bool: True, если файл был удален
+    """
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def log_job_failure(future):
+    """
+    Логирует исключение, вышедшее из фоновой обработки книги: без обратного вызова оно
+    остается в отброшенном Future и нигде не появляется
+    
+    Args:
+        future (Future): Future задачи из app.job_executor
+    """
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Фоновая обработка книги завершилась с ошибкой: {str(error)}",
+                     exc_info=(type(error), error, error.__traceback__))
+
+def stored_source_path(temp_filepath, file_hash):
+    """
+    Возвращает файл с содержимым загрузки: временный файл, а если store_file_by_hash
+    уже перенес его в хранилище - файл хранилища
+    
+    Args:
+        temp_filepath (str): Временный файл загрузки
+        file_hash (str): Хеш содержимого или None
+        
+    Returns:
+        str: Путь к существующему файлу с содержимым (или temp_filepath, если его нет нигде)
+    """
+    if file_hash and not os.path.exists(temp_filepath):
+        return content_store_path(app.config['UPLOAD_CAS_FOLDER'], file_hash)
+    return temp_filepath
+
+def discard_stored_uploads(stored_uploads):
+    """
+    Удаляет файлы загрузки, страницы которой не удалось записать в БД, и освобождает
+    их содержимое в хранилище по хешам
+    
+    Args:
+        stored_uploads (list): Пары (итоговый путь, хеш содержимого или None)
+    """
+    for file_path, file_hash in stored_uploads:
+        remove_file_if_exists(file_path)
+    for file_hash in {file_hash for _, file_hash in stored_uploads if file_hash}:
+        release_stored_file(file_hash, app.config['UPLOAD_CAS_FOLDER'])
+
+def cleanup_book_files(file_paths, file_hashes, output_dir, store_dir):
+    """
+    Удаляет файлы уже удаленной из базы книги; выполняется в фоне через app.cleanup_executor
+    
+    Args:
+        file_paths (list): Пути к файлам вне выходной директории книги
+        file_hashes (list): Хеши содержимого, которые нужно освободить в хранилище
+        output_dir (str): Выходная директория книги (удаляется целиком)
+        store_dir (str): Каталог хранилища по хешам
+    """
+    try:
+        for path in file_paths:
+            remove_file_if_exists(path)
+        
+        # Освобождаем содержимое в хранилище, если на него больше не ссылается ни один файл
+        for file_hash in file_hashes:
+            release_stored_file(file_hash, store_dir)
+        
+        # Delete output directory (one walk for all files inside it)
+        shutil.rmtree(output_dir, ignore_errors=True)
+    except Exception as e:
+        logger.error(f"Error cleaning up files in {output_dir}: {str(e)}")
+    finally:
+        invalidate_path_cache()
+
+def save_upload_stream(storage, dest_path, chunk_size=None, hasher=None):
+    """
+    Сохраняет загруженный файл крупными блоками вместо стандартных 16 KiB Werkzeug
+    
+    Args:
+        storage: FileStorage из request.files
+        dest_path (str): Путь для сохранения файла
+        chunk_size (int): Размер блока чтения/записи в байтах
+        hasher: Объект хеша (update/hexdigest), который обновляется в том же проходе
+        
+    Returns:
+        int: Количество записанных байт
+    """
+    chunk_size = chunk_size or app.config['UPLOAD_CHUNK_SIZE']
+    with open(dest_path, 'wb', buffering=chunk_size) as out:
+        # Подсказываем ядру, что запись будет последовательной (только POSIX)
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(out.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        if hasher is None:
+            shutil.copyfileobj(storage.stream, out, length=chunk_size)
+        else:
+            # Хешируем и записываем за один проход по данным
+            for chunk in iter(lambda: storage.stream.read(chunk_size), b''):
+                hasher.update(chunk)
+                out.write(chunk)
+        return out.tell()
 
 @app.route('/')
 def index():
@@ -72,7 +371,7 @@ def upload_book():
             app.logger.info(f"Форма получена: translate_to_russian={translate_to_russian}, figures_only_mode={figures_only_mode}")
             
             # Create new book record
-            new_book = Book(title=book_title, description=description)
+            new_book = Book(title=book_title, description=description, is_pdf=(file_type == 'pdf'))
             db.session.add(new_book)
             db.session.commit()
             
@@ -93,164 +392,48 @@ def upload_book():
                     flash('Не выбрано ни одного файла', 'error')
                     return redirect(request.url)
             
-            # Import necessary modules for duplicate detection
-            from text_extractor import TextExtractor
-            from utils import is_text_duplicate, compute_image_hash
+                # Keep track of skipped duplicates
+                duplicate_count = 0
             
-            # Collect existing page texts from the database for this book
-            existing_texts = []
+                # Строки для пакетной вставки страниц и хешей после цикла
+                page_rows = []
+                hash_rows_by_path = {}
+                # (итоговый путь, хеш) сохраненных файлов - для очистки, если запись в БД не удалась
+                stored_uploads = []
             
-            # Keep track of skipped duplicates
-            duplicate_count = 0
+                # Первый проход: сохраняем файлы во временную папку и считаем их хеши.
+                # Файлы независимы, поэтому обрабатываем их небольшим пулом потоков
+                # (запись на диск и хеширование отпускают GIL)
+                upload_items = [(idx, file) for idx, file in enumerate(files) if file and allowed_file(file.filename)]
+                saved_uploads = []
+                if upload_items:
+                    with ThreadPoolExecutor(max_workers=min(UPLOAD_HASH_WORKERS, len(upload_items))) as executor:
+                        saved_uploads = list(executor.map(save_and_hash_upload, upload_items))
             
-            # Process each file
-            for idx, file in enumerate(files):
-                if file and allowed_file(file.filename):
-                    # Secure filename and save file to a temporary location for checking
-                    temp_filename = secure_filename(file.filename)
-                    temp_filepath = os.path.join('/tmp', temp_filename)
-                    file.save(temp_filepath)
-                    
-                    # Сначала проверяем дубликаты по хешу файла, что быстрее и надежнее
-                    try:
-                        app.logger.info(f"Проверка дубликатов для файла: {temp_filename}")
-                        # Временно отключаем проверку дубликатов, чтобы решить проблему с загрузкой
-                        is_duplicate = False
-                        similarity = 0.0
-                        duplicate_file = None
-                        file_hash = compute_image_hash(temp_filepath)
-                        
-                        # Логируем хеш для отладки
-                        if file_hash:
-                            app.logger.info(f"Вычислен хеш файла: {file_hash[:10]}...")
-                        else:
-                            app.logger.info("Не удалось вычислить хеш файла")
-                        
-                        # Проверяем, есть ли уже такой хеш в базе данных
-                        try:
-                            if file_hash:
-                                # Ищем хеш в базе данных
-                                existing_file_hash = FileHash.query.filter_by(file_hash=file_hash).first()
-                                
-                                if existing_file_hash and False:  # Временно отключаем, чтобы все файлы добавлялись
-                                    is_duplicate = True
-                                    similarity = 1.0
-                                    duplicate_file = existing_file_hash
-                                    app.logger.info(f"Обнаружен дубликат по хешу файла: {temp_filename}")
-                                    app.logger.info(f"Оригинальный файл: {existing_file_hash.original_filename}")
-                                else:
-                                    app.logger.info(f"Уникальный файл, добавляем: {temp_filename}")
-                            
-                        except Exception as e:
-                            app.logger.error(f"Ошибка при проверке хеша в БД: {str(e)}")
-                            is_duplicate = False
-                            similarity = 0.0
-                        
-                        # Если не нашли дубликат по хешу, пробуем через OCR
-                        if not is_duplicate:
-                            try:
-                                # Запускаем OCR для проверки дубликатов
-                                app.logger.info(f"Выполняем OCR для файла: {temp_filename}")
-                                try:
-                                    from text_extractor import TextExtractor
-                                    text_extractor = TextExtractor()
-                                    # Проверяем, существует ли файл перед обработкой
-                                    if os.path.exists(temp_filepath):
-                                        app.logger.info(f"Файл существует: {temp_filepath}, размер: {os.path.getsize(temp_filepath)} байт")
-                                        # Используем более надежный и простой метод извлечения текста
-                                        image = cv2.imread(temp_filepath)
-                                        if image is not None:
-                                            # Конвертируем в оттенки серого
-                                            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                                            # ОТКЛЮЧАЕМ OCR на этапе загрузки для предотвращения таймаутов
-                                            page_text = "OCR будет выполнен при обработке"  # Значение по умолчанию
-                                            app.logger.info("OCR пропущен на этапе загрузки для предотвращения таймаутов")
-                                            
-                                            # Проверяем результат - просто записываем в лог информацию об изображении
-                                            app.logger.info(f"Изображение загружено: {os.path.basename(temp_filepath)}")
-                                        else:
-                                            app.logger.error(f"Не удалось прочитать изображение: {temp_filepath}")
-                                            page_text = "OCR не удалось (ошибка чтения изображения)"
-                                    else:
-                                        app.logger.error(f"Файл не найден: {temp_filepath}")
-                                        page_text = "OCR не удалось (файл не найден)"
-                                except Exception as ocr_error:
-                                    app.logger.error(f"Ошибка при выполнении OCR: {str(ocr_error)}")
-                                    # Записываем полный стек трейс для отладки
-                                    app.logger.error(f"Traceback: {traceback.format_exc()}")
-                                    page_text = "OCR текст недоступен из-за ошибки"
-                                
-                                # Отключаем проверку дубликатов по тексту
-                                is_duplicate = False
-                                similar_text = None
-                                similarity = 0.0
-                                
-                                # Закомментировано для отладки
-                                # # Check if this image is a duplicate based on text content
-                                # is_duplicate, similar_text, similarity = is_text_duplicate(
-                                #     page_text, existing_texts, threshold=0.80  # 80% similarity threshold
-                                # )
-                                
-                                # Если это новый файл, сохраняем его хеш в БД для будущих проверок
-                                if not is_duplicate and file_hash:
-                                    try:
-                                        # Проверяем, нет ли уже такого хеша
-                                        existing_hash = FileHash.query.filter_by(file_hash=file_hash).first()
-                                        
-                                        if not existing_hash:
-                                            # Сохраняем новый хеш в БД с отложенным связыванием c book_id и page_id
-                                            # Они будут связаны после успешного создания страницы
-                                            new_file_hash = FileHash(
-                                                file_hash=file_hash,
-                                                original_filename=temp_filename,
-                                                content_type='image'
-                                            )
-                                            db.session.add(new_file_hash)
-                                            # Откладываем commit до создания страницы
-                                            # db.session.commit()
-                                            app.logger.info(f"Добавлен новый хеш в базу для файла: {temp_filename}")
-                                    except Exception as e:
-                                        app.logger.error(f"Ошибка при сохранении хеша в БД: {str(e)}")
-                                    
-                            except Exception as e:
-                                app.logger.error(f"Ошибка при проверке текстовых дубликатов: {str(e)}")
-                                page_text = ""
-                                is_duplicate = False
-                                similarity = 0.0
-                        else:
-                            # Если дубликат найден по хешу, OCR не нужен
-                            page_text = ""
-                                
-                    except Exception as e:
-                        app.logger.error(f"Ошибка при проверке дубликатов по хешу: {str(e)}")
-                        page_text = ""
-                        is_duplicate = False
-                        similarity = 0.0
-                        
-                        # Пробуем запасной вариант через OCR из-за проблем с tesseract
-                        try:
-                            app.logger.info(f"Используем запасной вариант OCR для файла: {temp_filename}")
-                            
-                            # Проверяем, существует ли файл перед обработкой
-                            if os.path.exists(temp_filepath):
-                                app.logger.info(f"Файл существует для запасного OCR: {temp_filepath}, размер: {os.path.getsize(temp_filepath)} байт")
-                                
-                                # Полностью отключаем OCR на этапе загрузки
-                                page_text = "OCR отключен на этапе загрузки"
-                                app.logger.info(f"Запасной OCR также отключен для предотвращения таймаутов")
-                            else:
-                                app.logger.error(f"Файл не найден для запасного OCR: {temp_filepath}")
-                                page_text = "Файл не найден для OCR"
-                                
-                            is_duplicate = False  # Принудительно считаем уникальным
-                            similar_text = None
-                            similarity = 0.0
-                        except Exception as e2:
-                            app.logger.error(f"Ошибка при запасном OCR: {str(e2)}")
-                            app.logger.error(f"Traceback: {traceback.format_exc()}")
-                            page_text = "OCR текст недоступен из-за ошибки"
-                            # Оставляем значения по умолчанию
-                    
+                # Дубликаты проверяем только по хешу файла - одним запросом для всех файлов загрузки
+                known_hashes = find_existing_hashes(file_hash for _, _, _, file_hash in saved_uploads if file_hash)
+            
+                # Второй проход: переносим файлы в итоговые пути и готовим строки для БД
+                for idx, temp_filename, temp_filepath, file_hash in saved_uploads:
+                    new_hash_row = None
+                    is_duplicate = False
+                    similarity = 0.0
+                
+                    if file_hash and file_hash in known_hashes and False:  # Временно отключаем, чтобы все файлы добавлялись
+                        is_duplicate = True
+                        similarity = 1.0
+                        app.logger.info(f"Обнаружен дубликат по хешу файла: {temp_filename}")
+                    elif file_hash and file_hash not in known_hashes:
+                        # Сохраняем новый хеш с отложенным связыванием c book_id и page_id
+                        # Они будут связаны после пакетной вставки страниц
+                        new_hash_row = {
+                            'file_hash': file_hash,
+                            'original_filename': temp_filename,
+                            'content_type': 'image'
+                        }
+                        known_hashes.add(file_hash)
+                        app.logger.info(f"Уникальный файл, добавляем хеш: {temp_filename}")
+                
                     if is_duplicate:
                         # This is a duplicate, skip it
                         app.logger.info(f"Skipping duplicate image: {temp_filename} (similarity: {similarity:.2f})")
@@ -258,291 +441,264 @@ def upload_book():
                         # Clean up temp file
                         os.remove(temp_filepath)
                         continue
-                    
+                
                     # Not a duplicate, save permanently
-                    filename = f"{new_book.id}_{idx}_{secure_filename(file.filename)}"
+                    filename = f"{new_book.id}_{idx}_{temp_filename}"
                     file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    # Проверяем директорию uploads и создаем, если она отсутствует
+                    # Директория uploads создается один раз при старте приложения
                     uploads_folder = app.config['UPLOAD_FOLDER']
-                    if not os.path.exists(uploads_folder):
-                        os.makedirs(uploads_folder, exist_ok=True)
-                        app.logger.info(f"Создана директория для загрузок: {uploads_folder}")
-                    
+                
                     # Улучшенная обработка копирования файла с проверками
                     try:
-                        import shutil
-                        # Обеспечиваем безопасное имя файла и не слишком длинный путь
-                        safe_filename = secure_filename(file.filename)
+                        # Безопасное имя уже вычислено выше, ограничиваем длину пути
+                        safe_filename = temp_filename
                         if len(safe_filename) > 50:  # Ограничиваем длину имени файла
                             extension = safe_filename.rsplit('.', 1)[1] if '.' in safe_filename else ''
                             safe_filename = safe_filename[:40] + '.' + extension if extension else safe_filename[:50]
-                        
+                    
                         # Формируем окончательный путь к файлу
                         filename = f"{new_book.id}_{idx}_{safe_filename}"
                         file_path = os.path.join(uploads_folder, filename)
-                        
-                        # Копируем файл
-                        shutil.copy2(temp_filepath, file_path)
-                        app.logger.info(f"Файл успешно скопирован в {file_path}")
-                        
+                    
+                        # Содержимое хранится один раз по хешу, итоговый путь - жесткая ссылка на него
+                        if store_file_by_hash(temp_filepath, file_path, file_hash, app.config['UPLOAD_CAS_FOLDER']):
+                            app.logger.info(f"Содержимое уже хранится, создана ссылка {file_path}")
+                        else:
+                            app.logger.info(f"Файл успешно перемещен в {file_path}")
+                    
                         # Проверяем, что файл действительно был скопирован
                         if not os.path.exists(file_path):
                             app.logger.error(f"Файл не был скопирован в {file_path}")
                             raise Exception("Не удалось скопировать файл")
-                            
+                        
                         # Проверяем права доступа и устанавливаем их, если необходимо
                         try:
                             os.chmod(file_path, 0o644)  # rw-r--r--
                         except Exception as chmod_error:
                             app.logger.warning(f"Не удалось изменить права доступа: {str(chmod_error)}")
-                            
-                        # Удаляем временный файл
-                        os.remove(temp_filepath)
-                        app.logger.info(f"Временный файл удален: {temp_filepath}")
                     except Exception as copy_error:
                         app.logger.error(f"Ошибка при копировании файла: {str(copy_error)}")
-                        # Если возникла ошибка при копировании, пробуем другой метод
+                        # Если возникла ошибка при копировании, пробуем другой метод. Временного
+                        # файла уже может не быть: store_file_by_hash перенес его в хранилище
                         try:
-                            with open(temp_filepath, 'rb') as src_file:
+                            src_path = stored_source_path(temp_filepath, file_hash)
+                            with open(src_path, 'rb') as src_file:
                                 file_content = src_file.read()
-                                
+                            
                             with open(file_path, 'wb') as dst_file:
                                 dst_file.write(file_content)
-                                
-                            app.logger.info(f"Файл успешно скопирован альтернативным методом в {file_path}")
                             
+                            app.logger.info(f"Файл успешно скопирован альтернативным методом в {file_path}")
+                        
                             # Удаляем временный файл
-                            os.remove(temp_filepath)
+                            remove_file_if_exists(temp_filepath)
                         except Exception as alt_copy_error:
                             app.logger.error(f"Альтернативный метод копирования также не сработал: {str(alt_copy_error)}")
                             # В случае ошибки продолжаем выполнение, но файл может быть не сохранен
-                    
-                    # Add to existing texts to check future pages against
-                    if page_text:
-                        existing_texts.append(page_text)
-                    
+                
                     # Try to extract page number from filename
                     page_number = idx + 1  # Default to the order of upload
-                    
+                
                     # Create book page record
-                    new_page = BookPage(
-                        book_id=new_book.id,
-                        page_number=page_number,
-                        image_path=file_path,
-                        status='pending',
-                        text_content=page_text  # Store extracted text for future reference
-                    )
-                    db.session.add(new_page)
+                    stored_uploads.append((file_path, file_hash))
+                    page_rows.append({
+                        'book_id': new_book.id,
+                        'page_number': page_number,
+                        'image_path': file_path,
+                        'content_hash': file_hash,
+                        'status': 'pending',
+                        'created_at': datetime.utcnow()
+                    })
+                    if new_hash_row:
+                        hash_rows_by_path[file_path] = new_hash_row
                     uploaded_count += 1
             
-            # Save all pages
-            db.session.commit()
+                # Save all pages одной пакетной вставкой вместо INSERT на каждую страницу
+                try:
+                    if page_rows:
+                        db.session.bulk_insert_mappings(BookPage, page_rows)
+                    
+                        # Связываем хеши со страницами за один запрос
+                        if hash_rows_by_path:
+                            page_ids = db.session.query(BookPage.id, BookPage.image_path).filter_by(book_id=new_book.id).all()
+                            for page_id, image_path in page_ids:
+                                hash_row = hash_rows_by_path.get(image_path)
+                                if hash_row:
+                                    hash_row['book_id'] = new_book.id
+                                    hash_row['page_id'] = page_id
+                                    hash_row['created_at'] = datetime.utcnow()
+                            insert_file_hashes(list(hash_rows_by_path.values()))
+                    db.session.commit()
+                except Exception as e:
+                    app.logger.error(f"Ошибка при сохранении страниц в БД: {str(e)}")
+                    db.session.rollback()
+                    # Страницы не записаны - удаляем их файлы и освобождаем содержимое в хранилище
+                    discard_stored_uploads(stored_uploads)
+                    flash('Не удалось сохранить загруженные файлы', 'error')
+                    return redirect(request.url)
             
-            if uploaded_count > 0:
-                if duplicate_count > 0:
-                    flash_message = f'Загружено {uploaded_count} изображений, пропущено {duplicate_count} дубликатов, начата обработка'
+                if uploaded_count > 0:
+                    if duplicate_count > 0:
+                        flash_message = f'Загружено {uploaded_count} изображений, пропущено {duplicate_count} дубликатов, начата обработка'
+                    else:
+                        flash_message = f'Загружено {uploaded_count} изображений, начата обработка'
                 else:
-                    flash_message = f'Загружено {uploaded_count} изображений, начата обработка'
-            else:
-                flash('Не загружено ни одного подходящего файла', 'error')
-                return redirect(request.url)
+                    flash('Не загружено ни одного подходящего файла', 'error')
+                    return redirect(request.url)
                 
-        elif file_type == 'pdf':
-            # Обработка загруженного PDF-файла
-            if 'book_pdf' not in request.files:
-                flash('PDF файл не выбран', 'error')
-                return redirect(request.url)
+            elif file_type == 'pdf':
+                # Обработка загруженного PDF-файла
+                if 'book_pdf' not in request.files:
+                    flash('PDF файл не выбран', 'error')
+                    return redirect(request.url)
                 
-            pdf_file = request.files['book_pdf']
+                pdf_file = request.files['book_pdf']
             
-            if pdf_file.filename == '':
-                flash('PDF файл не выбран', 'error')
-                return redirect(request.url)
-                
-            if pdf_file and allowed_file(pdf_file.filename):
-                # Временно проинициализируем переменную перед использованием
-                pdf_hash = None
-                import hashlib
+                if pdf_file.filename == '':
+                    flash('PDF файл не выбран', 'error')
+                    return redirect(request.url)
                 
-                try:
-                    import fitz  # PyMuPDF для проверки PDF
-                except ImportError:
-                    app.logger.error("Ошибка импорта PyMuPDF (fitz). Возможно, библиотека не установлена.")
-                    # Продолжаем без проверки дубликатов для PDF
+                if pdf_file and allowed_file(pdf_file.filename):
+                    # Временно проинициализируем переменную перед использованием
+                    pdf_hash = None
                 
-                # Сначала сохраняем PDF во временный файл для проверки
-                temp_filename = secure_filename(pdf_file.filename)
-                temp_filepath = os.path.join('/tmp', temp_filename)
-                pdf_file.save(temp_filepath)
-                app.logger.info(f"PDF файл временно сохранен в {temp_filepath}")
+                    try:
+                        import fitz  # PyMuPDF для проверки PDF
+                    except ImportError:
+                        app.logger.error("Ошибка импорта PyMuPDF (fitz). Возможно, библиотека не установлена.")
+                        # Продолжаем без проверки дубликатов для PDF
                 
-                # Проверяем директорию uploads и создаем, если она отсутствует
-                uploads_folder = app.config['UPLOAD_FOLDER']
-                if not os.path.exists(uploads_folder):
-                    os.makedirs(uploads_folder, exist_ok=True)
-                    app.logger.info(f"Создана директория для загрузок PDF: {uploads_folder}")
+                    # Сначала сохраняем PDF во временный файл для проверки
+                    temp_filename = secure_filename(pdf_file.filename)
+                    temp_filepath = os.path.join(app.config['UPLOAD_TEMP_FOLDER'], f"{uuid.uuid4().hex}_{temp_filename}")
+                    # Хеш содержимого считается в том же проходе, что и запись на диск
+                    pdf_hasher = new_content_hasher()
+                    written = save_upload_stream(pdf_file, temp_filepath, hasher=pdf_hasher)
+                    pdf_hash = pdf_hasher.hexdigest()
+                    app.logger.info(f"PDF файл временно сохранен в {temp_filepath} ({written} байт)")
                 
-                # Временно отключаем проверку дубликатов для PDF
-                pdf_is_duplicate = False
-                duplicate_book = None
+                    # Временно отключаем проверку дубликатов для PDF
+                    pdf_is_duplicate = False
+                    duplicate_book = None
                 
-                try:
-                    # Временно отключаем извлечение текста из PDF из-за возможных проблем с fitz
-                    app.logger.info(f"Обработка PDF без извлечения текста: {temp_filename}")
+                    try:
+                        # Временно отключаем извлечение текста из PDF из-за возможных проблем с fitz
+                        app.logger.info(f"Обработка PDF без извлечения текста: {temp_filename}")
                     
-                    # Вычисляем хеш на основе имени файла и размера для быстрой проверки
-                    file_size = os.path.getsize(temp_filepath)
-                    pdf_hash = hashlib.md5(f"{temp_filename}_{file_size}".encode('utf-8')).hexdigest()
-                    app.logger.info(f"Вычислен упрощенный хеш PDF: {pdf_hash[:10]}...")
+                        app.logger.info(f"Вычислен хеш содержимого PDF: {pdf_hash[:10]}...")
                     
-                    # Сначала проверяем хеш в таблице FileHash
-                    existing_file_hash = FileHash.query.filter_by(file_hash=pdf_hash).first()
-                    if existing_file_hash and existing_file_hash.book_id:
-                        # Нашли дубликат по хешу в БД
-                        pdf_is_duplicate = True
-                        duplicate_book = Book.query.get(existing_file_hash.book_id)
-                        if duplicate_book:
-                            app.logger.info(f"Найден дубликат PDF по хешу в базе данных: {duplicate_book.title}")
-                    else:
-                        # Ищем похожие PDF-книги в базе данных (запасной вариант)
-                        existing_books = Book.query.all()
-                        for book in existing_books:
-                            # Проверяем только для книг, у которых есть PDF-страницы
-                            if book.pages and book.pages[0].image_path and book.pages[0].image_path.lower().endswith('.pdf'):
-                                # Упрощаем проверку существующих PDF без доступа к содержимому
-                                try:
-                                    # Получаем размер файла для сравнения
-                                    if os.path.exists(book.pages[0].image_path):
-                                        existing_file_size = os.path.getsize(book.pages[0].image_path)
-                                        existing_filename = os.path.basename(book.pages[0].image_path)
-                                        
-                                        # Вычисляем упрощенный хеш существующего PDF
-                                        existing_hash = hashlib.md5(f"{existing_filename}_{existing_file_size}".encode('utf-8')).hexdigest()
-                                        app.logger.info(f"Сравниваем хеши: {pdf_hash[:10]}... и {existing_hash[:10]}...")
-                                        
-                                        # Если хеши совпадают, это дубликат
-                                        if pdf_hash == existing_hash:
-                                            pdf_is_duplicate = True
-                                            duplicate_book = book
-                                        
-                                        # Сохраняем хеш в БД для будущего использования
-                                        try:
-                                            new_file_hash = FileHash(
-                                                file_hash=pdf_hash,
-                                                original_filename=temp_filename,
-                                                content_type='pdf',
-                                                book_id=book.id
-                                            )
-                                            db.session.add(new_file_hash)
-                                            db.session.commit()
-                                        except Exception as e:
-                                            app.logger.error(f"Ошибка при сохранении хеша PDF в БД: {str(e)}")
-                                        
-                                        break
-                                except Exception as e:
-                                    app.logger.error(f"Ошибка при проверке дубликата PDF: {str(e)}")
-                except Exception as e:
-                    app.logger.error(f"Ошибка при проверке дубликата PDF: {str(e)}")
+                        # Проверяем хеш в таблице FileHash (переименование файла не обходит проверку)
+                        existing_file_hash = FileHash.query.filter_by(file_hash=pdf_hash).first()
+                        if existing_file_hash and existing_file_hash.book_id:
+                            # Нашли дубликат по хешу в БД
+                            pdf_is_duplicate = True
+                            duplicate_book = Book.query.get(existing_file_hash.book_id)
+                            if duplicate_book:
+                                app.logger.info(f"Найден дубликат PDF по хешу в базе данных: {duplicate_book.title}")
+                    except Exception as e:
+                        app.logger.error(f"Ошибка при проверке дубликата PDF: {str(e)}")
                 
-                if pdf_is_duplicate and duplicate_book:
-                    # Удаляем временный файл и созданную книгу, т.к. найден дубликат
-                    os.remove(temp_filepath)
-                    db.session.delete(new_book)
-                    db.session.commit()
+                    if pdf_is_duplicate and duplicate_book:
+                        # Удаляем временный файл и созданную книгу, т.к. найден дубликат
+                        os.remove(temp_filepath)
+                        db.session.delete(new_book)
+                        db.session.commit()
                     
-                    flash(f'PDF файл уже существует в системе (книга "{duplicate_book.title}"). Повторная загрузка пропущена.', 'warning')
-                    return redirect(url_for('view_book', book_id=duplicate_book.id))
+                        flash(f'PDF файл уже существует в системе (книга "{duplicate_book.title}"). Повторная загрузка пропущена.', 'warning')
+                        return redirect(url_for('view_book', book_id=duplicate_book.id))
                 
-                # Не дубликат, сохраняем окончательно
-                # Проверяем директорию uploads и создаем, если она отсутствует
-                uploads_folder = app.config['UPLOAD_FOLDER']
-                if not os.path.exists(uploads_folder):
-                    os.makedirs(uploads_folder, exist_ok=True)
-                    app.logger.info(f"Создана директория для загрузок PDF: {uploads_folder}")
+                    # Не дубликат, сохраняем окончательно
+                    # Директория uploads создается один раз при старте приложения
+                    uploads_folder = app.config['UPLOAD_FOLDER']
                 
-                # Улучшенная обработка копирования PDF файла
-                try:
-                    import shutil
-                    # Обеспечиваем безопасное имя файла и не слишком длинный путь
-                    safe_filename = secure_filename(pdf_file.filename)
-                    if len(safe_filename) > 50:  # Ограничиваем длину имени файла
-                        extension = safe_filename.rsplit('.', 1)[1] if '.' in safe_filename else ''
-                        safe_filename = safe_filename[:40] + '.' + extension if extension else safe_filename[:50]
+                    # Улучшенная обработка копирования PDF файла
+                    try:
+                        # Безопасное имя уже вычислено выше, ограничиваем длину пути
+                        safe_filename = temp_filename
+                        if len(safe_filename) > 50:  # Ограничиваем длину имени файла
+                            extension = safe_filename.rsplit('.', 1)[1] if '.' in safe_filename else ''
+                            safe_filename = safe_filename[:40] + '.' + extension if extension else safe_filename[:50]
                     
-                    # Формируем окончательный путь к файлу
-                    filename = f"{new_book.id}_pdf_{safe_filename}"
-                    file_path = os.path.join(uploads_folder, filename)
+                        # Формируем окончательный путь к файлу
+                        filename = f"{new_book.id}_pdf_{safe_filename}"
+                        file_path = os.path.join(uploads_folder, filename)
                     
-                    # Копируем файл
-                    shutil.copy2(temp_filepath, file_path)
-                    app.logger.info(f"PDF файл успешно скопирован в {file_path}")
+                        # Содержимое хранится один раз по хешу, итоговый путь - жесткая ссылка на него
+                        store_file_by_hash(temp_filepath, file_path, pdf_hash, app.config['UPLOAD_CAS_FOLDER'])
+                        app.logger.info(f"PDF файл успешно перемещен в {file_path}")
                     
-                    # Проверяем, что файл действительно был скопирован
-                    if not os.path.exists(file_path):
-                        app.logger.error(f"PDF файл не был скопирован в {file_path}")
-                        raise Exception("Не удалось скопировать PDF файл")
-                        
-                    # Проверяем права доступа и устанавливаем их
-                    try:
-                        os.chmod(file_path, 0o644)  # rw-r--r--
-                    except Exception as chmod_error:
-                        app.logger.warning(f"Не удалось изменить права доступа для PDF: {str(chmod_error)}")
+                        # Проверяем, что файл действительно был скопирован
+                        if not os.path.exists(file_path):
+                            app.logger.error(f"PDF файл не был скопирован в {file_path}")
+                            raise Exception("Не удалось скопировать PDF файл")
                         
-                    # Удаляем временный файл
-                    os.remove(temp_filepath)
-                    app.logger.info(f"Временный PDF файл удален: {temp_filepath}")
-                except Exception as copy_error:
-                    app.logger.error(f"Ошибка при копировании PDF файла: {str(copy_error)}")
-                    # Если возникла ошибка при копировании, пробуем другой метод
-                    try:
-                        with open(temp_filepath, 'rb') as src_file:
-                            file_content = src_file.read()
+                        # Проверяем права доступа и устанавливаем их
+                        try:
+                            os.chmod(file_path, 0o644)  # rw-r--r--
+                        except Exception as chmod_error:
+                            app.logger.warning(f"Не удалось изменить права доступа для PDF: {str(chmod_error)}")
+                    except Exception as copy_error:
+                        app.logger.error(f"Ошибка при копировании PDF файла: {str(copy_error)}")
+                        # Если возникла ошибка при копировании, пробуем другой метод. Временного
+                        # файла уже может не быть: store_file_by_hash перенес его в хранилище
+                        try:
+                            src_path = stored_source_path(temp_filepath, pdf_hash)
+                            with open(src_path, 'rb') as src_file:
+                                file_content = src_file.read()
                             
-                        with open(file_path, 'wb') as dst_file:
-                            dst_file.write(file_content)
+                            with open(file_path, 'wb') as dst_file:
+                                dst_file.write(file_content)
                             
-                        app.logger.info(f"PDF файл успешно скопирован альтернативным методом в {file_path}")
+                            app.logger.info(f"PDF файл успешно скопирован альтернативным методом в {file_path}")
                         
-                        # Удаляем временный файл
-                        os.remove(temp_filepath)
-                    except Exception as alt_copy_error:
-                        app.logger.error(f"Альтернативный метод копирования PDF также не сработал: {str(alt_copy_error)}")
-                        # В случае ошибки продолжаем выполнение, но файл может быть не сохранен
+                            # Удаляем временный файл
+                            remove_file_if_exists(temp_filepath)
+                        except Exception as alt_copy_error:
+                            app.logger.error(f"Альтернативный метод копирования PDF также не сработал: {str(alt_copy_error)}")
+                            # В случае ошибки продолжаем выполнение, но файл может быть не сохранен
                 
-                # Create single book page record for PDF
-                new_page = BookPage(
-                    book_id=new_book.id,
-                    page_number=1,  # Since we don't know the page count yet
-                    image_path=file_path,
-                    status='pending'
-                )
-                db.session.add(new_page)
+                    # Create single book page record for PDF
+                    new_page = BookPage(
+                        book_id=new_book.id,
+                        page_number=1,  # Since we don't know the page count yet
+                        image_path=file_path,
+                        content_hash=pdf_hash,
+                        status='pending'
+                    )
+                    db.session.add(new_page)
+                
+                    # Сохраняем хеш PDF в базе данных для будущего обнаружения дубликатов
+                    if pdf_hash:
+                        try:
+                            db.session.flush()  # Получаем new_page.id для связи с хешем
+                            insert_file_hashes([{
+                                'file_hash': pdf_hash,
+                                'original_filename': temp_filename,
+                                'content_type': 'pdf',
+                                'book_id': new_book.id,
+                                'page_id': new_page.id
+                            }], update_links=True)
+                        except Exception as e:
+                            app.logger.error(f"Ошибка при сохранении хеша PDF в БД: {str(e)}")
                 
-                # Сохраняем хеш PDF в базе данных для будущего обнаружения дубликатов
-                if pdf_hash:
                     try:
-                        new_file_hash = FileHash(
-                            file_hash=pdf_hash,
-                            original_filename=temp_filename,
-                            content_type='pdf',
-                            book_id=new_book.id,
-                            page_id=new_page.id
-                        )
-                        db.session.add(new_file_hash)
+                        db.session.commit()
                     except Exception as e:
-                        app.logger.error(f"Ошибка при сохранении хеша PDF в БД: {str(e)}")
-                
-                db.session.commit()
+                        app.logger.error(f"Ошибка при сохранении PDF в БД: {str(e)}")
+                        db.session.rollback()
+                        discard_stored_uploads([(file_path, pdf_hash)])
+                        flash('Не удалось сохранить загруженный PDF файл', 'error')
+                        return redirect(request.url)
                 
-                is_pdf = True
-                uploaded_count = 1
-                flash_message = 'PDF файл загружен, начата обработка'
+                    is_pdf = True
+                    uploaded_count = 1
+                    flash_message = 'PDF файл загружен, начата обработка'
+                else:
+                    flash('Загруженный файл не является PDF', 'error')
+                    return redirect(request.url)
             else:
-                flash('Загруженный файл не является PDF', 'error')
+                flash('Неизвестный тип файла', 'error')
                 return redirect(request.url)
-        else:
-            flash('Неизвестный тип файла', 'error')
-            return redirect(request.url)
         
         if uploaded_count > 0:
             # Create processing job
@@ -554,9 +710,8 @@ def upload_book():
             app.logger.info(f"Используем значение figures_only_mode={figures_only_mode} для запуска обработки")
             
             # Start processing in background with translation and figures_only flags
-            thread = threading.Thread(target=process_book, args=(new_book.id, job.id, is_pdf, translate_to_russian, figures_only_mode))
-            thread.daemon = True
-            thread.start()
+            future = app.job_executor.submit(process_book, new_book.id, job.id, is_pdf, translate_to_russian, figures_only_mode)
+            future.add_done_callback(log_job_failure)
             
             flash(flash_message, 'success')
             return redirect(url_for('view_book', book_id=new_book.id))
@@ -570,9 +725,13 @@ def upload_book():
 @app.route('/book/<int:book_id>')
 def view_book(book_id):
     """Display book details and processing status"""
-    book = Book.query.get_or_404(book_id)
-    pages = BookPage.query.filter_by(book_id=book_id).order_by(BookPage.page_number).all()
-    job = ProcessingJob.query.filter_by(book_id=book_id).order_by(ProcessingJob.created_at.desc()).first()
+    # Задачи подтягиваются JOIN'ом вместе с книгой, страницы - одним пакетным запросом (selectinload)
+    book = Book.query.options(
+        db.joinedload(Book.jobs),
+        db.selectinload(Book.pages)
+    ).get_or_404(book_id)
+    pages = book.pages
+    job = book.jobs[0] if book.jobs else None
     
     return render_template('book.html', book=book, pages=pages, job=job)
 
@@ -594,10 +753,8 @@ def reprocess_book(book_id):
     
     db.session.commit()
     
-    # Check if it's a PDF file
-    is_pdf = False
-    if book.pages and book.pages[0].image_path:
-        is_pdf = book.pages[0].image_path.lower().endswith('.pdf')
+    # Тип книги сохраняется при загрузке, страницы для этого не загружаем
+    is_pdf = bool(book.is_pdf)
     
     # По умолчанию используем перевод при повторной обработке
     # В будущем можно добавить выбор этой опции в форму повторной обработки
@@ -606,10 +763,11 @@ def reprocess_book(book_id):
     # По умолчанию не используем режим только фигур при повторной обработке
     figures_only_mode = False
     
+    invalidate_book_status(book.id)
+    
     # Start processing in background with translation and figures_only flags
-    thread = threading.Thread(target=process_book, args=(book.id, job.id, is_pdf, translate_to_russian, figures_only_mode))
-    thread.daemon = True
-    thread.start()
+    future = app.job_executor.submit(process_book, book.id, job.id, is_pdf, translate_to_russian, figures_only_mode)
+    future.add_done_callback(log_job_failure)
     
     flash(f'Обработка начата для книги: {book.title}', 'success')
     return redirect(url_for('view_book', book_id=book.id))
@@ -620,59 +778,85 @@ def delete_book(book_id):
     book = Book.query.get_or_404(book_id)
     
     try:
-        # Get all pages
-        pages = BookPage.query.filter_by(book_id=book_id).all()
-        
-        # Delete associated files
-        for page in pages:
-            # Delete image file if it exists and it's not a PDF
-            if page.image_path and os.path.exists(page.image_path) and not page.image_path.lower().endswith('.pdf'):
-                os.remove(page.image_path)
-            
-            # Delete processed image if it exists
-            if page.processed_image_path and os.path.exists(page.processed_image_path):
-                os.remove(page.processed_image_path)
-            
-            # Delete associated figures
-            figures = Figure.query.filter_by(page_id=page.id).all()
-            for figure in figures:
-                if figure.image_path and os.path.exists(figure.image_path):
-                    os.remove(figure.image_path)
-                db.session.delete(figure)
-        
-        # Delete jobs and their output files
-        jobs = ProcessingJob.query.filter_by(book_id=book_id).all()
-        for job in jobs:
-            if job.result_file_en and os.path.exists(job.result_file_en):
-                os.remove(job.result_file_en)
-            if job.result_file_ru and os.path.exists(job.result_file_ru):
-                os.remove(job.result_file_ru)
-            db.session.delete(job)
-            
-        # Удаляем хеши файлов, связанные с этой книгой
-        file_hashes = FileHash.query.filter_by(book_id=book_id).all()
-        for file_hash in file_hashes:
-            db.session.delete(file_hash)
+        # Читаем только нужные столбцы: легкие кортежи вместо полных ORM-объектов
+        page_paths = db.session.query(BookPage.image_path, BookPage.processed_image_path)\
+            .filter_by(book_id=book_id).all()
+        # Пути всех фигур книги одним JOIN вместо отдельного запроса на каждую страницу
+        figure_paths = db.session.query(Figure.image_path)\
+            .join(BookPage, Figure.page_id == BookPage.id)\
+            .filter(BookPage.book_id == book_id).all()
+        job_paths = db.session.query(ProcessingJob.result_file_en, ProcessingJob.result_file_ru)\
+            .filter_by(book_id=book_id).all()
+        # Содержимое, на которое ссылаются файлы страниц книги. Строка FileHash на хеш одна
+        # и может принадлежать другой книге, поэтому хеши берутся у самих страниц; строки
+        # FileHash книги учитываются для страниц без content_hash (загруженных до его появления)
+        file_hashes = {content_hash for (content_hash,) in db.session.query(BookPage.content_hash)
+                       .filter(BookPage.book_id == book_id, BookPage.content_hash.isnot(None))}
+        file_hashes.update(file_hash for (file_hash,) in
+                           db.session.query(FileHash.file_hash).filter_by(book_id=book_id))
         
-        # Delete output directory if it exists
+        # Выходная директория книги удаляется целиком одним rmtree, поэтому файлы внутри нее
+        # по отдельности не удаляем
         output_dir = os.path.join('output', f"book_{book_id}")
-        if os.path.exists(output_dir):
-            import shutil
-            shutil.rmtree(output_dir)
+        output_prefix = os.path.abspath(output_dir) + os.sep
+        file_paths = []
+        
+        def add_book_file(path):
+            if path and not os.path.abspath(path).startswith(output_prefix):
+                file_paths.append(path)
+        
+        # Collect associated files
+        for image_path, processed_image_path in page_paths:
+            # Delete image file if it's not a PDF
+            if not book.is_pdf:
+                add_book_file(image_path)
+            
+            # Delete processed image
+            add_book_file(processed_image_path)
+        
+        # Delete associated figures
+        for (figure_path,) in figure_paths:
+            add_book_file(figure_path)
+        
+        # Delete job output files
+        for result_file_en, result_file_ru in job_paths:
+            add_book_file(result_file_en)
+            add_book_file(result_file_ru)
         
         # Delete PDF file if this is a PDF book (only delete first page's file, as all pages reference the same file)
-        if pages and pages[0].image_path and pages[0].image_path.lower().endswith('.pdf') and os.path.exists(pages[0].image_path):
-            os.remove(pages[0].image_path)
+        if book.is_pdf and page_paths:
+            add_book_file(page_paths[0].image_path)
         
-        # Delete all pages
-        for page in pages:
-            db.session.delete(page)
+        # Удаляем записи одним DELETE на таблицу вместо отдельного запроса на каждую строку.
+        # Порядок важен из-за внешних ключей: фигуры и хеши ссылаются на страницы
+        page_ids = db.session.query(BookPage.id).filter_by(book_id=book_id)
+        Figure.query.filter(Figure.page_id.in_(page_ids)).delete(synchronize_session=False)
+        ProcessingJob.query.filter_by(book_id=book_id).delete(synchronize_session=False)
+        # Если то же содержимое есть у страницы другой книги, строка FileHash переходит к ней,
+        # а не удаляется: иначе хеш перестал бы находиться при поиске дубликатов
+        other_pages = {}
+        if file_hashes:
+            for content_hash, other_book_id, other_page_id in db.session.query(
+                    BookPage.content_hash, BookPage.book_id, BookPage.id)\
+                    .filter(BookPage.content_hash.in_(file_hashes), BookPage.book_id != book_id):
+                other_pages.setdefault(content_hash, (other_book_id, other_page_id))
+        for content_hash, (other_book_id, other_page_id) in other_pages.items():
+            FileHash.query.filter_by(file_hash=content_hash, book_id=book_id)\
+                .update({'book_id': other_book_id, 'page_id': other_page_id}, synchronize_session=False)
+        FileHash.query.filter_by(book_id=book_id).delete(synchronize_session=False)
+        BookPage.query.filter_by(book_id=book_id).delete(synchronize_session=False)
         
         # Finally delete the book
         book_title = book.title
         db.session.delete(book)
         db.session.commit()
         
+        # Файлы удаляем в фоне только после успешного коммита: запрос не ждет файловую систему,
+        # а при ошибке в базе файлы остаются на месте
+        app.cleanup_executor.submit(cleanup_book_files, file_paths, file_hashes, output_dir,
+                                    app.config['UPLOAD_CAS_FOLDER'])
+        invalidate_book_status(book_id)
+        
         flash(f'Книга "{book_title}" успешно удалена', 'success')
     except Exception as e:
         logger.error(f"Error deleting book {book_id}: {str(e)}")
@@ -707,6 +891,10 @@ def download_pdf(job_id, language):
     # Это поможет нам найти файл, даже если он был создан с другим путем
     book_id = job.book_id
     
+    # Каталог PDF книги вычисляем один раз. Варианты с os.getcwd() указывали на тот же каталог,
+    # что и относительный путь, и только удваивали число stat/scandir
+    pdf_dir = os.path.join('output', f'book_{book_id}', 'pdf')
+    
     # 1. Поиск файлов по имени
     basename = os.path.basename(source_path)
     possible_pdf_locations = [
@@ -714,52 +902,43 @@ def download_pdf(job_id, language):
         source_path,
         
         # Типичные пути относительно корня проекта
-        os.path.join('output', f'book_{book_id}', 'pdf', basename),
-        
-        # Абсолютные пути с базовым каталогом
-        os.path.join(os.getcwd(), 'output', f'book_{book_id}', 'pdf', basename),
+        os.path.join(pdf_dir, basename),
         
         # Проверяем все книги (для случая, если ID книги изменился)
         os.path.join('output', basename),
     ]
     
     # 2. Альтернативный поиск - пробуем найти любые PDF файлы в ожидаемой директории
-    search_dirs = [
-        os.path.join('output', f'book_{book_id}', 'pdf'),
-        os.path.join(os.getcwd(), 'output', f'book_{book_id}', 'pdf')
-    ]
+    search_dirs = [pdf_dir]
     
+    pattern = PDF_LANGUAGE_PATTERNS[language]
     for search_dir in search_dirs:
-        if os.path.exists(search_dir):
-            # Ищем все PDF файлы в этой директории
-            try:
-                for file in os.listdir(search_dir):
-                    if file.endswith('.pdf') and (language == 'en' and '_en.pdf' in file.lower() or 
-                                                  language == 'ru' and '_ru.pdf' in file.lower()):
-                        possible_pdf_locations.append(os.path.join(search_dir, file))
-            except Exception as e:
-                logger.error(f"Ошибка при поиске в директории {search_dir}: {str(e)}")
-    
-    # Проверяем все возможные пути
+        # Ищем все PDF файлы в этой директории (scandir сразу отдает тип записи, без лишних stat)
+        try:
+            with os.scandir(search_dir) as entries:
+                for entry in entries:
+                    if pattern.search(entry.name) and entry.is_file():
+                        possible_pdf_locations.append(entry.path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(f"Ошибка при поиске в директории {search_dir}: {str(e)}")
+    
+    # Проверяем все возможные пути: один stat на путь, останавливаемся на первом подходящем
     found_pdf_path = None
+    for path in possible_pdf_locations:
+        st = cached_stat(path)
+        if st and st.st_size > 100:  # Минимальный размер для валидного PDF
+            found_pdf_path = path
+            break
     
-    if USE_CUSTOM_LOGGERS:
-        pdf_logger.info(f"Поиск {file_type} PDF файла среди {len(possible_pdf_locations)} возможных путей")
+    if found_pdf_path:
+        (pdf_logger if USE_CUSTOM_LOGGERS else logger).info(f"Найден {file_type} PDF файл: {found_pdf_path}")
+    elif USE_CUSTOM_LOGGERS and pdf_logger.isEnabledFor(logging.DEBUG):
+        # Подробности по каждому пути нужны только при отладке неудачного поиска
         for i, path in enumerate(possible_pdf_locations):
-            exists = os.path.exists(path)
-            size = os.path.getsize(path) if exists else 0
-            pdf_logger.info(f"Путь {i+1}: {path} (существует: {exists}, размер: {size} байт)")
-            if exists and size > 100:  # Минимальный размер для валидного PDF
-                found_pdf_path = path
-                pdf_logger.info(f"Найден подходящий PDF файл: {found_pdf_path}")
-                break
-    else:
-        # Если нет специального логгера, используем упрощенный поиск
-        for path in possible_pdf_locations:
-            if os.path.exists(path) and os.path.getsize(path) > 100:
-                found_pdf_path = path
-                logger.info(f"Найден PDF файл: {found_pdf_path}")
-                break
+            st = stat_or_none(path)
+            pdf_logger.debug(f"Путь {i+1}: {path} (существует: {st is not None}, размер: {st.st_size if st else 0} байт)")
     
     # Если файл найден, отправляем его
     if found_pdf_path:
@@ -769,23 +948,22 @@ def download_pdf(job_id, language):
             # Улучшенное логирование для отладки
             if USE_CUSTOM_LOGGERS:
                 with open(found_pdf_path, 'rb') as f:
-                    first_bytes = f.read(20)
+                    first_bytes = os.pread(f.fileno(), 20, 0)
                 hex_preview = ' '.join(f'{b:02x}' for b in first_bytes)
                 pdf_logger.info(f"Первые 20 байт файла: {hex_preview}")
                 pdf_logger.info(f"Начинается с '%PDF': {'25504446' in hex_preview.replace(' ', '')}")
             
-            # Отправляем файл с правильным MIME-типом и заголовками
+            # Отправляем файл с правильным MIME-типом и заголовками.
+            # send_file сам выставляет Content-Type/Content-Disposition, ETag и Last-Modified
+            # (conditional=True отвечает 304 без тела и поддерживает Range-запросы)
             response = send_file(
                 found_pdf_path, 
                 mimetype='application/pdf',
                 as_attachment=True, 
-                download_name=download_name
+                download_name=download_name,
+                conditional=True
             )
             
-            # Принудительно устанавливаем заголовки
-            response.headers.set('Content-Type', 'application/pdf')
-            response.headers.set('Content-Disposition', f'attachment; filename="{download_name}"')
-            
             if USE_CUSTOM_LOGGERS:
                 pdf_logger.info(f"Отправка файла: {found_pdf_path}")
                 pdf_logger.info(f"Content-Type: {response.headers.get('Content-Type')}")
@@ -812,25 +990,18 @@ def download_pdf(job_id, language):
             flash(f'Ошибка при загрузке файла: {str(e)}', 'error')
             return redirect(url_for('view_book', book_id=job.book_id))
     
-    # Файл не найден, но можем попробовать создать тестовый PDF и отправить его
     logger.error(f"PDF файл не найден ни по одному из путей")
     
-    # Создаем тестовый PDF и отправляем его
-    pdf_dir = os.path.join('output', f'book_{book_id}', 'pdf')
-    os.makedirs(pdf_dir, exist_ok=True)
+    # Тестовый PDF-заменитель создается только в отладочном режиме (DEBUG_FAKE_PDFS),
+    # иначе в базу попадали бы пути к ненастоящим файлам
+    if not app.config.get('DEBUG_FAKE_PDFS'):
+        flash(f'{file_type} PDF файл не найден', 'error')
+        return redirect(url_for('view_book', book_id=job.book_id))
     
-    test_pdf_path = os.path.join(pdf_dir, f"test_{language}.pdf")
+    test_pdf_path = os.path.join('output', f'book_{book_id}', 'pdf', f"test_{language}.pdf")
     try:
-        # Создаем простой PDF-файл, если нет реального
-        from reportlab.pdfgen import canvas
-        
-        c = canvas.Canvas(test_pdf_path)
-        c.setFont("Helvetica", 12)
-        c.drawString(100, 750, f"Тестовый PDF для книги ID: {book_id}")
-        c.drawString(100, 730, f"Язык: {language}")
-        c.drawString(100, 710, f"Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        c.drawString(100, 690, "Настоящий файл не найден, это временный заменитель.")
-        c.save()
+        make_test_pdf(test_pdf_path, book_id, language)
+        invalidate_path_cache(test_pdf_path)
         
         # Обновляем путь в базе данных
         if language == 'en':
@@ -865,52 +1036,70 @@ def view_page(page_id):
 @app.route('/api/book/<int:book_id>/status')
 def book_status(book_id):
     """API endpoint to check book processing status"""
-    book = Book.query.get_or_404(book_id)
-    job = ProcessingJob.query.filter_by(book_id=book_id).order_by(ProcessingJob.created_at.desc()).first()
-    
-    if not job:
-        return jsonify({
-            'status': 'unknown',
-            'message': 'No processing job found'
-        })
-    
-    response = {
-        'book_id': book.id,
-        'book_title': book.title,
-        'status': job.status,
-        'created_at': job.created_at.isoformat(),
-        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-        'result_files': {
-            'en': job.result_file_en is not None,
-            'ru': job.result_file_ru is not None
-        }
-    }
-    
-    if job.error_message:
-        response['error'] = job.error_message
-    
-    return jsonify(response)
+    now = time.monotonic()
+    cached = _book_status_cache.get(book_id)
+    if cached is not None and now - cached[0] < BOOK_STATUS_CACHE_TTL:
+        body = cached[1]
+    else:
+        book = Book.query.get_or_404(book_id)
+        job = ProcessingJob.query.filter_by(book_id=book_id).order_by(ProcessingJob.created_at.desc()).first()
+        
+        if not job:
+            data = {
+                'status': 'unknown',
+                'message': 'No processing job found'
+            }
+        else:
+            data = {
+                'book_id': book.id,
+                'book_title': book.title,
+                'status': job.status,
+                'created_at': job.created_at,
+                'completed_at': job.completed_at,
+                'result_files': {
+                    'en': job.result_file_en is not None,
+                    'ru': job.result_file_ru is not None
+                }
+            }
+            
+            if job.error_message:
+                data['error'] = job.error_message
+        
+        body = json_bytes(data)
+        if len(_book_status_cache) >= BOOK_STATUS_CACHE_SIZE:
+            _book_status_cache.clear()
+        _book_status_cache[book_id] = (now, body)
+    
+    response = Response(body, mimetype='application/json')
+    # Статус опрашивается периодически, кешировать его прокси не должны
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def image_not_found():
+    """Перенаправляет на изображение-заглушку, чтобы его отдавал статический сервер"""
+    return redirect(url_for('static', filename='img/image-not-found.png'))
 
 @app.route('/images/<path:filename>')
 def get_image(filename):
     """Serve uploaded and processed images"""
     image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if os.path.exists(image_path):
+    # За nginx (NGINX_STATIC) сюда доходят только запросы к отсутствующим файлам
+    if not app.config.get('NGINX_STATIC') and cached_stat(image_path) is not None:
         return send_file(image_path)
     else:
         # Return a placeholder image if the requested image doesn't exist
-        return send_file(os.path.join('static', 'img', 'image-not-found.png'))
+        return image_not_found()
 
 @app.route('/output/<path:filename>')
 def get_output_file(filename):
     """Serve output files"""
     output_dir = 'output'
     output_path = os.path.join(output_dir, filename)
-    if os.path.exists(output_path):
+    if not app.config.get('NGINX_STATIC') and cached_stat(output_path) is not None:
         return send_file(output_path)
     else:
         # Return a placeholder image if the requested file doesn't exist
-        return send_file(os.path.join('static', 'img', 'image-not-found.png'))
+        return image_not_found()
         
 @app.route('/download/figure/<int:figure_id>')
 def download_figure(figure_id):
@@ -979,8 +1168,8 @@ def download_processed_image(page_id):
 def read_book(book_id):
     """Sequential reading mode for the entire book"""
     book = Book.query.get_or_404(book_id)
-    pages = BookPage.query.filter_by(book_id=book_id).order_by(BookPage.page_number).all()
-    page_count = len(pages)
+    # Считаем страницы в базе и загружаем только текущую, а не все страницы книги
+    page_count = db.session.query(db.func.count(BookPage.id)).filter_by(book_id=book_id).scalar()
     
     # Get current page number from query parameters, default to 1
     current_page_num = request.args.get('page', 1, type=int)
@@ -991,8 +1180,11 @@ def read_book(book_id):
     elif current_page_num > page_count:
         current_page_num = page_count
     
-    # Get the current page (index is page_num - 1)
-    current_page = pages[current_page_num - 1] if pages else None
+    # Get the current page (offset is page_num - 1)
+    current_page = None
+    if page_count:
+        current_page = BookPage.query.filter_by(book_id=book_id).order_by(BookPage.page_number)\
+            .offset(current_page_num - 1).limit(1).first()
     
     # Get figures for the current page
     figures = []
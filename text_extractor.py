@@ -3,38 +3,639 @@
 Module for text extraction from images using Tesseract OCR.
 """
 import os
+import asyncio
+import contextlib
 import cv2
+import hashlib
 import pytesseract
 import numpy as np
+import functools
 import logging
 import re
+import shlex
+import tempfile
+import threading
 import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from utils import compute_file_content_hash
+
+# Один поток OpenMP на экземпляр Tesseract: параллелизм обеспечивается пулом потоков
+# (extract_text_parallel), а не OpenMP внутри каждого вызова, иначе ядра переподписываются.
+# Устанавливается до загрузки tesserocr и наследуется подпроцессами pytesseract
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# tesserocr (если установлен) работает с Tesseract в том же процессе: движок и traineddata
+# загружаются один раз, а не при каждом вызове подпроцесса tesseract, как в pytesseract
+try:
+    from tesserocr import PyTessBaseAPI
+    HAS_TESSEROCR = True
+except ImportError:
+    HAS_TESSEROCR = False
+
+# RapidOCR (модели PaddleOCR в формате ONNX, onnxruntime) - необязательный бэкенд
+# распознавания для серверов с GPU: TextExtractor(backend='onnx')
+try:
+    from rapidocr_onnxruntime import RapidOCR
+    HAS_RAPIDOCR = True
+except ImportError:
+    HAS_RAPIDOCR = False
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Регулярные выражения для _clean_text компилируются один раз при импорте модуля
+_RE_WHITESPACE = re.compile(r'\s+')
+_RE_SPACE_BEFORE_PUNCT = re.compile(r'\s+([.,;:!?)])')
+_RE_SPACE_AFTER_OPEN = re.compile(r'([({[])\s+')
+# Строка целиком из спецсимволов (не буквы/цифры, не пробелы, не кириллица) вместе с ее переводом строки
+_RE_SPECIAL_ONLY_LINE = re.compile(r'^[^\w\s\u0400-\u04FF]+$\n?', re.MULTILINE)
+# Типичные ошибки OCR в числах: пробелы между группами разрядов (только в пределах строки,
+# отдельные числа вроде "10 20 30" не склеиваются) и буква 'O' вместо нуля после цифры
+_RE_SPACE_IN_NUM = re.compile(r'\b\d{1,3}(?: \d{3})+\b')
+_RE_O_IN_NUM = re.compile(r'(?<=\d)O(?=\d)|(?<=\d)O\b')
+
+# Посимвольная чистка за один str.translate: управляющие символы и символы, заменяющиеся
+# на '■' в PDF, удаляются, а '|' (частая ошибка OCR) заменяется на 'I'
+_CLEAN_CHARS_TABLE = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F, *map(ord, '■□▪▫◾◽◼◻')]
+)
+_CLEAN_CHARS_TABLE[ord('|')] = 'I'  # Pipe to I
+
+# Таблица усиления контраста для агрессивного режима: saturate(1.5 * x + 10)
+_CONTRAST_ALPHA = 1.5  # Коэффициент контраста
+_CONTRAST_BETA = 10    # Яркость
+_CONTRAST_LUT = np.clip(np.rint(np.arange(256) * _CONTRAST_ALPHA + _CONTRAST_BETA), 0, 255).astype(np.uint8)
+
+# Наборы допустимых символов для специализированных режимов. Строки конфигурации общие для
+# всех экземпляров: с tesserocr они разбираются и применяются через SetVariable один раз
+# при создании движка (_get_tess_engine), а не при каждом вызове
+TECH_CHAR_WHITELIST = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-+=%()[]{}.:,;/<>*& "
+NUMBER_CHAR_WHITELIST = "0123456789.,-+/%"
+TECH_CONFIG = f'--oem 1 --psm 6 -c tessedit_char_whitelist="{TECH_CHAR_WHITELIST}"'
+NUMBER_CONFIG = f'--oem 1 --psm 7 -c tessedit_char_whitelist="{NUMBER_CHAR_WHITELIST}"'
+# Более агрессивные настройки для сложных случаев
+AGGRESSIVE_CONFIG = '--oem 1 --psm 3 -c tessedit_char_blacklist=|~^`$#@&*{}[]()<>\'\"\\/ -c page_separator=""'
+
+# Изображения с меньшим стандартным отклонением яркости считаются пустыми (поля, промежутки
+# между фигурами) и не отправляются в Tesseract
+BLANK_STD_THRESHOLD = 3.0
+
+# Каталог для промежуточных изображений pytesseract: tmpfs, если доступен. Файлы создаются
+# через mkstemp (уникальное имя, O_EXCL) и удаляются сразу после распознавания
+_OCR_TMP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# Максимум одновременно работающих процессов tesseract в extract_batch
+OCR_CONCURRENCY = int(os.environ.get('OCR_CONCURRENCY') or os.cpu_count() or 1)
+# Число потоков пакетного распознавания (extract_text_parallel, extract_batch_threaded)
+OCR_MAX_THREADS = int(os.environ.get('OCR_MAX_THREADS') or os.cpu_count() or 1)
+
+# Кеш результатов quick_extract_text по хешу содержимого файла: при поиске дубликатов
+# одно и то же изображение (или его копия под другим именем) распознается один раз
+QUICK_TEXT_CACHE_SIZE = 4096
+_quick_text_cache = {}
+
+# Максимальный размер кеша распознанных областей в экземпляре TextExtractor
+OCR_CACHE_SIZE = 4096
+
+# Движки tesserocr по строке конфигурации, отдельные для каждого потока: один экземпляр
+# PyTessBaseAPI нельзя использовать из нескольких потоков одновременно, а так потоки пула
+# не ждут друг друга и каждый переиспользует свои движки между вызовами
+_tess_local = threading.local()
+
+# Общий пул потоков пакетного распознавания. Он живет все время работы процесса: движки
+# tesserocr создаются в каждом потоке один раз, а новый пул на каждый вызов создавал бы
+# новые потоки и заново загружал бы в них модели
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+def _get_ocr_executor():
+    """
+    Возвращает общий пул из OCR_MAX_THREADS потоков, создавая его при первом обращении.
+    
+    Returns:
+        ThreadPoolExecutor: Пул потоков распознавания
+    """
+    global _ocr_executor
+    if _ocr_executor is None:
+        with _ocr_executor_lock:
+            if _ocr_executor is None:
+                _ocr_executor = ThreadPoolExecutor(max_workers=OCR_MAX_THREADS,
+                                                   thread_name_prefix='ocr')
+    return _ocr_executor
+
+@functools.lru_cache(maxsize=64)
+def _split_tesseract_config(config):
+    """
+    Разбивает строку конфигурации на аргументы командной строки tesseract. Конфигураций
+    немного, поэтому каждая строка разбирается shlex один раз.
+    
+    Args:
+        config (str): Строка конфигурации
+        
+    Returns:
+        tuple: Аргументы
+    """
+    return tuple(shlex.split(config or ''))
+
+def _parse_tesseract_config(config):
+    """
+    Разбирает строку конфигурации pytesseract в параметры PyTessBaseAPI.
+    
+    Args:
+        config (str): Строка вида '--oem 1 --psm 6 -c name=value'
+        
+    Returns:
+        tuple: (oem, psm, variables)
+    """
+    oem, psm, variables = None, None, {}
+    args = _split_tesseract_config(config)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ('--oem', '--psm', '-c') and i + 1 < len(args):
+            value = args[i + 1]
+            if arg == '--oem':
+                oem = int(value)
+            elif arg == '--psm':
+                psm = int(value)
+            else:
+                name, _, var_value = value.partition('=')
+                variables[name] = var_value
+            i += 2
+        else:
+            i += 1
+    return oem, psm, variables
+
+def _get_tess_engine(config):
+    """
+    Возвращает (создавая при первом обращении) движок tesserocr текущего потока для конфигурации.
+    
+    Args:
+        config (str): Строка конфигурации pytesseract
+        
+    Returns:
+        PyTessBaseAPI: Движок Tesseract
+    """
+    engines = getattr(_tess_local, 'engines', None)
+    if engines is None:
+        engines = _tess_local.engines = {}
+    
+    api = engines.get(config)
+    if api is None:
+        oem, psm, variables = _parse_tesseract_config(config)
+        kwargs = {'lang': 'eng'}
+        if oem is not None:
+            kwargs['oem'] = oem
+        if psm is not None:
+            kwargs['psm'] = psm
+        api = PyTessBaseAPI(**kwargs)
+        for name, value in variables.items():
+            api.SetVariable(name, value)
+        engines[config] = api
+    return api
+
+def _write_ocr_image(image):
+    """
+    Записывает массив во временный файл для pytesseract.
+    
+    pytesseract сохраняет массив во временный PNG (со сжатием) при каждом вызове. Несжатый
+    PGM/PPM в tmpfs записывается почти как memcpy, и tesseract получает готовый путь.
+    
+    Args:
+        image: Изображение
+        
+    Файл удаляет вызывающий код (os.unlink в finally), иначе несжатые страницы
+    копятся в /dev/shm.
+    
+    Returns:
+        str: Путь к файлу или None, если изображение не массив uint8 в оттенках серого/BGR
+    """
+    if isinstance(image, np.ndarray) and image.dtype == np.uint8 and (
+            image.ndim == 2 or (image.ndim == 3 and image.shape[2] == 3)):
+        ext = 'pgm' if image.ndim == 2 else 'ppm'
+        fd, path = tempfile.mkstemp(prefix='ocr_', suffix=f'.{ext}', dir=_OCR_TMP_DIR)
+        os.close(fd)
+        if cv2.imwrite(path, image):
+            return path
+        os.unlink(path)
+    return None
+
+def _set_engine_image(api, image):
+    """
+    Передает изображение движку tesserocr.
+    
+    Args:
+        api (PyTessBaseAPI): Движок Tesseract
+        image: Изображение (numpy array или PIL Image)
+    """
+    if isinstance(image, np.ndarray) and image.dtype == np.uint8 and image.ndim in (2, 3):
+        # Передаем пиксели напрямую: SetImage для PIL-изображения сначала кодирует его
+        # в промежуточный буфер изображения, который затем заново декодирует Leptonica
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+    else:
+        api.SetImage(Image.fromarray(image) if isinstance(image, np.ndarray) else image)
+
+def run_ocr(image, config='', timeout=None):
+    """
+    Распознает текст на изображении через tesserocr, а без него - через pytesseract.
+    
+    Args:
+        image: Изображение (numpy array или PIL Image)
+        config (str): Строка конфигурации Tesseract
+        timeout (int, optional): Таймаут в секундах; прервать можно только отдельный
+            процесс, поэтому с таймаутом всегда используется pytesseract
+            
+    Returns:
+        str: Распознанный текст
+    """
+    if HAS_TESSEROCR and not timeout:
+        api = _get_tess_engine(config)
+        _set_engine_image(api, image)
+        return api.GetUTF8Text()
+    
+    path = _write_ocr_image(image)
+    try:
+        if timeout:
+            return pytesseract.image_to_string(path or image, config=config, timeout=timeout)
+        return pytesseract.image_to_string(path or image, config=config)
+    finally:
+        if path:
+            os.unlink(path)
+
+async def run_ocr_async(image, config='', semaphore=None):
+    """
+    Асинхронный вариант run_ocr: процесс tesseract запускается через asyncio, поэтому
+    несколько изображений распознаются одновременно без отдельного потока на каждое.
+    
+    Args:
+        image (numpy.ndarray): Изображение в оттенках серого или BGR
+        config (str): Строка конфигурации Tesseract
+        semaphore (asyncio.Semaphore, optional): Ограничение числа одновременных процессов
+        
+    Returns:
+        str: Распознанный текст
+    """
+    async with semaphore or contextlib.nullcontext():
+        if HAS_TESSEROCR:
+            # Движок в процессе: подпроцесс не нужен, распознавание в потоке отпускает GIL
+            return await asyncio.to_thread(run_ocr, image, config)
+        
+        # Несжатый PNM передается tesseract через stdin, без временных файлов
+        ok, buf = cv2.imencode('.pgm' if image.ndim == 2 else '.ppm', image)
+        if not ok:
+            raise ValueError("Не удалось закодировать изображение для tesseract")
+        
+        proc = await asyncio.create_subprocess_exec(
+            pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', *_split_tesseract_config(config),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate(buf.tobytes())
+        if proc.returncode != 0:
+            raise RuntimeError(f"tesseract завершился с кодом {proc.returncode}: "
+                               f"{stderr.decode('utf-8', errors='replace').strip()}")
+        return stdout.decode('utf-8', errors='replace')
+
+def _quick_extract_worker(image_path):
+    """
+    Задача пула потоков для TextExtractor.quick_extract_batch.
+    
+    Args:
+        image_path (str): Путь к изображению
+        
+    Returns:
+        tuple: (путь, распознанный текст)
+    """
+    return image_path, TextExtractor._quick_extract_text_uncached(image_path)
+
+# Движок RapidOCR создается при первом обращении (загрузка моделей ONNX занимает время);
+# сессии onnxruntime потокобезопасны, поэтому движок общий для всех потоков
+_onnx_engine = None
+_onnx_engine_lock = threading.Lock()
+
+def run_onnx_ocr(image):
+    """
+    Распознает текст через RapidOCR (детекция и распознавание строк моделями ONNX).
+    
+    Args:
+        image (numpy.ndarray): Изображение в оттенках серого или BGR
+        
+    Returns:
+        str: Распознанный текст, строки разделены переводом строки
+    """
+    global _onnx_engine
+    if _onnx_engine is None:
+        with _onnx_engine_lock:
+            if _onnx_engine is None:
+                _onnx_engine = RapidOCR()
+    
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    result, _ = _onnx_engine(image)
+    if not result:
+        return ""
+    # Каждый элемент результата: [рамка, текст, уверенность]
+    return '\n'.join(item[1] for item in result)
+
+# Столбцы TSV-вывода Tesseract (как в pytesseract.image_to_data)
+_TSV_INT_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                    'left', 'top', 'width', 'height')
+
+def run_ocr_data(image, config=''):
+    """
+    Распознает текст и возвращает данные TSV (номера блоков, абзацев, строк и рамки слов).
+    С tesserocr TSV берется у движка в процессе, без запуска tesseract.
+    
+    Args:
+        image: Изображение (numpy array или PIL Image)
+        config (str): Строка конфигурации Tesseract
+        
+    Returns:
+        dict: Списки значений по столбцам, как pytesseract.Output.DICT
+    """
+    if not HAS_TESSEROCR:
+        return pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+    
+    api = _get_tess_engine(config)
+    _set_engine_image(api, image)
+    data = {column: [] for column in _TSV_INT_COLUMNS + ('conf', 'text')}
+    for row in api.GetTSVText(0).splitlines():
+        values = row.split('\t', 11)
+        if len(values) < 12:
+            continue
+        for column, value in zip(_TSV_INT_COLUMNS, values):
+            data[column].append(int(value))
+        data['conf'].append(float(values[10]))
+        data['text'].append(values[11])
+    return data
+
 class TextExtractor:
     """Handles extraction of text from images using OCR."""
     
-    def __init__(self, tesseract_config='--oem 1 --psm 3'):
+    # Фиксированный набор атрибутов: опечатка в имени конфига даст AttributeError,
+    # а не молчаливый OCR с настройками по умолчанию
+    __slots__ = ('tesseract_config', 'tech_config', 'number_config',
+                 '_last_once', '_last_preprocessed', '_ocr_cache', 'backend')
+    
+    def __init__(self, tesseract_config='--oem 1 --psm 3', backend='tesseract'):
         """
         Initialize the text extractor.
         
         Args:
             tesseract_config (str): Tesseract configuration string
+            backend (str): OCR backend for extract_text: 'tesseract' or 'onnx' (RapidOCR,
+                           requires rapidocr_onnxruntime). Specialized number/technical modes
+                           always use Tesseract, since they rely on character whitelists
         """
         self.tesseract_config = tesseract_config
         
+        if backend == 'onnx' and not HAS_RAPIDOCR:
+            logger.warning("rapidocr_onnxruntime не установлен, используется Tesseract")
+            backend = 'tesseract'
+        self.backend = backend
+        
         # Specific configuration for different content types
-        self.tech_config = '--oem 1 --psm 6 -c tessedit_char_whitelist="0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-+=%()[]{}.:,;/<>*& "' 
-        self.number_config = '--oem 1 --psm 7 -c tessedit_char_whitelist="0123456789.,-+/%"'
+        self.tech_config = TECH_CONFIG
+        self.number_config = NUMBER_CONFIG
+        
+        # Последний результат extract_once: (weakref на изображение, config, результат)
+        self._last_once = None
+        # Последняя обработанная preprocess_page страница: (weakref на изображение, результат)
+        self._last_preprocessed = None
+        # Результаты OCR по (config, форма, хеш пикселей): колонтитулы и повторяющиеся
+        # элементы на разных страницах распознаются один раз
+        self._ocr_cache = {}
         
+    @staticmethod
+    def _is_blank(image):
+        """
+        Check whether an image region is empty or nearly uniform (nothing to recognize).
+        
+        Args:
+            image: Image (numpy array)
+            
+        Returns:
+            bool: True if OCR can be skipped
+        """
+        if image is None or not image.size:
+            return True
+        _, std = cv2.meanStdDev(image)
+        return float(std.max()) < BLANK_STD_THRESHOLD
+    
+    def _run_ocr_cached(self, image, config, timeout=None, source=None):
+        """
+        Run OCR on an image, reusing the result for identical pixels and config.
+        
+        Args:
+            image: Image to process (numpy array)
+            config (str): Tesseract configuration string
+            timeout (int, optional): Timeout in seconds for OCR processing
+            source (str, optional): Already written file with the same image to pass to Tesseract
+            
+        Returns:
+            str: Raw OCR text
+        """
+        if not isinstance(image, np.ndarray):
+            return run_ocr(image, config=config, timeout=timeout)
+        
+        # Хеш только пикселей области (BLAKE2b быстрее MD5 в hashlib), а не всей страницы
+        digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).digest()
+        key = (config, image.shape, digest)
+        text = self._ocr_cache.get(key)
+        if text is None:
+            text = run_ocr(source or image, config=config, timeout=timeout)
+            if len(self._ocr_cache) >= OCR_CACHE_SIZE:
+                self._ocr_cache.clear()
+            self._ocr_cache[key] = text
+        return text
+    
     @staticmethod
     def quick_extract_text(image_path):
         """
         Quickly extract text from an image for duplicate detection.
         Does not use advanced preprocessing to keep it fast.
+        Results are cached by image content hash, so the same image is recognized only once.
+        
+        Args:
+            image_path (str): Path to the image
+            
+        Returns:
+            str: Extracted text
+        """
+        content_hash = compute_file_content_hash(image_path)
+        if content_hash is None:
+            # Файл недоступен - подробную диагностику выполнит основной метод
+            return TextExtractor._quick_extract_text_uncached(image_path)
+        
+        text = _quick_text_cache.get(content_hash)
+        if text is not None:
+            logger.info(f"Текст для {image_path} взят из кеша (то же содержимое уже распознавалось)")
+            return text
+        
+        text = TextExtractor._quick_extract_text_uncached(image_path)
+        # Пустой результат не кешируем: он может быть следствием временной ошибки
+        if text:
+            if len(_quick_text_cache) >= QUICK_TEXT_CACHE_SIZE:
+                _quick_text_cache.clear()
+            _quick_text_cache[content_hash] = text
+        return text
+    
+    @staticmethod
+    def quick_extract_batch(image_paths, workers=None):
+        """
+        Quickly extract text from many images for duplicate detection using a thread pool.
+        Tesseract runs outside the GIL, so threads scale across cores.
+        
+        Args:
+            image_paths (list): Paths to the images
+            workers (int, optional): Number of threads, defaults to CPU count
+            
+        Returns:
+            dict: Extracted text by image path
+        """
+        results = {}
+        keys = {}     # путь -> хеш содержимого
+        pending = {}  # хеш -> первый путь с таким содержимым, который нужно распознать
+        for path in image_paths:
+            # Если файл не прочитать (хеш None), ключом служит сам путь
+            key = compute_file_content_hash(path) or path
+            keys[path] = key
+            
+            text = _quick_text_cache.get(key)
+            if text is not None:
+                results[path] = text
+            else:
+                # Файлы с одинаковым содержимым распознаются один раз
+                pending.setdefault(key, path)
+        
+        paths = list(pending.values())
+        workers = min(workers or os.cpu_count() or 1, len(paths))
+        if workers <= 1:
+            texts = dict(map(_quick_extract_worker, paths))
+        else:
+            # Потоки, а не процессы: fork из многопоточного процесса Flask может зависнуть
+            # на захваченной другим потоком блокировке. Tesseract работает в отдельном
+            # процессе (или в tesserocr с отпущенным GIL), так что потоки загружают все ядра
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                texts = dict(executor.map(_quick_extract_worker, paths))
+        
+        for key, path in pending.items():
+            text = texts.get(path, "")
+            # Пустой результат не кешируем: он может быть следствием временной ошибки
+            if text and key != path:
+                if len(_quick_text_cache) >= QUICK_TEXT_CACHE_SIZE:
+                    _quick_text_cache.clear()
+                _quick_text_cache[key] = text
+        
+        for path in image_paths:
+            if path not in results:
+                results[path] = texts.get(pending[keys[path]], "")
+        return results
+    
+    @staticmethod
+    def quick_extract_list(image_paths, chunk=200):
+        """
+        Quickly extract text from many single-page images with one Tesseract run per chunk.
+        
+        Tesseract получает текстовый файл со списком путей и распознает их одним процессом,
+        без повторной инициализации на каждое изображение. Изображения проходят ту же
+        бинаризацию Оцу, что и в quick_extract_text, и результаты попадают в тот же кеш.
+        Длинные списки делятся на части не больше chunk путей: на очень длинных списках
+        tesseract может зависать. Если число страниц в выводе не совпало с числом файлов
+        (многокадровый TIFF, пропущенный файл), часть распознается по одному файлу.
+        
+        Args:
+            image_paths (list): Paths to the images
+            chunk (int): Max number of images per Tesseract run
+            
+        Returns:
+            list: Extracted text for each image, in the same order
+        """
+        if HAS_TESSEROCR:
+            # Движок уже загружен в процессе, выигрыша от списка нет
+            return [TextExtractor.quick_extract_text(path) for path in image_paths]
+        
+        results = [""] * len(image_paths)
+        hashes = {}
+        indexes = []
+        for i, path in enumerate(image_paths):
+            # Отсутствующий или пустой файл прервал бы распознавание всего списка
+            if not os.path.isfile(path) or os.path.getsize(path) == 0:
+                continue
+            content_hash = compute_file_content_hash(path)
+            text = _quick_text_cache.get(content_hash) if content_hash else None
+            if text is not None:
+                results[i] = text
+            else:
+                hashes[i] = content_hash
+                indexes.append(i)
+        
+        for start in range(0, len(indexes), chunk):
+            part = indexes[start:start + chunk]
+            fallback = []   # файлы, которые распознаются по одному
+            listed = []     # (индекс, временный файл с бинаризованным изображением)
+            try:
+                for i in part:
+                    gray = cv2.imread(image_paths[i], cv2.IMREAD_GRAYSCALE)
+                    if gray is None:
+                        fallback.append(i)
+                    elif not TextExtractor._is_blank(gray):
+                        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+                        path = _write_ocr_image(thresh)
+                        if path:
+                            listed.append((i, path))
+                        else:
+                            fallback.append(i)
+                
+                if listed:
+                    with tempfile.NamedTemporaryFile('w', suffix='.txt', dir=_OCR_TMP_DIR,
+                                                     delete=False) as list_file:
+                        list_file.write('\n'.join(path for _, path in listed) + '\n')
+                    try:
+                        output = pytesseract.image_to_string(list_file.name)
+                    finally:
+                        os.unlink(list_file.name)
+                    
+                    # Tesseract завершает каждую страницу символом form feed
+                    pages = output.split('\x0c')
+                    if pages and not pages[-1].strip():
+                        pages.pop()
+                    if len(pages) == len(listed):
+                        for (i, _), page_text in zip(listed, pages):
+                            results[i] = page_text.strip()
+                    else:
+                        logger.warning(f"Tesseract вернул {len(pages)} страниц для {len(listed)} "
+                                       f"файлов, распознаем по одному")
+                        fallback.extend(i for i, _ in listed)
+            except Exception as e:
+                logger.error(f"Ошибка пакетного распознавания списка файлов: {str(e)}")
+                fallback = part
+            finally:
+                for _, path in listed:
+                    os.unlink(path)
+            
+            for i in fallback:
+                results[i] = TextExtractor._quick_extract_text_uncached(image_paths[i])
+            
+            for i in part:
+                # Пустой результат не кешируем: он может быть следствием временной ошибки
+                if results[i] and hashes[i]:
+                    if len(_quick_text_cache) >= QUICK_TEXT_CACHE_SIZE:
+                        _quick_text_cache.clear()
+                    _quick_text_cache[hashes[i]] = results[i]
+        
+        return results
+    
+    @staticmethod
+    def _quick_extract_text_uncached(image_path):
+        """
+        Run the quick OCR pipeline for quick_extract_text without the cache.
         
         Args:
             image_path (str): Path to the image
@@ -61,18 +662,21 @@ class TextExtractor:
             # Последовательно пробуем разные методы чтения изображения
             # 1. Попытка с OpenCV
             try:
-                # Load image with OpenCV (faster than PIL for this specific use)
-                image = cv2.imread(image_path)
-                if image is not None:
-                    # Convert to grayscale
-                    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                # Load image with OpenCV (faster than PIL for this specific use).
+                # Декодируем сразу в оттенки серого, без промежуточного BGR и cvtColor
+                gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+                if gray is not None:
+                    # Однотонное изображение: распознавать нечего
+                    if TextExtractor._is_blank(gray):
+                        logger.info(f"Изображение пустое, OCR не требуется: {image_path}")
+                        return ""
                     
                     # Simple threshold for faster processing
                     _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
                     
                     # Extract text with default config (faster)
                     logger.info("Используем OpenCV для извлечения текста")
-                    text = pytesseract.image_to_string(thresh)
+                    text = run_ocr(thresh)
                     
                     if text and len(text.strip()) > 0:
                         logger.info(f"Успешно извлечено {len(text.strip())} символов с помощью OpenCV")
@@ -86,11 +690,9 @@ class TextExtractor:
                 
             # 2. Попытка с PIL
             try:
-                from PIL import Image as PILImage
-                
                 logger.info("Используем PIL для извлечения текста")
-                pil_image = PILImage.open(image_path)
-                text = pytesseract.image_to_string(pil_image)
+                pil_image = Image.open(image_path)
+                text = run_ocr(pil_image)
                 
                 if text and len(text.strip()) > 0:
                     logger.info(f"Успешно извлечено {len(text.strip())} символов с помощью PIL")
@@ -128,39 +730,44 @@ class TextExtractor:
             if config is None:
                 config = self.tesseract_config
                 if force_mode == 'aggressive':
-                    # Более агрессивные настройки для сложных случаев
-                    config = '--oem 1 --psm 3 -c tessedit_char_blacklist=|~^`$#@&*{}[]()<>\'\"\\/ -c page_separator=""'
+                    config = AGGRESSIVE_CONFIG
                     logger.info("Используется агрессивный режим OCR")
             
             # Записываем используемую конфигурацию
             logger.info(f"OCR будет выполнен с config: {config} и timeout: {timeout}")
             
-            # Дополнительная предобработка изображения для улучшения OCR
-            processed = img.copy()
-            # Применяем адаптивную бинаризацию
+            # Если это же изображение только что распознано через extract_once с той же
+            # конфигурацией, повторно Tesseract не запускаем
+            if region is None and force_mode != 'aggressive':
+                cached = self._cached_once(img, config)
+                if cached is not None:
+                    logger.info("Используется результат extract_once для этого изображения")
+                    return self._clean_text(cached['text'])
+            
+            # Дополнительная предобработка изображения для улучшения OCR.
+            # Копия не нужна: исходное изображение не изменяется, OpenCV возвращает новые массивы,
+            # а срез региона - это представление без копирования
+            processed = img
+            # Применяем адаптивную бинаризацию ко всей странице (результат кешируется,
+            # поэтому несколько регионов одной страницы обрабатываются одним проходом)
             if force_mode == 'aggressive':
-                processed = cv2.adaptiveThreshold(processed, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                                cv2.THRESH_BINARY, 11, 2)
-                # Увеличиваем контраст
-                alpha = 1.5  # Коэффициент контраста
-                beta = 10    # Яркость
-                processed = cv2.convertScaleAbs(processed, alpha=alpha, beta=beta)
+                processed = self.preprocess_page(img)
             
             # If region specified, extract that part of the image
             if region:
                 x, y, w, h = region
-                roi = processed[y:y+h, x:x+w]
-                # Используем timeout, если он указан
-                if timeout:
-                    text = pytesseract.image_to_string(roi, config=config, timeout=timeout)
-                else:
-                    text = pytesseract.image_to_string(roi, config=config)
+                processed = processed[y:y+h, x:x+w]
+            
+            # Пустой регион не распознаем
+            if self._is_blank(processed):
+                logger.info("Изображение пустое, OCR не требуется")
+                return ""
+            
+            if self.backend == 'onnx':
+                text = run_onnx_ocr(processed)
             else:
                 # Используем timeout, если он указан
-                if timeout:
-                    text = pytesseract.image_to_string(processed, config=config, timeout=timeout)
-                else:
-                    text = pytesseract.image_to_string(processed, config=config)
+                text = self._run_ocr_cached(processed, config, timeout=timeout)
             
             # Логируем информацию о распознавании
             logger.info(f"OCR выполнен с config: {config}")
@@ -175,6 +782,34 @@ class TextExtractor:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return ""
     
+    def preprocess_page(self, page_img):
+        """
+        Binarize and contrast-boost a whole page for aggressive OCR.
+        The result for the last page is kept, so repeated calls for regions of the same page reuse it.
+        
+        Args:
+            page_img: Grayscale page image (numpy array)
+            
+        Returns:
+            numpy.ndarray: Preprocessed page
+        """
+        if self._last_preprocessed is not None:
+            page_ref, processed = self._last_preprocessed
+            if page_ref() is page_img:
+                return processed
+        
+        processed = cv2.adaptiveThreshold(page_img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                          cv2.THRESH_BINARY, 11, 2)
+        # Увеличиваем контраст (таблица эквивалентна convertScaleAbs(alpha=1.5, beta=10)).
+        # Таблица применяется на месте: второй полноразмерный буфер не выделяется
+        cv2.LUT(processed, _CONTRAST_LUT, dst=processed)
+        
+        try:
+            self._last_preprocessed = (weakref.ref(page_img), processed)
+        except TypeError:
+            self._last_preprocessed = None
+        return processed
+    
     def extract_numbers_and_formulas(self, img, region=None):
         """
         Specialized extraction for numbers and formulas.
@@ -194,12 +829,15 @@ class TextExtractor:
                 target_img = roi
             else:
                 target_img = img
+            
+            if self._is_blank(target_img):
+                return ""
                 
             # Use specialized config for numbers
-            text = pytesseract.image_to_string(target_img, config=self.number_config)
+            text = self._run_ocr_cached(target_img, self.number_config)
             
             # Clean up and return
-            text = self._clean_text(text)
+            text = self._fix_numbers(self._clean_text(text))
             return text
             
         except Exception as e:
@@ -225,18 +863,235 @@ class TextExtractor:
                 target_img = roi
             else:
                 target_img = img
+            
+            if self._is_blank(target_img):
+                return ""
                 
             # Use specialized config for technical content
-            text = pytesseract.image_to_string(target_img, config=self.tech_config)
+            text = self._run_ocr_cached(target_img, self.tech_config)
             
             # Clean up and return
-            text = self._clean_text(text)
+            text = self._fix_numbers(self._clean_text(text))
             return text
             
         except Exception as e:
             logger.error(f"Error extracting technical content: {str(e)}")
             return ""
     
+    async def extract_text_async(self, img, config=None, semaphore=None):
+        """
+        Asynchronously extract text from an image.
+        
+        Args:
+            img: Image to process (numpy array)
+            config (str, optional): Specific tesseract configuration to use
+            semaphore (asyncio.Semaphore, optional): Limits concurrent Tesseract processes
+            
+        Returns:
+            str: Extracted text
+        """
+        if config is None:
+            config = self.tesseract_config
+        
+        if self._is_blank(img):
+            return ""
+        
+        try:
+            text = await run_ocr_async(img, config=config, semaphore=semaphore)
+            return self._clean_text(text)
+        except Exception as e:
+            logger.error(f"Error extracting text: {str(e)}")
+            return ""
+    
+    def extract_batch(self, imgs, config=None, concurrency=None):
+        """
+        Extract text from several images, running Tesseract processes concurrently via asyncio.
+        
+        Нельзя вызывать из уже работающего цикла событий - там следует использовать
+        extract_text_async напрямую.
+        
+        Args:
+            imgs (list): Images to process (numpy arrays)
+            config (str, optional): Specific tesseract configuration to use
+            concurrency (int, optional): Max concurrent processes, defaults to OCR_CONCURRENCY
+            
+        Returns:
+            list: Extracted text for each image, in the same order
+        """
+        async def extract_all():
+            semaphore = asyncio.Semaphore(concurrency or OCR_CONCURRENCY)
+            return await asyncio.gather(
+                *(self.extract_text_async(img, config=config, semaphore=semaphore) for img in imgs)
+            )
+        
+        return list(asyncio.run(extract_all()))
+    
+    def extract_numbers_and_technical(self, img, region=None):
+        """
+        Extract numerical and technical content from the same image or region.
+        Без tesserocr изображение записывается для Tesseract один раз и распознается
+        с обеими конфигурациями.
+        
+        Args:
+            img: Image to process
+            region (tuple, optional): Region to extract from (x, y, w, h)
+            
+        Returns:
+            tuple: (numerical content, technical content)
+        """
+        try:
+            target_img = img
+            if region:
+                x, y, w, h = region
+                target_img = img[y:y+h, x:x+w]
+            
+            if self._is_blank(target_img):
+                return "", ""
+            
+            source = None if HAS_TESSEROCR else _write_ocr_image(target_img)
+            try:
+                numbers = self._run_ocr_cached(target_img, self.number_config, source=source)
+                technical = self._run_ocr_cached(target_img, self.tech_config, source=source)
+            finally:
+                if source:
+                    os.unlink(source)
+            
+            return self._fix_numbers(self._clean_text(numbers)), self._fix_numbers(self._clean_text(technical))
+            
+        except Exception as e:
+            logger.error(f"Error extracting numbers and technical content: {str(e)}")
+            return "", ""
+    
+    def extract_text_batch(self, rois, config=None):
+        """
+        Extract text from several images (e.g. regions of a page) in one Tesseract run.
+        
+        Без tesserocr каждый вызов pytesseract запускает отдельный процесс tesseract и заново
+        загружает модель, поэтому изображения сохраняются во временный каталог и передаются
+        одному процессу списком файлов.
+        
+        Args:
+            rois (list): Images to process (numpy arrays)
+            config (str, optional): Specific tesseract configuration to use
+            
+        Returns:
+            list: Extracted text for each image, in the same order
+        """
+        if config is None:
+            config = self.tesseract_config
+        
+        results = [""] * len(rois)
+        try:
+            if HAS_TESSEROCR:
+                # Движок уже загружен в процессе, отдельный запуск на каждое изображение ничего не стоит
+                for i, roi in enumerate(rois):
+                    if not self._is_blank(roi):
+                        results[i] = self._clean_text(run_ocr(roi, config=config))
+                return results
+            
+            with tempfile.TemporaryDirectory(prefix='ocr_batch_') as tmp_dir:
+                indexes = []
+                paths = []
+                for i, roi in enumerate(rois):
+                    if self._is_blank(roi):
+                        continue
+                    path = os.path.join(tmp_dir, f"{i}.png")
+                    if cv2.imwrite(path, roi):
+                        indexes.append(i)
+                        paths.append(path)
+                
+                if not paths:
+                    return results
+                
+                list_path = os.path.join(tmp_dir, 'list.txt')
+                with open(list_path, 'w') as f:
+                    f.write('\n'.join(paths) + '\n')
+                
+                # Tesseract завершает каждую страницу многостраничного результата символом form feed
+                output = pytesseract.image_to_string(list_path, config=config)
+                pages = output.split('\x0c')
+                if pages and not pages[-1].strip():
+                    pages.pop()
+                if len(pages) == len(indexes):
+                    for i, page_text in zip(indexes, pages):
+                        results[i] = self._clean_text(page_text)
+                else:
+                    # Страницы не сопоставить с областями - распознаем каждую отдельно
+                    logger.warning(f"Tesseract вернул {len(pages)} страниц для {len(indexes)} областей, "
+                                   f"распознаем по одной")
+                    for i in indexes:
+                        results[i] = self._clean_text(run_ocr(rois[i], config=config))
+            
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error extracting text batch: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return results
+    
+    def extract_text_regions(self, img, regions, config=None):
+        """
+        Extract text from several regions of one image in one Tesseract run.
+        
+        Args:
+            img: Image to process
+            regions (list): Regions to extract text from, each (x, y, w, h)
+            config (str, optional): Specific tesseract configuration to use
+            
+        Returns:
+            list: Extracted text for each region, in the same order
+        """
+        rois = [img[y:y+h, x:x+w] for x, y, w, h in regions]
+        return self.extract_text_batch(rois, config=config)
+    
+    def extract_text_parallel(self, rois, config=None):
+        """
+        Extract text from several images concurrently on the shared OCR thread pool.
+        
+        Tesseract работает в C++ и отпускает GIL (а pytesseract ждет подпроцесс),
+        поэтому потоки действительно распознают изображения параллельно. Пул общий
+        (OCR_MAX_THREADS потоков), так что движки tesserocr переиспользуются между вызовами.
+        
+        Args:
+            rois (list): Images to process (numpy arrays)
+            config (str, optional): Specific tesseract configuration to use
+            
+        Returns:
+            list: Extracted text for each image, in the same order
+        """
+        if config is None:
+            config = self.tesseract_config
+        
+        def ocr_one(roi):
+            if self._is_blank(roi):
+                return ""
+            try:
+                return self._clean_text(run_ocr(roi, config=config))
+            except Exception as e:
+                logger.error(f"Error extracting text: {str(e)}")
+                return ""
+        
+        return list(_get_ocr_executor().map(ocr_one, rois))
+    
+    def extract_batch_threaded(self, imgs, regions=None):
+        """
+        Run extract_text for several images concurrently on the shared OCR thread pool.
+        
+        Потоки ждут подпроцесс tesseract (или нативный код tesserocr без GIL), поэтому пул
+        потоков загружает все ядра без сериализации изображений между процессами.
+        
+        Args:
+            imgs (list): Images to process
+            regions (list, optional): Region (x, y, w, h) or None for each image
+            
+        Returns:
+            list: Extracted text for each image, in the same order
+        """
+        if regions is None:
+            regions = [None] * len(imgs)
+        
+        return list(_get_ocr_executor().map(self.extract_text, imgs, regions))
+    
     def _clean_text(self, text):
         """
         Clean up extracted text.
@@ -251,44 +1106,99 @@ class TextExtractor:
             return ""
             
         # Remove unnecessary whitespace
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r' +', ' ', text)
-        
-        # Fix common OCR errors
-        text = text.replace('|', 'I')  # Pipe to I
-        text = text.replace('l', 'l')  # Lowercase L cleanup
+        text = _RE_WHITESPACE.sub(' ', text)
         
         # Fix spacing around punctuation
-        text = re.sub(r'\s+([.,;:!?)])', r'\1', text)
-        text = re.sub(r'([({[])\s+', r'\1', text)
+        text = _RE_SPACE_BEFORE_PUNCT.sub(r'\1', text)
+        text = _RE_SPACE_AFTER_OPEN.sub(r'\1', text)
         
         # УЛУЧШЕНО: Сохраняем кириллицу и другие символы Unicode
         # Удаляем только непечатаемые управляющие символы и некоторые спецсимволы
         # Вместо удаления всех не-ASCII символов, которое было реализовано ранее
-        text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)  # Управляющие символы
-        
-        # Удаление проблемных символов, заменяющихся на '■' в PDF
-        text = re.sub(r'[■□▪▫◾◽◼◻]', '', text)
-        
-        # Remove lines with excessive special characters (not alphanumeric and not Cyrillic)
-        lines = text.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            # Если строка не состоит только из специальных символов
-            if not re.match(r'^[^\w\s\u0400-\u04FF]+$', line):
-                cleaned_lines.append(line)
-            elif len(line.strip()) < 3:  # Очень короткая строка тоже игнорируется
+        # Управляющие символы и символы, заменяющиеся на '■' в PDF, удаляются, а частая ошибка
+        # OCR '|' исправляется на 'I' - все за один проход (на пробелы вокруг пунктуации
+        # выше '|' не влияет, поэтому замену можно выполнить здесь)
+        text = text.translate(_CLEAN_CHARS_TABLE)
+        
+        # Remove lines with excessive special characters (not alphanumeric and not Cyrillic).
+        # Посимвольный подсчет доли спецсимволов не нужен: проверка выполнялась только для строк,
+        # целиком состоящих из спецсимволов, где доля всегда 100% и строка всегда отбрасывалась.
+        # Такие строки удаляются одним проходом регулярного выражения, без split/join
+        return _RE_SPECIAL_ONLY_LINE.sub('', text).strip()
+    
+    @staticmethod
+    def _fix_numbers(text):
+        """
+        Fix typical OCR errors inside numbers: spaces between thousands groups and 'O' read instead of zero.
+        Применяется только к результатам специализированных режимов (числа, формулы, технический
+        текст): в обычном тексте книги числа через пробел (например, размеры блайндов) значимы.
+        
+        Args:
+            text (str): Cleaned OCR text
+            
+        Returns:
+            str: Text with fixed numbers
+        """
+        if not text:
+            return text
+        text = _RE_SPACE_IN_NUM.sub(lambda m: m.group().replace(' ', ''), text)
+        return _RE_O_IN_NUM.sub('0', text)
+    
+    def _cached_once(self, img, config):
+        """Возвращает сохраненный результат extract_once для того же изображения и конфигурации"""
+        if self._last_once is not None:
+            img_ref, cached_config, result = self._last_once
+            if img_ref() is img and cached_config == config:
+                return result
+        return None
+    
+    def extract_once(self, img, config=None):
+        """
+        Run Tesseract once and derive plain text, paragraphs and word boxes from the same result.
+        
+        Args:
+            img: Image to process (numpy array)
+            config (str, optional): Specific tesseract configuration to use
+            
+        Returns:
+            dict: {'text': str, 'paragraphs': list, 'boxes': list of (word, (x, y, w, h))}
+        """
+        if config is None:
+            config = self.tesseract_config
+        
+        cached = self._cached_once(img, config)
+        if cached is not None:
+            return cached
+        
+        data = run_ocr_data(img, config=config)
+        
+        # Один проход по записям TSV: строки, абзацы (block, par) и рамки слов
+        lines = {}
+        words_by_paragraph = {}
+        boxes = []
+        rows = zip(data['text'], data['block_num'], data['par_num'], data['line_num'],
+                   data['left'], data['top'], data['width'], data['height'])
+        for word, block_num, par_num, line_num, left, top, width, height in rows:
+            word = word.strip()
+            if not word:
                 continue
-            else:
-                # Считаем процент спецсимволов (не алфавитно-цифровых, не пробельных и не кириллических)
-                special_chars = sum(1 for c in line if not re.match(r'[\w\s\u0400-\u04FF]', c))
-                total_chars = len(line)
-                
-                # Сохраняем строку, если специальных символов меньше 40%
-                if total_chars > 0 and special_chars / total_chars < 0.4:
-                    cleaned_lines.append(line)
+            paragraph_key = (block_num, par_num)
+            lines.setdefault((block_num, par_num, line_num), []).append(word)
+            words_by_paragraph.setdefault(paragraph_key, []).append(word)
+            boxes.append((word, (left, top, width, height)))
         
-        return '\n'.join(cleaned_lines).strip()
+        result = {
+            'text': '\n'.join(' '.join(words) for words in lines.values()),
+            'paragraphs': [' '.join(words) for words in words_by_paragraph.values()],
+            'boxes': boxes
+        }
+        
+        try:
+            self._last_once = (weakref.ref(img), config, result)
+        except TypeError:
+            # Объект не поддерживает слабые ссылки - просто не кешируем
+            self._last_once = None
+        return result
     
     def extract_structured_text(self, img):
         """
@@ -301,32 +1211,9 @@ class TextExtractor:
             dict: Structure with text elements
         """
         try:
-            # Use Tesseract's hOCR output to get structure
-            hocr = pytesseract.image_to_pdf_or_hocr(
-                img, extension='hocr', config=self.tesseract_config
-            )
-            
-            # Parse hOCR to extract structured text
-            # This is simplified - full parsing would be more complex
-            paragraphs = []
-            current_paragraph = []
-            
-            # Simple parsing of hOCR output
-            for line in hocr.decode('utf-8').split('\n'):
-                if 'ocr_line' in line:
-                    # Extract text from line
-                    text_match = re.search(r'>\s*(.*?)\s*<', line)
-                    if text_match:
-                        text = text_match.group(1).strip()
-                        if text:
-                            current_paragraph.append(text)
-                elif 'ocr_par' in line and current_paragraph:
-                    paragraphs.append(' '.join(current_paragraph))
-                    current_paragraph = []
-            
-            # Don't forget the last paragraph
-            if current_paragraph:
-                paragraphs.append(' '.join(current_paragraph))
+            # Tesseract сам разбирает структуру и отдает TSV с номерами блоков и абзацев
+            # для каждого слова; тот же результат затем переиспользует extract_text
+            paragraphs = self.extract_once(img)['paragraphs']
             
             return {'paragraphs': paragraphs}
             
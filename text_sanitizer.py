@@ -7,6 +7,25 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Регулярные выражения компилируются один раз при загрузке модуля
+# Удаляемые символы одним классом: квадраты/черные символы, которые часто используются
+# как заполнители, непечатаемые управляющие символы и невидимые разделители
+_RE_STRIP_ALL = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F\u200B-\u200F\u2028-\u202E■□▪▫◾◽◼◻]')
+# Для ASCII-текста из этого класса возможны только управляющие символы
+_RE_STRIP_ASCII = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+# Все, кроме латиницы, кириллицы, цифр и основной пунктуации
+_RE_NON_BASIC = re.compile(r'[^a-zA-Z0-9\u0400-\u04FF\s.,;:!?\'\"()\-]')
+_RE_WS = re.compile(r'\s+')
+
+# Зарезервированные символы XML (требуется ReportLab)
+_XML_ESCAPE_TABLE = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    "'": '&apos;',
+})
+
 def sanitize_text_for_pdf(text):
     """
     Sanitize text for PDF generation, replacing problematic characters.
@@ -20,31 +39,21 @@ def sanitize_text_for_pdf(text):
     if not text:
         return ""
         
-    # Normalize unicode characters to their closest representation
-    text = unicodedata.normalize('NFKC', text)
-    
-    # Replace common problem characters
-    # Replace square/black characters often used as placeholders
-    text = re.sub(r'[■□▪▫◾◽◼◻]', '', text)
-    
-    # Replace unprintable control characters
-    text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F]', '', text)
-    
-    # Replace invisible separator characters
-    text = re.sub(r'[\u200B-\u200F\u2028-\u202E]', '', text)
+    if text.isascii():
+        # ASCII-текст NFKC не меняет, а квадратов и невидимых разделителей в нем нет -
+        # удаляем только управляющие символы
+        text = _RE_STRIP_ASCII.sub('', text)
+    else:
+        # Normalize unicode characters to their closest representation
+        text = unicodedata.normalize('NFKC', text)
+        
+        # Replace common problem characters: square/black placeholder characters,
+        # unprintable control characters and invisible separators in a single pass
+        text = _RE_STRIP_ALL.sub('', text)
     
     # Create XML-safe text (required by ReportLab)
-    # Replace reserved XML characters
-    replacements = {
-        '&': '&amp;',
-        '<': '&lt;',
-        '>': '&gt;',
-        '"': '&quot;',
-        "'": '&apos;',
-    }
-    
-    for char, replacement in replacements.items():
-        text = text.replace(char, replacement)
+    # Replace reserved XML characters in a single pass ('&' of inserted entities is not re-escaped)
+    text = text.translate(_XML_ESCAPE_TABLE)
     
     # Check if any text remains after cleaning
     if not text.strip():
@@ -72,10 +81,10 @@ def aggressive_text_cleanup(text):
     
     # Step 2: Keep only basic Latin alphabet, Cyrillic characters, numbers, and common punctuation
     # This is a fallback for serious encoding issues
-    text = re.sub(r'[^a-zA-Z0-9\u0400-\u04FF\s.,;:!?\'\"()\-]', '', text)
+    text = _RE_NON_BASIC.sub('', text)
     
     # Step 3: Remove excess whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = _RE_WS.sub(' ', text).strip()
     
     if not text:
         return "Text content could not be processed due to encoding issues."
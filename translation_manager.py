@@ -3,15 +3,177 @@
 Module for managing translations using OpenAI.
 """
 import os
+import asyncio
+import atexit
+import hashlib
 import logging
 import re
 import json
+import threading
 import time
+import weakref
 import openai
 
+# orjson сериализует и разбирает JSON на C в несколько раз быстрее стандартного json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Кеш подготовленного к переводу текста: колонтитулы, подписи и номера страниц
+# повторяются от страницы к странице, а регулярные выражения глоссария дорогие
+CLEAN_TEXT_CACHE_SIZE = 4096
+_clean_text_cache = {}
+
+def _cache_entry_bytes(key, value):
+    """
+    Serialize a cache entry as one journal line.
+    
+    Args:
+        key (str): Cache key
+        value (str): Cached value
+        
+    Returns:
+        bytes: JSON line in UTF-8
+    """
+    entry = {"k": key, "v": value}
+    try:
+        if HAS_ORJSON:
+            return orjson.dumps(entry) + b"\n"
+        return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+    except (TypeError, UnicodeEncodeError):
+        # Одиночные суррогаты не кодируются в UTF-8 - такую строку json экранирует
+        return (json.dumps(entry) + "\n").encode("ascii")
+
+def _json_loads(data):
+    """
+    Parse JSON from bytes or str.
+    
+    Args:
+        data (bytes): JSON document
+        
+    Returns:
+        Parsed object
+    """
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Экранированные одиночные суррогаты разбирает только стандартный json
+            pass
+    return json.loads(data)
+
+# Живые менеджеры с кешем на диске. processing_service создает менеджер на каждую задачу,
+# поэтому обработчик atexit один на модуль, а не отдельный на каждый менеджер
+_live_managers = weakref.WeakSet()
+
+@atexit.register
+def _compact_cache_at_exit():
+    """Сжимает журналы кеша переводов еще существующих менеджеров при завершении процесса."""
+    for manager in list(_live_managers):
+        if manager._cache_lines > 2 * len(manager.cache):
+            manager._compact_cache()
+
+class _TruncatedResponseError(Exception):
+    """The response was cut off at max_tokens even with the largest allowed budget."""
+
+class _RateLimiter:
+    """
+    Token bucket for the OpenAI requests-per-minute and tokens-per-minute limits.
+    
+    Запрос заранее резервирует место в обоих ведрах и ждет ровно столько, сколько нужно
+    для их пополнения, поэтому лимит не превышается и 429 почти не возникает. На ответ 429
+    пропускная способность снижается на 20% и постепенно восстанавливается.
+    """
+    
+    def __init__(self, max_requests_per_minute, max_tokens_per_minute):
+        self.rpm_capacity = float(max_requests_per_minute)
+        self.tpm_capacity = float(max_tokens_per_minute)
+        self._requests = self.rpm_capacity
+        self._tokens = self.tpm_capacity
+        self._scale = 1.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self, tokens):
+        """Reserve one request and `tokens` tokens; returns the delay in seconds before sending."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            rpm = self.rpm_capacity * self._scale
+            tpm = self.tpm_capacity * self._scale
+            self._requests = min(rpm, self._requests + elapsed * rpm / 60)
+            self._tokens = min(tpm, self._tokens + elapsed * tpm / 60)
+            # Запрос больше всего ведра иначе не дождался бы своей очереди
+            self._requests -= 1
+            self._tokens -= min(tokens, tpm)
+            return max(0.0, -self._requests * 60 / rpm, -self._tokens * 60 / tpm)
+    
+    def acquire(self, tokens):
+        """Block until a request of `tokens` tokens fits into the limits."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+    
+    async def aacquire(self, tokens):
+        """Async variant of acquire: waits without blocking the event loop."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    def penalize(self):
+        """Tighten the limits by 20% after a 429 response."""
+        with self._lock:
+            self._scale = max(0.2, self._scale * 0.8)
+    
+    def record_success(self):
+        """Gradually restore the limits after successful requests."""
+        if self._scale < 1.0:
+            with self._lock:
+                self._scale = min(1.0, self._scale + 0.02)
+    
+    def record_error(self, error):
+        """Tighten the limits if the request failed because of rate limiting."""
+        if isinstance(error, openai.RateLimitError):
+            self.penalize()
+    
+    def set_limits(self, max_requests_per_minute, max_tokens_per_minute):
+        """Change the bucket capacities (the current fill level is kept)."""
+        with self._lock:
+            self.rpm_capacity = float(max_requests_per_minute)
+            self.tpm_capacity = float(max_tokens_per_minute)
+
+# Лимиты RPM/TPM относятся ко всему аккаунту OpenAI, а processing_service создает
+# менеджер на каждую задачу, поэтому ограничитель один на процесс
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+def _get_shared_limiter(max_requests_per_minute, max_tokens_per_minute):
+    """
+    Return the process-wide rate limiter, creating it on first use.
+    
+    Args:
+        max_requests_per_minute (int): OpenAI requests-per-minute limit of the account
+        max_tokens_per_minute (int): OpenAI tokens-per-minute limit of the account
+        
+    Returns:
+        _RateLimiter: Limiter shared by all TranslationManager instances
+    """
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = _RateLimiter(max_requests_per_minute, max_tokens_per_minute)
+        elif (_shared_limiter.rpm_capacity, _shared_limiter.tpm_capacity) != (
+                float(max_requests_per_minute), float(max_tokens_per_minute)):
+            # Лимиты аккаунта одни: действуют последние переданные значения
+            _shared_limiter.set_limits(max_requests_per_minute, max_tokens_per_minute)
+        return _shared_limiter
+
 class TranslationManager:
     """Handles translation from English to Russian using OpenAI API."""
     
@@ -56,7 +218,60 @@ class TranslationManager:
         "Average Enumerated Value": "Average Enumerated Value (среднее перечисляемое значение)",
     }
     
-    def __init__(self, openai_api_key=None, target_language='ru', cache_dir=None):
+    # Все термины глоссария одним выражением (длинные первыми): вхождения всех терминов
+    # находятся за один проход по тексту, а не отдельным поиском для каждого термина
+    _GLOSSARY_RE = re.compile(
+        r'\b(?:' + '|'.join(map(re.escape, sorted(POKER_GLOSSARY, key=len, reverse=True))) + r')\b',
+        re.IGNORECASE
+    )
+    # Термин глоссария по найденному тексту в нижнем регистре
+    _GLOSSARY_BY_LOWER = {term.lower(): term for term in POKER_GLOSSARY}
+    # Варианты написания терминов, исправляемые после перевода (нижний и верхний регистр,
+    # как в глоссарии), одним выражением целых слов
+    _POST_TERM_VARIANTS = {variant: term for term in POKER_GLOSSARY
+                           for variant in (term.lower(), term.upper(), term)}
+    _POST_TERM_RE = re.compile(
+        r'\b(?:' + '|'.join(map(re.escape, sorted(_POST_TERM_VARIANTS, key=len, reverse=True))) + r')\b'
+    )
+    # Последовательность SWASED ECD CEE ..., часто встречающаяся в покерной литературе
+    _SWASED_RE = re.compile(r'\bSWASED\s+ECD\s+CEE(?:\s+Eo)?(?:\s+ea)?(?:\s+Fn)?(?:\s+i)?(?:\s+Do)?(?:\s+CD)?\b')
+    # Последовательность аббревиатур из заглавных букв
+    _ABBR_SEQUENCE_RE = re.compile(r'\b([A-Z]{2,}(?:\s+[A-Z]{2,})+)\b')
+    # Спецсимвол: не буква/цифра и не пробельный символ (то же, что
+    # not c.isalnum() and not c.isspace(), но проверка выполняется в C)
+    _SPECIAL_CHAR_RE = re.compile(r'[^\w\s]|_')
+    # Символ, повторенный 4 и более раз подряд
+    _REPEATED_CHAR_RE = re.compile(r'(.)\1{3,}')
+    # Постобработка перевода
+    _SPACE_BEFORE_PUNCT_RE = re.compile(r'\s+([.,;:!?)])')
+    _SPACE_AFTER_OPEN_RE = re.compile(r'([({[])(?=\S)')
+    _TERM_PAREN_RE = re.compile(r'([A-Za-z][A-Za-z0-9\s\-\_]+)\s*\(([^)]+)\)')
+    _UNDERSCORE_WORD_RE = re.compile(r'(\w)_(\w)')
+    _CONTROL_CHAR_RE = re.compile(r'[\x00-\x1F\x7F-\x9F]')
+    _MULTI_SPACE_RE = re.compile(r' {2,}')
+    # Признаки испорченного OCR: непечатные символы (кроме переводов строк и табуляции)
+    # и символы, в которые обычно распознаются вертикальные линии и шум
+    _OCR_GARBAGE_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F|¦§]')
+    # Разделитель элементов пакетного запроса (ячейки таблицы переводятся одним запросом)
+    _BATCH_ITEM_RE = re.compile(r'^### ITEM (\d+) ###[ \t]*$', re.MULTILINE)
+    # Максимальный объем исходного текста в одном пакетном запросе
+    BATCH_MAX_CHARS = 3000
+    # Размер части (в символах), на которые делятся длинные тексты
+    CHUNK_SIZE = 1800
+    # Ключ кеша: 16-байтовый дайджест BLAKE2b в hex (см. _cache_key)
+    _CACHE_KEY_RE = re.compile(r'[0-9a-f]{32}')
+    # Наибольший max_tokens для повторного запроса, если ответ обрезан (предел ответа gpt-4o)
+    MAX_RESPONSE_TOKENS = 16384
+    # Системные сообщения запросов к OpenAI
+    _TRANSLATE_SYSTEM_PROMPT = "Вы специалист по переводу текстов по покеру с английского на русский."
+    _IMPROVE_SYSTEM_PROMPT = "You are an expert at correcting OCR errors in English poker texts. Do not translate the text."
+    _BATCH_SYSTEM_PROMPT = ("Вы специалист по переводу текстов по покеру с английского на русский. "
+                            "Переводите каждый блок ### ITEM N ### отдельно и сохраняйте "
+                            "строки-разделители ### ITEM N ### без изменений.")
+    
+    
+    def __init__(self, openai_api_key=None, target_language='ru', cache_dir=None, max_concurrent=8,
+                 max_requests_per_minute=500, max_tokens_per_minute=30000):
         """
         Initialize translation manager.
         
@@ -64,17 +279,37 @@ class TranslationManager:
             openai_api_key (str): OpenAI API key
             target_language (str): Target language for translations (default: ru)
             cache_dir (str): Directory for caching translations
+            max_concurrent (int): Max concurrent OpenAI requests in translate_document
+            max_requests_per_minute (int): OpenAI requests-per-minute limit of the account
+            max_tokens_per_minute (int): OpenAI tokens-per-minute limit of the account
         """
         self.target_language = target_language
+        self.max_concurrent = max_concurrent
         self.cache = {}
         self.cache_dir = cache_dir
+        # Кеш хранится журналом JSONL: новая запись дописывается одной строкой, а не
+        # перезаписью всего файла. Число строк журнала нужно, чтобы решать, когда его сжимать
+        self._cache_file = None
+        self._cache_lines = 0
+        self._cache_lock = threading.Lock()
+        # Ограничитель частоты общий для синхронных и асинхронных запросов всех менеджеров
+        self._limiter = _get_shared_limiter(max_requests_per_minute, max_tokens_per_minute)
         
         # Setup OpenAI API
         self.openai_api_key = openai_api_key
+        # Один клиент на весь менеджер: пул соединений и TLS-сессии переиспользуются
+        # между запросами, а не создаются заново на каждый вызов
+        self._client = None
         if openai_api_key:
             try:
                 # Try to use new API client
                 openai.api_key = openai_api_key
+                try:
+                    self._client = openai.OpenAI(api_key=openai_api_key)
+                except TypeError:
+                    # Fallback для случаев когда proxies вызывает ошибку
+                    self._client = openai.OpenAI()
+                    self._client.api_key = openai_api_key
                 # Test if API key is valid
                 self._test_openai_connection()
             except Exception as e:
@@ -86,6 +321,8 @@ class TranslationManager:
             
         # Load existing cache if available
         self._load_cache()
+        if self.cache_dir:
+            _live_managers.add(self)
     
     def _test_openai_connection(self):
         """
@@ -95,10 +332,7 @@ class TranslationManager:
             bool: True if connection works, False otherwise
         """
         try:
-            # Создаем клиента OpenAI без лишних параметров
-            client = openai.OpenAI(api_key=self.openai_api_key)
-                
-            response = client.chat.completions.create(
+            response = self._client.chat.completions.create(
                 model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant."},
@@ -116,29 +350,233 @@ class TranslationManager:
         """Load translation cache from disk if available."""
         if not self.cache_dir:
             return
-            
-        cache_file = os.path.join(self.cache_dir, 'translation_cache.json')
-        if os.path.exists(cache_file):
+        
+        # Старый формат: весь кеш одним JSON-объектом
+        legacy_file = os.path.join(self.cache_dir, 'translation_cache.json')
+        if os.path.exists(legacy_file):
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    self.cache = json.load(f)
-                logger.info(f"Loaded {len(self.cache)} cached translations")
+                with open(legacy_file, 'rb') as f:
+                    self.cache = _json_loads(f.read())
             except Exception as e:
                 logger.error(f"Error loading translation cache: {str(e)}")
                 self.cache = {}
+        
+        cache_file = os.path.join(self.cache_dir, 'translation_cache.jsonl')
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    for line in f:
+                        self._cache_lines += 1
+                        try:
+                            entry = _json_loads(line)
+                        except ValueError:
+                            # Недописанная строка (например, после сбоя) пропускается
+                            continue
+                        # Более поздняя запись с тем же ключом заменяет раннюю
+                        self.cache[entry['k']] = entry['v']
+            except Exception as e:
+                logger.error(f"Error loading translation cache: {str(e)}")
+        
+        if self.cache:
+            logger.info(f"Loaded {len(self.cache)} cached translations")
+        
+        # Старые ключи содержали весь исходный текст ("purpose:text") или hash(text), который
+        # различается между процессами. Первые пересчитываются в новый формат, вторые
+        # восстановить нельзя, и они удаляются
+        migrated = False
+        if not all(self._CACHE_KEY_RE.fullmatch(key) for key in self.cache):
+            migrated = True
+            cache = {}
+            for key, value in self.cache.items():
+                if self._CACHE_KEY_RE.fullmatch(key):
+                    cache[key] = value
+                elif not key.startswith('improve_en_') and ':' in key:
+                    purpose, text = key.split(':', 1)
+                    cache[self._cache_key(purpose, text)] = value
+            self.cache = cache
+        
+        # Журнал переписывается из памяти, если в нем накопилось много устаревших записей
+        # или кеш еще хранится в старом формате
+        if migrated or os.path.exists(legacy_file) or self._cache_lines > 2 * len(self.cache):
+            self._compact_cache()
+            if os.path.exists(legacy_file) and self._cache_lines == len(self.cache):
+                os.remove(legacy_file)
+    
+    @staticmethod
+    def _cache_key(purpose, text):
+        """
+        Build a compact deterministic cache key for a text.
+        
+        Args:
+            purpose (str): Purpose of the cached result (translation, improve_en, ...)
+            text (str): Source text
+            
+        Returns:
+            str: 32-character hex digest
+        """
+        return hashlib.blake2b((purpose + "\x00" + text).encode("utf-8"), digest_size=16).hexdigest()
     
-    def _save_cache(self):
-        """Save translation cache to disk."""
+    def _append_cache(self, key, value):
+        """
+        Add an entry to the cache and append it to the cache journal on disk.
+        
+        Args:
+            key (str): Cache key
+            value (str): Cached value
+        """
+        self.cache[key] = value
         if not self.cache_dir:
             return
-            
-        cache_file = os.path.join(self.cache_dir, 'translation_cache.json')
+        
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            line = _cache_entry_bytes(key, value)
+            with self._cache_lock:
+                if self._cache_file is None:
+                    # Без буферизации: каждая запись сразу попадает в файл одним вызовом write
+                    self._cache_file = open(os.path.join(self.cache_dir, 'translation_cache.jsonl'),
+                                            'ab', buffering=0)
+                self._cache_file.write(line)
+                self._cache_lines += 1
         except Exception as e:
             logger.error(f"Error saving translation cache: {str(e)}")
     
+    def _compact_cache(self):
+        """Rewrite the cache journal from memory, dropping superseded entries."""
+        if not self.cache_dir:
+            return
+        
+        cache_file = os.path.join(self.cache_dir, 'translation_cache.jsonl')
+        try:
+            with self._cache_lock:
+                if self._cache_file is not None:
+                    self._cache_file.close()
+                    self._cache_file = None
+                # Запись во временный файл и атомарная замена: сбой посреди записи
+                # не оставит усеченный журнал
+                tmp_file = cache_file + '.tmp'
+                with open(tmp_file, 'wb') as f:
+                    f.writelines(_cache_entry_bytes(key, value) for key, value in self.cache.items())
+                os.replace(tmp_file, cache_file)
+                self._cache_lines = len(self.cache)
+        except Exception as e:
+            logger.error(f"Error saving translation cache: {str(e)}")
+    
+    @staticmethod
+    def _completion_kwargs(system_prompt, prompt, max_tokens):
+        """Arguments of chat.completions.create for one request."""
+        return dict(
+            model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.1
+        )
+    
+    @classmethod
+    def _grow_max_tokens(cls, response, max_tokens):
+        """
+        Check whether a response was cut off at max_tokens.
+        
+        Args:
+            response: chat.completions.create response
+            max_tokens (int): Budget the request was sent with
+            
+        Returns:
+            int: Larger budget to repeat the request with, or None if the response is complete
+            
+        Raises:
+            _TruncatedResponseError: The response is cut off even at MAX_RESPONSE_TOKENS
+        """
+        if response.choices[0].finish_reason != 'length':
+            return None
+        if max_tokens >= cls.MAX_RESPONSE_TOKENS:
+            raise _TruncatedResponseError(f"Response truncated at max_tokens={max_tokens}")
+        logger.warning(f"Response truncated at max_tokens={max_tokens}, repeating with a larger budget")
+        return min(cls.MAX_RESPONSE_TOKENS, max_tokens * 2)
+    
+    def _request_completion(self, system_prompt, prompt, max_tokens, retry_count=1):
+        """
+        Send a chat completion request through the shared rate limiter, with retries.
+        Обрезанный по max_tokens ответ (finish_reason == 'length') не возвращается:
+        запрос повторяется с вдвое большим бюджетом, а на пределе - ошибка.
+        
+        Args:
+            system_prompt (str): System message
+            prompt (str): User message
+            max_tokens (int): Response token budget
+            retry_count (int): Number of attempts (exponential backoff between them)
+            
+        Returns:
+            str: Complete response text
+            
+        Raises:
+            Exception: Error of the last attempt
+        """
+        for attempt in range(retry_count):
+            try:
+                while True:
+                    self._limiter.acquire(len(prompt) // 3 + max_tokens)
+                    response = self._client.chat.completions.create(
+                        **self._completion_kwargs(system_prompt, prompt, max_tokens))
+                    self._limiter.record_success()
+                    next_max_tokens = self._grow_max_tokens(response, max_tokens)
+                    if next_max_tokens is None:
+                        return response.choices[0].message.content
+                    max_tokens = next_max_tokens
+            except _TruncatedResponseError:
+                # Повтор с тем же бюджетом снова обрезал бы ответ
+                raise
+            except Exception as e:
+                self._limiter.record_error(e)
+                if attempt == retry_count - 1:
+                    raise
+                logger.error(f"OpenAI request attempt {attempt+1} failed: {str(e)}")
+                # Wait before retrying (exponential backoff)
+                time.sleep(2 ** attempt)
+    
+    async def _arequest_completion(self, client, semaphore, system_prompt, prompt, max_tokens, retry_count=1):
+        """
+        Async variant of _request_completion; the semaphore is held only while sending.
+        
+        Args:
+            client (openai.AsyncOpenAI): Async OpenAI client
+            semaphore (asyncio.Semaphore): Limits concurrent requests
+            system_prompt (str): System message
+            prompt (str): User message
+            max_tokens (int): Response token budget
+            retry_count (int): Number of attempts (exponential backoff between them)
+            
+        Returns:
+            str: Complete response text
+            
+        Raises:
+            Exception: Error of the last attempt
+        """
+        for attempt in range(retry_count):
+            try:
+                while True:
+                    async with semaphore:
+                        await self._limiter.aacquire(len(prompt) // 3 + max_tokens)
+                        response = await client.chat.completions.create(
+                            **self._completion_kwargs(system_prompt, prompt, max_tokens))
+                    self._limiter.record_success()
+                    next_max_tokens = self._grow_max_tokens(response, max_tokens)
+                    if next_max_tokens is None:
+                        return response.choices[0].message.content
+                    max_tokens = next_max_tokens
+            except _TruncatedResponseError:
+                # Повтор с тем же бюджетом снова обрезал бы ответ
+                raise
+            except Exception as e:
+                self._limiter.record_error(e)
+                if attempt == retry_count - 1:
+                    raise
+                logger.error(f"OpenAI request attempt {attempt+1} failed: {str(e)}")
+                # Wait before retrying (exponential backoff)
+                await asyncio.sleep(2 ** attempt)
+    
     def translate_text(self, text, purpose="translation", retry_count=3):
         """
         Translate text using OpenAI.
@@ -159,7 +597,7 @@ class TranslationManager:
             return text
         
         # Check cache first
-        cache_key = f"{purpose}:{text}"
+        cache_key = self._cache_key(purpose, text)
         if cache_key in self.cache:
             logger.debug("Using cached translation")
             return self.cache[cache_key]
@@ -169,42 +607,36 @@ class TranslationManager:
         if not cleaned_text.strip():
             return ""
             
+        # Длинный текст переводится частями по абзацам параллельно; каждая часть кешируется
+        # отдельно, поэтому после сбоя повторно переводятся только непереведенные части
+        if len(cleaned_text) > self.CHUNK_SIZE:
+            chunks = self._split_into_chunks(text, chunk_size=self.CHUNK_SIZE)
+            if len(chunks) > 1:
+                logger.info(f"Translating long text ({len(text)} chars) in {len(chunks)} chunks")
+                return '\n\n'.join(asyncio.run(self._agather_chunks(
+                    chunks, lambda client, semaphore, chunk: self._atranslate_text(client, semaphore, chunk, purpose)
+                )))
+        
         # Build prompt based on purpose
         prompt = self._build_translation_prompt(cleaned_text, purpose)
         
+        max_tokens = self._estimate_max_tokens(cleaned_text)
+        
         # Try translation with retries
-        for attempt in range(retry_count):
-            try:
-                # Используем клиент OpenAI без проблемных параметров
-                client = openai.OpenAI(api_key=self.openai_api_key)
-                response = client.chat.completions.create(
-                    model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-                    messages=[
-                        {"role": "system", "content": "Вы специалист по переводу текстов по покеру с английского на русский."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=4000,
-                    temperature=0.1
-                )
-                translated_text = response.choices[0].message.content.strip()
-                
-                # Post-process the translation
-                processed_translation = self._post_process_translation(translated_text)
-                
-                # Cache the result
-                self.cache[cache_key] = processed_translation
-                self._save_cache()
-                
-                return processed_translation
-                
-            except Exception as e:
-                logger.error(f"Translation attempt {attempt+1} failed: {str(e)}")
-                if attempt < retry_count - 1:
-                    # Wait before retrying (exponential backoff)
-                    time.sleep(2 ** attempt)
-                else:
-                    logger.error("All translation attempts failed")
-                    return text  # Return original text on complete failure
+        try:
+            translated_text = self._request_completion(
+                self._TRANSLATE_SYSTEM_PROMPT, prompt, max_tokens, retry_count).strip()
+        except Exception as e:
+            logger.error(f"All translation attempts failed: {str(e)}")
+            return text  # Return original text on complete failure
+        
+        # Post-process the translation
+        processed_translation = self._post_process_translation(translated_text)
+        
+        # Cache the result
+        self._append_cache(cache_key, processed_translation)
+        
+        return processed_translation
     
     def _clean_text_for_translation(self, text):
         """
@@ -216,28 +648,45 @@ class TranslationManager:
         Returns:
             str: Cleaned text
         """
-        # Remove excessively repeated characters
-        text = re.sub(r'(.)\1{3,}', r'\1\1', text)
+        cleaned = _clean_text_cache.get(text)
+        if cleaned is not None:
+            return cleaned
+        source = text
         
-        # Remove lines with mostly special characters
-        lines = text.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            # Count special characters
-            special_chars = sum(1 for c in line if not c.isalnum() and not c.isspace())
-            total_chars = len(line)
-            
-            # Keep if less than 40% special characters
-            if total_chars == 0 or special_chars / total_chars < 0.4:
-                cleaned_lines.append(line)
+        # Remove excessively repeated characters
+        text = self._REPEATED_CHAR_RE.sub(r'\1\1', text)
         
-        text = '\n'.join(cleaned_lines)
+        # Remove lines with mostly special characters (строки фильтруются генератором,
+        # без промежуточного списка)
+        text = '\n'.join(line for line in text.split('\n') if self._keep_line(line))
         
         # Предварительная обработка покерных терминов и аббревиатур
         text = self._preprocess_poker_terms(text)
         
+        if len(_clean_text_cache) >= CLEAN_TEXT_CACHE_SIZE:
+            _clean_text_cache.clear()
+        _clean_text_cache[source] = text
         return text
         
+    @staticmethod
+    def _keep_line(line):
+        """
+        Check whether a line should be kept before translation.
+        
+        Args:
+            line (str): Line of text
+            
+        Returns:
+            bool: True if less than 40% of the line are special characters
+        """
+        total_chars = len(line)
+        if total_chars == 0:
+            return True
+        
+        # Count special characters
+        special_chars = len(TranslationManager._SPECIAL_CHAR_RE.findall(line))
+        return special_chars / total_chars < 0.4
+    
     def _preprocess_poker_terms(self, text):
         """
         Предварительная обработка покерных терминов для повышения качества перевода.
@@ -248,25 +697,23 @@ class TranslationManager:
         Returns:
             str: Обработанный текст с правильно отмеченными покерными терминами
         """
-        # Проверка и обработка аббревиатур в глоссарии
-        for term, translation in self.POKER_GLOSSARY.items():
-            # Ищем термин в начале слова или как отдельное слово
-            pattern = r'\b' + re.escape(term) + r'\b'
-            
-            # Если термин уже встречается в тексте, заменяем его на версию с переводом при первом вхождении
-            if re.search(pattern, text, re.IGNORECASE):
-                # Найдем первое вхождение
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    # Получим оригинальный текст (с учетом регистра)
-                    original_match = match.group(0)
-                    # Заменим только первое вхождение
-                    text = text.replace(original_match, translation, 1)
+        # Проверка и обработка аббревиатур в глоссарии: первое вхождение каждого термина
+        # (как отдельного слова, без учета регистра) заменяется на месте найденного совпадения
+        # за один проход по тексту, без повторного поиска строки через str.replace
+        seen = set()
+        
+        def expand_first(match):
+            term = self._GLOSSARY_BY_LOWER[match.group(0).lower()]
+            if term in seen:
+                return match.group(0)
+            seen.add(term)
+            return self.POKER_GLOSSARY[term]
+        
+        text = self._GLOSSARY_RE.sub(expand_first, text)
         
         # Специальная обработка для последовательности аббревиатур SWASED ECD CEE и т.д.
         # Этот паттерн часто встречается в покерной литературе и нужна особая обработка
-        special_swased_pattern = r'\bSWASED\s+ECD\s+CEE(?:\s+Eo)?(?:\s+ea)?(?:\s+Fn)?(?:\s+i)?(?:\s+Do)?(?:\s+CD)?\b'
-        swased_match = re.search(special_swased_pattern, text)
+        swased_match = self._SWASED_RE.search(text)
         
         if swased_match:
             full_match = swased_match.group(0)
@@ -278,17 +725,19 @@ class TranslationManager:
             replacement += "CEE (Calculation, Execution, Evaluation - методика оценки игры)"
             
             # Добавляем остальные элементы, если они есть в исходной последовательности
-            if "Eo" in full_match:
+            # (сравниваются отдельные слова, а не подстроки: "CD" входит в "ECD")
+            tokens = set(full_match.split())
+            if "Eo" in tokens:
                 replacement += ", Eo (Equity optimization - оптимизация эквити)"
-            if "ea" in full_match:
+            if "ea" in tokens:
                 replacement += ", ea (equity awareness - осознание эквити)"
-            if "Fn" in full_match:
+            if "Fn" in tokens:
                 replacement += ", Fn (Function notation - функциональная нотация)"
-            if "i" in full_match and " i " in full_match:  # Проверяем, что это отдельное слово
+            if "i" in tokens:
                 replacement += ", i (iteration - итерация)"
-            if "Do" in full_match:
+            if "Do" in tokens:
                 replacement += ", Do (Downstream optimization - оптимизация последующих действий)"
-            if "CD" in full_match:
+            if "CD" in tokens:
                 replacement += ", CD (Calculation and Decision - расчеты и принятие решений)"
             
             # Заменяем весь блок аббревиатур на развернутое объяснение
@@ -296,8 +745,7 @@ class TranslationManager:
             logger.info(f"Replaced SWASED sequence with expanded explanation")
             
         # Обработка других последовательностей аббревиатур (для общего случая)
-        abbr_pattern = r'\b([A-Z]{2,}(?:\s+[A-Z]{2,})+)\b'
-        abbr_matches = list(re.finditer(abbr_pattern, text))
+        abbr_matches = list(self._ABBR_SEQUENCE_RE.finditer(text))
         
         for match in abbr_matches:
             # Проверяем, не обработали ли мы уже эту последовательность выше
@@ -378,6 +826,64 @@ class TranslationManager:
             
             Перевод на русский:"""
     
+    @classmethod
+    def _needs_ocr_improvement(cls, text):
+        """
+        Cheap local check whether OCR text is corrupted enough to send it to OpenAI.
+        
+        Args:
+            text (str): Raw OCR text
+            
+        Returns:
+            bool: True if more than 1% of characters are garbage or less than 55% are letters
+        """
+        length = len(text)
+        garbage = len(cls._OCR_GARBAGE_RE.findall(text))
+        alpha_ratio = sum(map(str.isalpha, text)) / length
+        return garbage / length > 0.01 or alpha_ratio < 0.55
+    
+    @staticmethod
+    def _estimate_max_tokens(text):
+        """
+        Estimate the response token budget for a request.
+        
+        max_tokens резервируется в лимите TPM целиком, поэтому для коротких строк
+        (ячейки таблиц, подписи) фиксированные 4000 токенов быстро исчерпывают лимит.
+        Английский текст - примерно 3-4 символа на токен, русский перевод - в 1.3-1.8
+        раза длиннее, поэтому берем двойной запас. Если оценки не хватило, ответ
+        приходит с finish_reason 'length' и запрос повторяется с большим бюджетом.
+        
+        Args:
+            text (str): Text sent in the request
+            
+        Returns:
+            int: max_tokens value between 128 and 4000
+        """
+        approx_in = len(text) // 3
+        return max(128, min(4000, int(approx_in * 2.0)))
+    
+    def _build_improve_prompt(self, text):
+        """
+        Build a prompt for OCR text improvement.
+        
+        Args:
+            text (str): Raw OCR text
+            
+        Returns:
+            str: Prompt for the improvement
+        """
+        return f"""Fix OCR errors and improve the following English text from a poker book.
+            IMPORTANT: This is ENGLISH text - do NOT translate to any other language.
+            Maintain the original English language, fix spelling, and correct formatting.
+            If sentences are incomplete or garbled, do your best to reconstruct them.
+            Do not add new information or content not present in the original.
+            ALWAYS KEEP THE TEXT IN ENGLISH - DO NOT TRANSLATE.
+            
+            Original OCR text:
+            {text}
+            
+            Improved English text:"""
+    
     def _split_into_chunks(self, text, chunk_size=1800):
         """
         Split a long text into chunks of approximately equal size, trying to break at paragraph boundaries.
@@ -395,20 +901,25 @@ class TranslationManager:
             
         chunks = []
         paragraphs = text.split('\n\n')
-        current_chunk = ""
+        # Абзацы текущей части копятся в списке и склеиваются один раз при ее закрытии;
+        # current_len - длина части вместе с разделителями '\n\n' после каждого абзаца
+        current_parts = []
+        current_len = 0
         
         for paragraph in paragraphs:
             # If adding this paragraph exceeds chunk size and we already have content,
             # add current chunk to results and start a new one
-            if len(current_chunk) + len(paragraph) > chunk_size and current_chunk:
-                chunks.append(current_chunk)
-                current_chunk = paragraph + '\n\n'
+            if current_len + len(paragraph) > chunk_size and current_parts:
+                chunks.append('\n\n'.join(current_parts) + '\n\n')
+                current_parts = [paragraph]
+                current_len = len(paragraph) + 2
             else:
-                current_chunk += paragraph + '\n\n'
+                current_parts.append(paragraph)
+                current_len += len(paragraph) + 2
                 
         # Add the last chunk if not empty
-        if current_chunk:
-            chunks.append(current_chunk)
+        if current_parts:
+            chunks.append('\n\n'.join(current_parts) + '\n\n')
             
         return chunks
         
@@ -431,53 +942,41 @@ class TranslationManager:
             return text
             
         # Generate cache key
-        cache_key = f"improve_en_{hash(text)}"
+        cache_key = self._cache_key("improve_en", text)
         
         # Check cache
         if cache_key in self.cache:
             logger.debug("Using cached improvement")
             return self.cache[cache_key]
         
-        # Предотвращаем рекурсию - разделяем большие тексты вручную
-        # If text is very long, just return it as is to avoid recursion errors
-        if len(text) > 2000:
-            logger.info(f"Text too long ({len(text)} chars), returning without OpenAI processing")
+        # Чистый текст не отправляем в API; результат проверки запоминаем в памяти
+        if not self._needs_ocr_improvement(text):
+            logger.debug("OCR text looks clean, skipping OpenAI improvement")
+            self.cache[cache_key] = text
             return text
+        
+        # Длинный текст делится на части по абзацам, части обрабатываются параллельно
+        # (каждая кешируется отдельно, так что повторный запуск использует готовые части)
+        if len(text) > 2000:
+            chunks = self._split_into_chunks(text, chunk_size=self.CHUNK_SIZE)
+            if len(chunks) == 1:
+                # Один огромный абзац не делится - возвращаем как есть
+                logger.info(f"Text too long ({len(text)} chars), returning without OpenAI processing")
+                return text
+            logger.info(f"Improving long OCR text ({len(text)} chars) in {len(chunks)} chunks")
+            return '\n\n'.join(asyncio.run(self._agather_chunks(chunks, self._aimprove_text)))
             
         try:
             logger.info("Improving OCR text with OpenAI API (keeping English language)")
             
-            try:
-                client = openai.OpenAI(api_key=self.openai_api_key)
-            except TypeError:
-                # Fallback для случаев когда proxies вызывает ошибку
-                client = openai.OpenAI()
-                client.api_key = self.openai_api_key
+            prompt = self._build_improve_prompt(text)
             
-            prompt = f"""Fix OCR errors and improve the following English text from a poker book.
-            IMPORTANT: This is ENGLISH text - do NOT translate to any other language.
-            Maintain the original English language, fix spelling, and correct formatting.
-            If sentences are incomplete or garbled, do your best to reconstruct them.
-            Do not add new information or content not present in the original.
-            ALWAYS KEEP THE TEXT IN ENGLISH - DO NOT TRANSLATE.
-            
-            Original OCR text:
-            {text}
-            
-            Improved English text:"""
+            max_tokens = self._estimate_max_tokens(text)
             
             # Try with new API
             try:
-                response = client.chat.completions.create(
-                    model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-                    messages=[
-                        {"role": "system", "content": "You are an expert at correcting OCR errors in English poker texts. Do not translate the text."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=4000,
-                    temperature=0.1
-                )
-                improved_text = response.choices[0].message.content.strip()
+                improved_text = self._request_completion(
+                    self._IMPROVE_SYSTEM_PROMPT, prompt, max_tokens).strip()
                 
             # If new API doesn't work, return original text
             except Exception as new_api_error:
@@ -486,8 +985,7 @@ class TranslationManager:
                 return text
             
             # Cache the result
-            self.cache[cache_key] = improved_text
-            self._save_cache()
+            self._append_cache(cache_key, improved_text)
             
             return improved_text
             
@@ -506,42 +1004,30 @@ class TranslationManager:
             str: Processed translation
         """
         # Fix spacing after/before punctuation in Russian
-        translation = re.sub(r'\s+([.,;:!?)])', r'\1', translation)
-        translation = re.sub(r'([({[])(?=\S)', r'\1 ', translation)
+        translation = self._SPACE_BEFORE_PUNCT_RE.sub(r'\1', translation)
+        translation = self._SPACE_AFTER_OPEN_RE.sub(r'\1 ', translation)
         
         # Fix poker terms with translations
         # Look for patterns like "term (перевод)" and ensure they're formatted consistently
-        term_patterns = re.finditer(r'([A-Za-z][A-Za-z0-9\s\-\_]+)\s*\(([^)]+)\)', translation)
-        replacements = {}
-        
-        for match in term_patterns:
-            english_term = match.group(1).strip()
-            russian_trans = match.group(2).strip()
-            
-            # Format consistently
-            replacements[match.group(0)] = f"{english_term} ({russian_trans})"
-        
-        # Apply replacements
-        for old, new in replacements.items():
-            translation = translation.replace(old, new)
+        # (в том числе убираем пробел, добавленный выше после открывающей скобки).
+        # Замена выполняется на месте совпадения одним проходом, без словаря и str.replace
+        translation = self._TERM_PAREN_RE.sub(
+            lambda match: f"{match.group(1).strip()} ({match.group(2).strip()})", translation
+        )
         
         # Корректировка проблемных мест с аббревиатурами
         # Исправление случаев, когда аббревиатуры переведены некорректно
-        for term, correct_form in self.POKER_GLOSSARY.items():
-            # Ищем варианты неправильных переводов термина
-            variations = [
-                f"{term.lower()} ",  # аббревиатура в нижнем регистре
-                f"{term.upper()} ",  # аббревиатура в верхнем регистре
-                f"{term} ",          # аббревиатура как в глоссарии
-            ]
-            
-            for var in variations:
-                if var.strip() in translation and correct_form not in translation:
-                    # Заменяем только если неправильная форма есть, а правильной нет
-                    translation = translation.replace(var.strip(), correct_form)
+        # Все варианты написания терминов (в нижнем/верхнем регистре и как в глоссарии) находятся
+        # одним проходом. Заменяем только если неправильная форма есть, а правильной нет
+        def replace_term(match):
+            correct_form = self.POKER_GLOSSARY[self._POST_TERM_VARIANTS[match.group(0)]]
+            return match.group(0) if correct_form in source else correct_form
+        
+        source = translation
+        translation = self._POST_TERM_RE.sub(replace_term, translation)
         
         # Проверяем нетипичные аббревиатуры и последовательности заглавных букв (как SWASED ECD CEE)
-        abbr_sequences = re.finditer(r'\b([A-Z]{2,}(?:\s+[A-Z]{2,})+)\b', translation)
+        abbr_sequences = self._ABBR_SEQUENCE_RE.finditer(translation)
         for match in abbr_sequences:
             abbr_sequence = match.group(0)
             # Проверяем, не заменили ли мы это раньше
@@ -553,17 +1039,196 @@ class TranslationManager:
                 )
         
         # Убираем случайные символы, которые могли попасть в текст из-за OCR ошибок
-        translation = re.sub(r'(\w)_(\w)', r'\1 \2', translation)  # Заменяем a_b на "a b"
-        translation = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', translation)  # Убираем непечатные символы
+        translation = self._UNDERSCORE_WORD_RE.sub(r'\1 \2', translation)  # Заменяем a_b на "a b"
+        translation = self._CONTROL_CHAR_RE.sub('', translation)  # Убираем непечатные символы
         
         # Убираем повторы пробелов
-        translation = re.sub(r' {2,}', ' ', translation)
+        translation = self._MULTI_SPACE_RE.sub(' ', translation)
         
         return translation
     
-    def translate_document(self, document_structure):
+    async def _atranslate_text(self, client, semaphore, text, purpose="translation", retry_count=3):
         """
-        Translate an entire document structure.
+        Asynchronously translate text using OpenAI (same steps as translate_text).
+        
+        Args:
+            client (openai.AsyncOpenAI): Async OpenAI client
+            semaphore (asyncio.Semaphore): Limits concurrent requests
+            text (str): Text to translate
+            purpose (str): Purpose of translation (translation, figure_description)
+            retry_count (int): Number of retries on failure
+            
+        Returns:
+            str: Translated text
+        """
+        if not text.strip():
+            return ""
+            
+        if not self.openai_api_key:
+            return text
+        
+        # Попадание в кеш не занимает слот запроса
+        cache_key = self._cache_key(purpose, text)
+        if cache_key in self.cache:
+            logger.debug("Using cached translation")
+            return self.cache[cache_key]
+        
+        cleaned_text = self._clean_text_for_translation(text)
+        if not cleaned_text.strip():
+            return ""
+            
+        prompt = self._build_translation_prompt(cleaned_text, purpose)
+        max_tokens = self._estimate_max_tokens(cleaned_text)
+        
+        try:
+            translated_text = (await self._arequest_completion(
+                client, semaphore, self._TRANSLATE_SYSTEM_PROMPT, prompt, max_tokens, retry_count)).strip()
+        except Exception as e:
+            logger.error(f"All translation attempts failed: {str(e)}")
+            return text  # Return original text on complete failure
+        
+        processed_translation = self._post_process_translation(translated_text)
+        self._append_cache(cache_key, processed_translation)
+        return processed_translation
+    
+    async def _aimprove_text(self, client, semaphore, text):
+        """
+        Asynchronously improve a piece of OCR text (same steps as improve_extracted_text).
+        
+        Args:
+            client (openai.AsyncOpenAI): Async OpenAI client
+            semaphore (asyncio.Semaphore): Limits concurrent requests
+            text (str): Raw OCR text
+            
+        Returns:
+            str: Improved text in English
+        """
+        if not text.strip():
+            return ""
+        
+        cache_key = self._cache_key("improve_en", text)
+        if cache_key in self.cache:
+            logger.debug("Using cached improvement")
+            return self.cache[cache_key]
+        
+        if not self._needs_ocr_improvement(text):
+            self.cache[cache_key] = text
+            return text
+        
+        prompt = self._build_improve_prompt(text)
+        max_tokens = self._estimate_max_tokens(text)
+        try:
+            improved_text = (await self._arequest_completion(
+                client, semaphore, self._IMPROVE_SYSTEM_PROMPT, prompt, max_tokens)).strip()
+        except Exception as e:
+            logger.error(f"Error improving OCR text: {str(e)}")
+            return text  # Return original text on error
+        
+        self._append_cache(cache_key, improved_text)
+        return improved_text
+    
+    async def _agather_chunks(self, chunks, worker):
+        """
+        Process text chunks concurrently with a shared async client.
+        
+        Args:
+            chunks (list): Text chunks
+            worker: Coroutine function (client, semaphore, chunk) -> str
+            
+        Returns:
+            list: Results for each chunk, in the same order
+        """
+        client = openai.AsyncOpenAI(api_key=self.openai_api_key)
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        try:
+            results = await asyncio.gather(*(worker(client, semaphore, chunk.strip()) for chunk in chunks))
+            return list(results)
+        finally:
+            await client.close()
+    
+    async def _atranslate_batch(self, client, semaphore, texts, purpose="translation"):
+        """
+        Translate several short texts (e.g. table cells) with as few OpenAI requests as possible.
+        Тексты объединяются в один запрос с разделителями ### ITEM N ###; если ответ не удается
+        разобрать на то же число элементов, тексты переводятся по одному.
+        
+        Args:
+            client (openai.AsyncOpenAI): Async OpenAI client
+            semaphore (asyncio.Semaphore): Limits concurrent requests
+            texts (list): Texts to translate
+            purpose (str): Purpose of translation
+            
+        Returns:
+            list: Translated texts, in the same order
+        """
+        results = list(texts)
+        if not self.openai_api_key:
+            return results
+        
+        # Пустые и уже переведенные тексты в запрос не попадают
+        pending = []
+        for i, text in enumerate(texts):
+            if not text.strip():
+                results[i] = ""
+            elif self._cache_key(purpose, text) in self.cache:
+                results[i] = self.cache[self._cache_key(purpose, text)]
+            else:
+                cleaned_text = self._clean_text_for_translation(text)
+                if cleaned_text.strip():
+                    pending.append((i, cleaned_text))
+                else:
+                    results[i] = ""
+        
+        # Делим на пакеты ограниченного объема, чтобы ответ поместился в max_tokens
+        batches = []
+        batch, batch_chars = [], 0
+        for item in pending:
+            if batch and batch_chars + len(item[1]) > self.BATCH_MAX_CHARS:
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(item)
+            batch_chars += len(item[1])
+        if batch:
+            batches.append(batch)
+        
+        async def translate_batch(batch):
+            translations = None
+            if len(batch) > 1:
+                body = '\n'.join(f"### ITEM {n} ###\n{text}" for n, (_, text) in enumerate(batch, 1))
+                prompt = self._build_translation_prompt(body, purpose)
+                max_tokens = self._estimate_max_tokens(body)
+                try:
+                    content = await self._arequest_completion(
+                        client, semaphore, self._BATCH_SYSTEM_PROMPT, prompt, max_tokens)
+                    parts = self._BATCH_ITEM_RE.split(content)
+                    # parts: [текст до первого разделителя, номер, перевод, номер, перевод, ...]
+                    numbers = [int(n) for n in parts[1::2]]
+                    if numbers == list(range(1, len(batch) + 1)):
+                        translations = [part.strip() for part in parts[2::2]]
+                    else:
+                        logger.warning(f"Batch translation returned {len(numbers)} items instead of {len(batch)}, "
+                                       f"translating one by one")
+                except Exception as e:
+                    logger.error(f"Batch translation failed: {str(e)}")
+            
+            if translations is None:
+                # Запросы по одному тексту идут одновременно (под тем же семафором)
+                fallback = await asyncio.gather(*(self._atranslate_text(client, semaphore, texts[i], purpose)
+                                                  for i, _ in batch))
+                for (i, _), translated_text in zip(batch, fallback):
+                    results[i] = translated_text
+                return
+            
+            for (i, _), translated_text in zip(batch, translations):
+                results[i] = self._post_process_translation(translated_text)
+                self._append_cache(self._cache_key(purpose, texts[i]), results[i])
+        
+        await asyncio.gather(*(translate_batch(batch) for batch in batches))
+        return results
+    
+    async def _atranslate_document(self, document_structure):
+        """
+        Translate all texts of a document structure concurrently.
         
         Args:
             document_structure (dict): Document structure with text content
@@ -571,62 +1236,82 @@ class TranslationManager:
         Returns:
             dict: Translated document structure
         """
-        translated_structure = {}
-        
-        # Translate title if present
-        if 'title' in document_structure:
-            translated_structure['title'] = self.translate_text(document_structure['title'])
-        
-        # Translate paragraphs
-        if 'paragraphs' in document_structure:
-            translated_structure['paragraphs'] = []
-            for paragraph in document_structure['paragraphs']:
-                translated_paragraph = self.translate_text(paragraph)
-                translated_structure['paragraphs'].append(translated_paragraph)
-        
-        # Translate figures
-        if 'figures' in document_structure:
-            translated_structure['figures'] = []
-            for figure in document_structure['figures']:
-                figure_type = figure['type']
-                description = figure['description']
-                region = figure['region']
-                
-                translated_description = self.translate_text(description, purpose="figure_description")
-                
-                translated_figure = {
-                    'type': figure_type,
-                    'description': translated_description,
-                    'region': region,
-                    'image_path': figure.get('image_path', '')
-                }
-                
-                translated_structure['figures'].append(translated_figure)
+        if not self.openai_api_key:
+            logger.warning("No OpenAI API key provided. Cannot translate text.")
+        
+        client = openai.AsyncOpenAI(api_key=self.openai_api_key) if self.openai_api_key else None
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        
+        def translate(text, purpose="translation"):
+            return self._atranslate_text(client, semaphore, text, purpose)
         
-        # Translate tables
-        if 'tables' in document_structure:
-            translated_structure['tables'] = []
-            for table in document_structure['tables']:
+        try:
+            # Все запросы документа (заголовок, абзацы, описания фигур, ячейки таблиц)
+            # отправляются одновременно; число активных запросов ограничено семафором
+            title = document_structure.get('title')
+            paragraphs = document_structure.get('paragraphs')
+            figures = document_structure.get('figures')
+            tables = document_structure.get('tables')
+            
+            tasks = []
+            if title is not None:
+                tasks.append(translate(title))
+            tasks.extend(translate(paragraph) for paragraph in paragraphs or [])
+            tasks.extend(translate(figure['description'], "figure_description") for figure in figures or [])
+            for table in tables or []:
                 table_data = table['data']
-                
-                # For simple tables, translate the whole thing
                 if isinstance(table_data, str):
-                    translated_data = self.translate_text(table_data, purpose="technical_content")
+                    tasks.append(translate(table_data, "technical_content"))
                 else:
-                    # For structured tables, translate each cell
-                    translated_data = []
-                    for row in table_data:
-                        translated_row = []
-                        for cell in row:
-                            translated_cell = self.translate_text(cell, purpose="technical_content")
-                            translated_row.append(translated_cell)
-                        translated_data.append(translated_row)
-                
-                translated_table = {
-                    'data': translated_data,
-                    'image_path': table.get('image_path', '')
-                }
-                
-                translated_structure['tables'].append(translated_table)
+                    # Ячейки таблицы переводятся пакетом, а не отдельным запросом на каждую
+                    cells = [cell for row in table_data for cell in row]
+                    tasks.append(self._atranslate_batch(client, semaphore, cells, "technical_content"))
+            
+            # Результаты gather идут в том же порядке, что и задачи
+            results = iter(await asyncio.gather(*tasks))
+            
+            translated_structure = {}
+            if title is not None:
+                translated_structure['title'] = next(results)
+            if paragraphs is not None:
+                translated_structure['paragraphs'] = [next(results) for _ in paragraphs]
+            if figures is not None:
+                translated_structure['figures'] = [
+                    {
+                        'type': figure['type'],
+                        'description': next(results),
+                        'region': figure['region'],
+                        'image_path': figure.get('image_path', '')
+                    }
+                    for figure in figures
+                ]
+            if tables is not None:
+                translated_structure['tables'] = []
+                for table in tables:
+                    table_data = table['data']
+                    if isinstance(table_data, str):
+                        translated_data = next(results)
+                    else:
+                        cells = iter(next(results))
+                        translated_data = [[next(cells) for _ in row] for row in table_data]
+                    translated_structure['tables'].append({
+                        'data': translated_data,
+                        'image_path': table.get('image_path', '')
+                    })
+            return translated_structure
+        finally:
+            if client is not None:
+                await client.close()
+    
+    def translate_document(self, document_structure):
+        """
+        Translate an entire document structure.
+        Requests for all paragraphs, figure descriptions and table cells run concurrently.
         
-        return translated_structure
+        Args:
+            document_structure (dict): Document structure with text content
+            
+        Returns:
+            dict: Translated document structure
+        """
+        return asyncio.run(self._atranslate_document(document_structure))
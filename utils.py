@@ -3,13 +3,53 @@
 Utility functions for the poker book processor.
 """
 import os
+import functools
 import logging
 import time
 import json
 import cv2
 import numpy as np
+from PIL import Image, UnidentifiedImageError
 from datetime import datetime
 import re
+import hashlib
+import mmap
+import pickle
+
+# BLAKE3 заметно быстрее MD5 за счет SIMD; если пакет не установлен, используем BLAKE2b
+try:
+    import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+# orjson сериализует JSON на C сразу в bytes UTF-8
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# xxh3 - некриптографический хеш, быстрее MD5 более чем на порядок
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+
+# MinHash LSH для поиска похожих текстов в больших коллекциях
+try:
+    from datasketch import MinHash, MinHashLSH
+    HAS_DATASKETCH = True
+except ImportError:
+    HAS_DATASKETCH = False
+
+# Numba компилирует ядро подсчета Jaccard по битовым множествам в машинный код
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -23,20 +63,35 @@ def create_timestamp():
     """
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
-def save_to_json(data, output_path):
+def save_to_json(data, output_path, compact=False):
     """
     Save data to a JSON file.
     
     Args:
         data: Data to save
         output_path: Path to save to
+        compact (bool): Write without indentation (smaller and faster for large structures)
         
     Returns:
         bool: Success status
     """
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        # JSON собирается в памяти в виде bytes и записывается одним вызовом write
+        # в двоичном режиме, без повторного кодирования в текстовом слое
+        payload = None
+        if HAS_ORJSON:
+            options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            if not compact:
+                options |= orjson.OPT_INDENT_2
+            try:
+                payload = orjson.dumps(data, option=options)
+            except TypeError:
+                # Типы, которые orjson не поддерживает, - через стандартный json
+                pass
+        if payload is None:
+            payload = json.dumps(data, ensure_ascii=False, indent=None if compact else 4).encode('utf-8')
+        with open(output_path, 'wb') as f:
+            f.write(payload)
         return True
     except Exception as e:
         logger.error(f"Error saving JSON: {str(e)}")
@@ -59,6 +114,11 @@ def load_from_json(input_path):
         logger.error(f"Error loading JSON: {str(e)}")
         return None
 
+# Номер страницы в имени файла: page_0171, page-171 или просто первое число
+_PAGE_RE = re.compile(r'page[_-]0*(\d+)', re.IGNORECASE)
+_NUM_RE = re.compile(r'(\d+)')
+
+@functools.lru_cache(maxsize=8192)
 def extract_page_number(filename):
     """
     Extract page number from filename for proper sequencing.
@@ -70,12 +130,12 @@ def extract_page_number(filename):
         int: Page number or -1 if not found
     """
     # Try to match patterns like page_0171 or page-171
-    match = re.search(r'page[_-]0*(\d+)', filename, re.IGNORECASE)
+    match = _PAGE_RE.search(filename)
     if match:
         return int(match.group(1))
     
     # Try to match just numeric part
-    match = re.search(r'(\d+)', filename)
+    match = _NUM_RE.search(filename)
     if match:
         return int(match.group(1))
     
@@ -92,7 +152,10 @@ def sort_files_by_page(file_list):
     Returns:
         list: Sorted list of file paths
     """
-    return sorted(file_list, key=lambda x: extract_page_number(os.path.basename(x)))
+    return sorted(file_list, key=lambda x: extract_page_number(x.rpartition('/')[2]))
+
+# Все байты, кроме ASCII-букв (удаляются при подсчете латиницы в estimate_language)
+_NON_LATIN_BYTES = bytes(b for b in range(256) if not (0x41 <= b <= 0x5A or 0x61 <= b <= 0x7A))
 
 def estimate_language(text):
     """
@@ -104,11 +167,15 @@ def estimate_language(text):
     Returns:
         str: Language code ('en' or 'ru')
     """
-    # Count Cyrillic characters
-    cyrillic_count = sum(1 for c in text if ord('а') <= ord(c.lower()) <= ord('я'))
+    # Подсчет идет по байтам UTF-8 вызовами на C, без цикла Python по символам
+    data = text.encode('utf-8', 'surrogatepass')
+    
+    # Count Cyrillic characters: каждая буква блока U+0400-U+047F (в том числе ё)
+    # начинается ровно с одного байта 0xD0 или 0xD1
+    cyrillic_count = data.count(b'\xd0') + data.count(b'\xd1')
     
-    # Count Latin characters
-    latin_count = sum(1 for c in text if ord('a') <= ord(c.lower()) <= ord('z'))
+    # Count Latin characters: в UTF-8 буквы A-Z/a-z встречаются только как отдельные байты ASCII
+    latin_count = len(data.translate(None, _NON_LATIN_BYTES))
     
     # Compare counts
     if cyrillic_count > latin_count:
@@ -131,11 +198,13 @@ def is_processing_needed(input_path, output_path, force=False):
     if force:
         return True
         
-    if not os.path.exists(output_path):
+    # Один вызов stat на файл (вместо exists + getmtime)
+    try:
+        output_mtime = os.stat(output_path).st_mtime
+    except FileNotFoundError:
         return True
         
-    input_mtime = os.path.getmtime(input_path)
-    output_mtime = os.path.getmtime(output_path)
+    input_mtime = os.stat(input_path).st_mtime
     
     # If input is newer than output, we need to process
     return input_mtime > output_mtime
@@ -158,13 +227,18 @@ def is_valid_image(file_path):
         if ext.lower() not in valid_extensions:
             return False
             
-        # Try to open with OpenCV
-        img = cv2.imread(file_path)
-        if img is None:
-            return False
+        # Размеры читаются из заголовка файла через Pillow без декодирования изображения;
+        # OpenCV (полное декодирование) используется только если Pillow не распознал файл
+        try:
+            with Image.open(file_path) as img:
+                width, height = img.size
+        except (UnidentifiedImageError, OSError):
+            img = cv2.imread(file_path)
+            if img is None:
+                return False
+            height, width = img.shape[:2]
             
         # Check dimensions
-        height, width = img.shape[:2]
         if height < 100 or width < 100:
             return False
             
@@ -187,84 +261,261 @@ def find_optimal_layout(figures, page_width, page_height, padding=10):
     Returns:
         list: List of (x, y) positions for each figure
     """
-    # Simple layout algorithm for demonstration
-    positions = []
-    current_x = padding
+    # Simple layout algorithm for demonstration.
+    # Позиции вычисляются не по одной фигуре, а целыми отрезками ряда: по накопленной
+    # сумме ширин (searchsorted) находится, сколько фигур помещается в ряд, а первая
+    # фигура, не помещающаяся по высоте, - векторной проверкой высот
+    if not figures:
+        return []
+    widths = np.array([figure.get('width', 100) for figure in figures])
+    heights = np.array([figure.get('height', 100) for figure in figures])
+    n = len(widths)
+    # cum[k] - суммарная ширина (с отступами) первых k фигур
+    cum = np.concatenate(([0], np.cumsum(widths + padding)))
+    xs = np.empty(n, dtype=np.result_type(cum, padding))
+    ys = np.empty(n, dtype=np.result_type(heights, padding))
+    
     current_y = padding
     row_height = 0
-    
-    for figure in figures:
-        width = figure.get('width', 100)
-        height = figure.get('height', 100)
-        
+    row_start = 0  # первая фигура текущего ряда: current_x = padding + cum[i] - cum[row_start]
+    i = 0
+    while i < n:
         # Check if we need to move to next row
-        if current_x + width + padding > page_width:
-            current_x = padding
+        if padding + cum[i + 1] - cum[row_start] > page_width:
             current_y += row_height + padding
             row_height = 0
+            row_start = i
         
         # Check if we need a new page
-        if current_y + height + padding > page_height:
+        if current_y + heights[i] + padding > page_height:
             # This would actually need to start a new page in PDF generation
-            current_x = padding
             current_y = padding
             row_height = 0
+            row_start = i
+        
+        # Фигуры i+1.. остаются в этом ряду, пока помещаются по ширине и по высоте
+        end = int(np.searchsorted(cum, cum[row_start] + page_width - padding, side='right')) - 1
+        end = max(i + 1, min(end, n))
+        too_tall = np.flatnonzero(current_y + heights[i + 1:end] + padding > page_height)
+        if too_tall.size:
+            end = i + 1 + int(too_tall[0])
+        
+        # Add positions
+        xs[i:end] = padding + cum[i:end] - cum[row_start]
+        ys[i:end] = current_y
+        row_height = max(row_height, heights[i:end].max())
+        i = end
+    
+    return list(zip(xs.tolist(), ys.tolist()))
+
+def new_content_hasher():
+    """
+    Create a hasher for content-based file deduplication.
+    
+    Хеши сохраняются в базе, поэтому алгоритм всегда один и тот же (BLAKE2b), независимо
+    от установленных пакетов: с BLAKE3 при его наличии установка или удаление пакета
+    сделали бы все сохраненные хеши несравнимыми.
+    
+    Returns:
+        Hash object with update()/hexdigest() producing a 64-char hex string
+    """
+    return hashlib.blake2b(digest_size=32)
+
+def compute_file_content_hash(file_path, chunk_size=1 << 20):
+    """
+    Compute the content hash used for PDF deduplication.
+    
+    Args:
+        file_path (str): Path to the file
+        chunk_size (int): Read block size in bytes
         
-        # Add position
-        positions.append((current_x, current_y))
-        
-        # Update position for next figure
-        current_x += width + padding
-        row_height = max(row_height, height)
+    Returns:
+        str: Hex hash string (same format as new_content_hasher) or None on failure
+    """
+    try:
+        hasher = new_content_hasher()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+    except Exception as e:
+        logger.error(f"Ошибка при вычислении хеша файла: {str(e)}")
+        return None
+
+def _new_image_hasher(hash_algo):
+    """
+    Create a hasher for compute_image_hash.
     
-    return positions
+    Args:
+        hash_algo (str): 'md5', 'xxh3', 'blake3', 'blake2b' or 'fast'
+                         (xxh3, BLAKE3 or BLAKE2b - the fastest one available)
+        
+    Returns:
+        Hash object with update()/hexdigest()
+    """
+    if hash_algo == 'fast':
+        hash_algo = 'xxh3' if HAS_XXHASH else 'blake3' if HAS_BLAKE3 else 'blake2b'
+    if hash_algo == 'md5':
+        return hashlib.md5()
+    if hash_algo == 'xxh3' and HAS_XXHASH:
+        return xxhash.xxh3_128()
+    if hash_algo == 'blake3' and HAS_BLAKE3:
+        return blake3.blake3()
+    if hash_algo == 'blake2b':
+        return hashlib.blake2b(digest_size=32)
+    raise ValueError(f"Unsupported or unavailable hash algorithm: {hash_algo}")
 
-def compute_image_hash(img_path):
+def compute_image_hash(img_path, hash_algo='md5'):
     """
     Compute a simple hash for an image file for duplicate detection.
     
+    MD5 остается алгоритмом по умолчанию: по нему уже записаны хеши в FileHash
+    и имена файлов в хранилище по содержимому. Новые хранилища могут использовать
+    hash_algo='fast' - хеширование в этом случае упирается в диск, а не в процессор.
+    
     Args:
         img_path (str): Path to the image file
+        hash_algo (str): Hash algorithm (see _new_image_hasher)
         
     Returns:
-        str: MD5 hash string or None on failure
+        str: Hex hash string or None on failure
     """
     try:
-        import hashlib
-        
-        # Читаем файл небольшими кусками для экономии памяти
-        md5_hash = hashlib.md5()
+        hasher = _new_image_hasher(hash_algo)
         with open(img_path, "rb") as f:
-            # Читаем файл по 4KB за раз
-            for chunk in iter(lambda: f.read(4096), b""):
-                md5_hash.update(chunk)
-        return md5_hash.hexdigest()
+            try:
+                # Файл отображается в память и хешируется одним вызовом
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hasher.update(mm)
+            except (ValueError, OSError):
+                # Пустой файл или объект без поддержки mmap - читаем блоками по 1 MiB
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(chunk)
+        return hasher.hexdigest()
     except Exception as e:
         logger.error(f"Ошибка при вычислении хеша изображения: {str(e)}")
         return None
 
-def compute_text_similarity(text1, text2):
+def content_store_path(store_dir, content_hash):
+    """
+    Get the path of a blob in the content-addressed store.
+    
+    Args:
+        store_dir (str): Root directory of the content store
+        content_hash (str): Hex hash of the file content
+        
+    Returns:
+        str: Sharded blob path ({store_dir}/{hash[:2]}/{hash})
+    """
+    return os.path.join(store_dir, content_hash[:2], content_hash)
+
+def store_file_by_hash(temp_path, dest_path, content_hash=None, store_dir=None):
+    """
+    Move an uploaded temp file to its final path, keeping one copy per content hash.
+    
+    The content is kept once in the content-addressed store and dest_path is
+    a hard link to it, so re-uploading the same file takes no extra disk space.
+    Without a hash or store the temp file is simply renamed to dest_path.
+    
+    Args:
+        temp_path (str): Temporary file on the same filesystem as store_dir
+        dest_path (str): Final (friendly) file path
+        content_hash (str): Hex hash of the file content
+        store_dir (str): Root directory of the content store
+        
+    Returns:
+        bool: True if the content was already stored and no new data was written
+    """
+    if not content_hash or not store_dir:
+        os.replace(temp_path, dest_path)
+        return False
+    
+    blob_path = content_store_path(store_dir, content_hash)
+    already_stored = os.path.exists(blob_path)
+    if already_stored:
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(temp_path, blob_path)
+    
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(blob_path, dest_path)
+    except OSError as e:
+        # Файловая система без жестких ссылок - используем обычную копию
+        logger.warning(f"Не удалось создать жесткую ссылку {dest_path}: {str(e)}")
+        import shutil
+        shutil.copy2(blob_path, dest_path)
+    return already_stored
+
+def release_stored_file(content_hash, store_dir):
+    """
+    Remove a blob from the content store once no other file links to it.
+    
+    Args:
+        content_hash (str): Hex hash of the file content
+        store_dir (str): Root directory of the content store
+    """
+    try:
+        blob_path = content_store_path(store_dir, content_hash)
+        if os.stat(blob_path).st_nlink <= 1:
+            os.remove(blob_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка при удалении файла из хранилища: {str(e)}")
+
+class NormText:
+    """Text with its normalized form and word set (words longer than 2 characters) computed once."""
+    
+    __slots__ = ('raw', 'lower', 'words')
+    
+    def __init__(self, text):
+        self.raw = text
+        self.lower = text.lower().strip()
+        self.words = frozenset(w for w in self.lower.split() if len(w) > 2)
+
+@functools.lru_cache(maxsize=256)
+def _norm_text(text):
+    """
+    NormText for a string; одни и те же строки нормализуются один раз.
+    
+    Кеш небольшой: он держит в памяти сами тексты страниц. Чтобы сравнивать один текст
+    со многими, вызывающий код может передавать готовый NormText.
+    """
+    return NormText(text)
+
+def _as_norm_text(value):
+    """NormText for a str/NormText value; None for empty strings and other types."""
+    if isinstance(value, NormText):
+        return value
+    if isinstance(value, str) and value:
+        return _norm_text(value)
+    return None
+
+def compute_text_similarity(text1, text2, threshold=None):
     """
     Compute similarity between two text strings.
     
     Args:
-        text1 (str): First text
-        text2 (str): Second text
+        text1 (str): First text (str or NormText)
+        text2 (str): Second text (str or NormText)
+        threshold (float): If set, pairs whose word counts cannot reach this similarity
+                           are rejected early (0.0) without intersecting the word sets
         
     Returns:
         float: Similarity score between 0.0 and 1.0
     """
     try:
         # Проверка входных параметров
-        if not isinstance(text1, str) or not isinstance(text2, str):
-            return 0.0
-        
-        if not text1 or not text2:
+        text1, text2 = _as_norm_text(text1), _as_norm_text(text2)
+        if text1 is None or text2 is None:
             return 0.0
         
-        # Normalize texts
-        text1 = text1.lower().strip()
-        text2 = text2.lower().strip()
+        # Normalize texts (нормализованная форма и слова уже вычислены в NormText)
+        words1, words2 = text1.words, text2.words
+        text1, text2 = text1.lower, text2.lower
         
         if not text1 or not text2:
             return 0.0
@@ -279,16 +530,19 @@ def compute_text_similarity(text1, text2):
             return 0.0
         
         # Calculate Jaccard similarity on words
-        # Сначала фильтруем слова, чтобы избавиться от коротких, которые могут быть шумом
-        words1 = set(w for w in text1.split() if len(w) > 2)
-        words2 = set(w for w in text2.split() if len(w) > 2)
-        
+        # (в NormText.words уже отфильтрованы короткие слова, которые могут быть шумом)
         if not words1 or not words2:
             return 0.0
         
-        # Compute Jaccard similarity (intersection / union)
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
+        # Jaccard не превышает min(|A|, |B|) / max(|A|, |B|): при таком соотношении
+        # размеров порог недостижим и пересечение можно не считать
+        count1, count2 = len(words1), len(words2)
+        if threshold and min(count1, count2) < threshold * max(count1, count2):
+            return 0.0
+        
+        # Compute Jaccard similarity (intersection / union); |A u B| = |A| + |B| - |A n B|
+        intersection = len(words1 & words2)
+        union = count1 + count2 - intersection
         
         if union == 0:
             return 0.0
@@ -298,67 +552,459 @@ def compute_text_similarity(text1, text2):
         logger.error(f"Ошибка при вычислении похожести текстов: {str(e)}")
         return 0.0
 
-def is_text_duplicate(text, existing_texts, threshold=0.85):
+def _jaccard_many_numpy(query, corpus):
+    """Векторный вариант jaccard_many на NumPy (np.bitwise_count)."""
+    inter = np.bitwise_count(corpus & query).sum(axis=1)
+    union = np.bitwise_count(corpus | query).sum(axis=1)
+    out = np.zeros(corpus.shape[0], dtype=np.float32)
+    np.divide(inter, union, out=out, where=union > 0, casting='unsafe')
+    return out
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _popcount64(x):
+        # SWAR-подсчет единичных битов 64-битного слова
+        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+    
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _jaccard_many_numba(query, corpus):
+        out = np.zeros(corpus.shape[0], dtype=np.float32)
+        for i in prange(corpus.shape[0]):
+            inter = np.uint64(0)
+            union = np.uint64(0)
+            for j in range(query.size):
+                a = query[j]
+                b = corpus[i, j]
+                inter += _popcount64(a & b)
+                union += _popcount64(a | b)
+            if union:
+                out[i] = inter / union
+        return out
+    
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _jaccard_matrix_numba(queries, corpus):
+        out = np.zeros((queries.shape[0], corpus.shape[0]), dtype=np.float32)
+        # Один параллельный цикл по парам (запрос, текст): потоки Numba загружают ядра
+        # и при нескольких запросах, и при маленьком корпусе
+        for k in prange(queries.shape[0] * corpus.shape[0]):
+            q = k // corpus.shape[0]
+            i = k % corpus.shape[0]
+            inter = np.uint64(0)
+            union = np.uint64(0)
+            for j in range(queries.shape[1]):
+                a = queries[q, j]
+                b = corpus[i, j]
+                inter += _popcount64(a & b)
+                union += _popcount64(a | b)
+            if union:
+                out[q, i] = inter / union
+        return out
+
+def jaccard_many(query, corpus):
     """
-    Check if a text is a duplicate of any existing text.
+    Compute Jaccard similarity of one bitset against many.
     
     Args:
-        text (str): Text to check
-        existing_texts (list): List of existing texts
-        threshold (float): Similarity threshold (0.0 to 1.0)
+        query (np.ndarray): uint64 bitset of shape (words,)
+        corpus (np.ndarray): uint64 bitsets of shape (texts, words)
         
     Returns:
-        tuple: (is_duplicate, most_similar_text, similarity_score)
+        np.ndarray: float32 similarities of shape (texts,)
     """
-    try:
-        # Проверка входных данных на корректность
-        if not isinstance(text, str) or text is None:
-            return False, None, 0.0
+    if HAS_NUMBA:
+        return _jaccard_many_numba(query, corpus)
+    return _jaccard_many_numpy(query, corpus)
+
+def jaccard_matrix(queries, corpus):
+    """
+    Compute Jaccard similarity of many bitsets against many.
+    
+    Args:
+        queries (np.ndarray): uint64 bitsets of shape (queries, words)
+        corpus (np.ndarray): uint64 bitsets of shape (texts, words)
+        
+    Returns:
+        np.ndarray: float32 similarities of shape (queries, texts)
+    """
+    if HAS_NUMBA:
+        return _jaccard_matrix_numba(queries, corpus)
+    out = np.zeros((queries.shape[0], corpus.shape[0]), dtype=np.float32)
+    for row, query in enumerate(queries):
+        out[row] = _jaccard_many_numpy(query, corpus)
+    return out
+
+class TextSimilarityIndex:
+    """
+    Index of texts for repeated Jaccard similarity lookups.
+    
+    Сравнение идет по тем же правилам, что и compute_text_similarity, но слова
+    (длиннее 2 символов) каждого текста один раз переводятся в номера словаря,
+    а текст хранится как битовое множество в int. Пересечение и объединение
+    считаются побитовыми операциями и bit_count() без создания множеств
+    при каждом сравнении.
+    
+    Обратный индекс (слово -> тексты) ограничивает сравнение текстами, у которых
+    есть общие слова с запросом: у остальных похожесть равна нулю. С заданным
+    порогом кандидаты дополнительно отсекаются по числу слов и пересечению.
+    
+    Для больших коллекций можно включить MinHash LSH (пакет datasketch): запрос
+    с порогом тогда проверяет точным Jaccard только кандидатов из LSH. Это
+    приближенный поиск - пара с похожестью чуть выше порога может быть пропущена.
+    """
+    
+    def __init__(self, texts=None, use_lsh=False, lsh_threshold=0.85, num_perm=128):
+        """
+        Initialize the index.
+        
+        Args:
+            texts (list): Texts to add right away
+            use_lsh (bool): Use MinHash LSH for thresholded lookups (requires datasketch)
+            lsh_threshold (float): Jaccard threshold the LSH index is tuned for
+            num_perm (int): Number of MinHash permutations
+        """
+        self.num_perm = num_perm
+        self._lsh = None
+        if use_lsh:
+            if HAS_DATASKETCH:
+                self._lsh = MinHashLSH(threshold=lsh_threshold, num_perm=num_perm)
+            else:
+                logger.warning("datasketch не установлен, поиск похожих текстов выполняется без LSH")
+        self.vocab = {}
+        self.texts = []
+        self._normalized = []
+        self._bits = []
+        self._word_counts = []
+        # Номер слова -> номера текстов, в которых оно встречается
+        self._postings = {}
+        # Нормализованный текст -> первый исходный текст (для точных совпадений)
+        self._exact = {}
+        for text in texts or ():
+            self.add(text)
+    
+    def __len__(self):
+        return len(self.texts)
+    
+    def _encode(self, normalized, add_words):
+        """
+        Convert normalized text into a word bitset.
+        
+        Args:
+            normalized (str): Lowercased and stripped text
+            add_words (bool): Add unknown words to the vocabulary
             
-        if not isinstance(existing_texts, list) or not existing_texts:
-            return False, None, 0.0
+        Returns:
+            tuple: (bitset, number of words missing from the vocabulary)
+        """
+        word_ids = []
+        unknown = 0
+        for word in set(normalized.split()):
+            if len(word) <= 2:
+                continue
+            word_id = self.vocab.get(word)
+            if word_id is None:
+                if not add_words:
+                    unknown += 1
+                    continue
+                word_id = self.vocab[word] = len(self.vocab)
+            word_ids.append(word_id)
+        
+        if not word_ids:
+            return 0, unknown
+        # Биты собираются в bytearray и превращаются в int одним вызовом
+        buf = bytearray((max(word_ids) >> 3) + 1)
+        for word_id in word_ids:
+            buf[word_id >> 3] |= 1 << (word_id & 7)
+        return int.from_bytes(buf, 'little'), unknown
+    
+    def add(self, text):
+        """
+        Add a text to the index (invalid and empty values are skipped).
+        
+        Args:
+            text (str): Text to add
+        """
+        if not isinstance(text, str) or not text:
+            return
+        normalized = text.lower().strip()
+        bits = self._encode(normalized, add_words=True)[0]
+        index = len(self.texts)
+        self.texts.append(text)
+        self._normalized.append(normalized)
+        self._bits.append(bits)
+        self._word_counts.append(bits.bit_count())
+        self._exact.setdefault(normalized, text)
+        for word_id in self._bit_ids(bits):
+            self._postings.setdefault(word_id, []).append(index)
+        if self._lsh is not None and bits:
+            self._lsh.insert(index, self._minhash(normalized))
+    
+    def _minhash(self, normalized):
+        """Build a MinHash signature over the words longer than 2 characters."""
+        minhash = MinHash(num_perm=self.num_perm)
+        for word in set(normalized.split()):
+            if len(word) > 2:
+                minhash.update(word.encode('utf-8'))
+        return minhash
+    
+    def save(self, path):
+        """
+        Save the index (including the LSH tables) to disk.
+        
+        Args:
+            path (str): Output file path
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def load(path):
+        """
+        Load an index saved with save().
+        
+        Args:
+            path (str): Index file path
+            
+        Returns:
+            TextSimilarityIndex: Loaded index or None on error
+        """
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке индекса текстов: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _bit_ids(bits):
+        """Yield the word ids set in a bitset."""
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+    
+    def find_exact(self, text):
+        """
+        Find an indexed text equal to the given one after normalization.
+        
+        Args:
+            text (str): Text to look up
+            
+        Returns:
+            str: First matching indexed text or None
+        """
+        return self._exact.get(text.lower().strip())
+    
+    def _similarity(self, normalized, bits, unknown, index):
+        """Similarity of a prepared query with the indexed text number `index`."""
+        other = self._normalized[index]
+        if not normalized or not other:
+            return 0.0
+        if normalized == other:
+            return 1.0
+        
+        # Если тексты сильно различаются по длине, они, вероятно, не похожи
+        len1, len2 = len(normalized), len(other)
+        if len1 > 2 * len2 or len2 > 2 * len1:
+            return 0.0
+        
+        other_bits = self._bits[index]
+        if not (bits or unknown) or not other_bits:
+            return 0.0
+        # Слова запроса, которых нет в словаре, входят только в объединение
+        return (bits & other_bits).bit_count() / ((bits | other_bits).bit_count() + unknown)
+    
+    def _bits_to_array(self, bits, words):
+        """Convert an int bitset to a uint64 array of `words` elements."""
+        return np.frombuffer(bits.to_bytes(words * 8, 'little'), dtype='<u8')
+    
+    def bit_matrix(self):
+        """
+        Get all indexed bitsets as a uint64 matrix for jaccard_many.
+        
+        Returns:
+            np.ndarray: Array of shape (texts, ceil(vocabulary / 64))
+        """
+        words = max(1, (len(self.vocab) + 63) // 64)
+        matrix = np.zeros((len(self.texts), words), dtype=np.uint64)
+        for index, bits in enumerate(self._bits):
+            matrix[index] = self._bits_to_array(bits, words)
+        return matrix
+    
+    def word_similarities(self, text, matrix=None):
+        """
+        Compute word-set Jaccard similarity of a text with every indexed text at once.
+        
+        В отличие от most_similar здесь не применяются правила compute_text_similarity
+        для точных совпадений и текстов сильно разной длины - только Jaccard по словам.
+        
+        Args:
+            text (str): Text to compare
+            matrix (np.ndarray): Result of bit_matrix() to reuse between calls
+            
+        Returns:
+            np.ndarray: float32 similarities in the order of self.texts
+        """
+        if matrix is None:
+            matrix = self.bit_matrix()
+        bits, unknown = self._encode(text.lower().strip(), add_words=False)
+        if unknown:
+            # Слова запроса вне словаря получают временные номера за его концом:
+            # они увеличивают только объединение
+            bits |= ((1 << unknown) - 1) << len(self.vocab)
+        words = max(matrix.shape[1], (len(self.vocab) + unknown + 63) // 64)
+        if words > matrix.shape[1]:
+            matrix = np.pad(matrix, ((0, 0), (0, words - matrix.shape[1])))
+        return jaccard_many(self._bits_to_array(bits, words), matrix)
+    
+    def word_similarities_many(self, texts):
+        """
+        Compute word-set Jaccard similarity of many texts with every indexed text.
+        
+        Запросы складываются в одну матрицу и считаются одним вызовом jaccard_matrix в
+        текущем процессе: ядро Numba само распределяет пары по потокам, без пула процессов
+        (fork из многопоточного процесса, переподписка ядер, пересылка результатов).
+        
+        Args:
+            texts (list): Texts to compare
+            
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), len(self.texts))
+        """
+        # Слова запросов вне словаря получают временные номера за его концом (как в word_similarities)
+        encoded = []
+        extra = 0
+        for text in texts:
+            bits, unknown = self._encode(text.lower().strip(), add_words=False)
+            if unknown:
+                bits |= ((1 << unknown) - 1) << len(self.vocab)
+            encoded.append(bits)
+            extra = max(extra, unknown)
+        
+        words = max(1, (len(self.vocab) + extra + 63) // 64)
+        queries = np.zeros((len(texts), words), dtype=np.uint64)
+        for row, bits in enumerate(encoded):
+            queries[row] = self._bits_to_array(bits, words)
+        matrix = self.bit_matrix()
+        if words > matrix.shape[1]:
+            matrix = np.pad(matrix, ((0, 0), (0, words - matrix.shape[1])))
+        return jaccard_matrix(queries, matrix)
+    
+    def most_similar(self, text, threshold=None):
+        """
+        Find the indexed text with the highest similarity.
+        
+        Args:
+            text (str): Text to compare
+            threshold (float): If set, only texts that can reach this similarity are
+                               compared (texts below it are not reported)
+            
+        Returns:
+            tuple: (most_similar_text, similarity_score); (None, 0.0) if nothing is similar
+        """
+        normalized = text.lower().strip()
+        exact = self._exact.get(normalized)
+        if exact is not None and normalized:
+            return exact, 1.0
+        
+        bits, unknown = self._encode(normalized, add_words=False)
+        # Число общих слов с каждым текстом, у которого есть хотя бы одно общее слово
+        overlaps = {}
+        for word_id in self._bit_ids(bits):
+            for index in self._postings[word_id]:
+                overlaps[index] = overlaps.get(index, 0) + 1
+        
+        if threshold and self._lsh is not None and bits:
+            # Кандидаты из LSH; точный Jaccard отсеет ложные совпадения
+            candidates = sorted(index for index in self._lsh.query(self._minhash(normalized))
+                                if index in overlaps)
+        else:
+            candidates = sorted(overlaps)
+        if threshold:
+            # Jaccard >= t возможен только при t*n <= m <= n/t
+            # и пересечении не меньше t*(n + m)/(1 + t)
+            query_count = bits.bit_count() + unknown
+            min_count = threshold * query_count
+            max_count = query_count / threshold
+            candidates = [
+                index for index in candidates
+                if min_count <= self._word_counts[index] <= max_count
+                and overlaps[index] >= threshold * (query_count + self._word_counts[index]) / (1 + threshold)
+            ]
+        
+        max_similarity = 0.0
+        most_similar_text = None
+        for index in candidates:
+            similarity = self._similarity(normalized, bits, unknown, index)
+            if threshold and similarity < threshold:
+                continue
+            if similarity > max_similarity:
+                max_similarity = similarity
+                most_similar_text = self.texts[index]
+        return most_similar_text, max_similarity
+    
+    def query(self, text, threshold=0.85):
+        """
+        Check if a text duplicates an indexed text (same result as is_text_duplicate).
         
+        Индекс строится один раз для пакета страниц, после чего каждый запрос
+        не нормализует и не разбивает на слова уже проиндексированные тексты.
+        
+        Args:
+            text (str): Text to check
+            threshold (float): Similarity threshold (0.0 to 1.0)
+            
+        Returns:
+            tuple: (is_duplicate, most_similar_text, similarity_score)
+        """
         # Нормализация текста
         normalized_text = text.lower().strip()
         if not normalized_text:
             return False, None, 0.0
-            
-        max_similarity = 0.0
-        most_similar_text = None
         
         # Быстрая проверка на точное совпадение
-        for existing_text in existing_texts:
-            # Пропускаем некорректные значения
-            if not isinstance(existing_text, str) or not existing_text:
-                continue
-                
-            # Проверка на точное совпадение
-            if normalized_text == existing_text.lower().strip():
-                return True, existing_text, 1.0
+        existing_text = self._exact.get(normalized_text)
+        if existing_text is not None:
+            return True, existing_text, 1.0
         
         # Если текст очень короткий, используем только точное совпадение
         if len(normalized_text) < 30:
             return False, None, 0.0
             
         # Для более длинных текстов проверяем похожесть
-        for existing_text in existing_texts:
-            # Пропускаем некорректные значения
-            if not isinstance(existing_text, str) or not existing_text:
-                continue
-                
-            try:
-                similarity = compute_text_similarity(normalized_text, existing_text)
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    most_similar_text = existing_text
-            except Exception as e:
-                # Логируем и игнорируем ошибки при сравнении
-                logger.error(f"Ошибка при сравнении текстов: {str(e)}")
-                continue
+        most_similar_text, max_similarity = self.most_similar(normalized_text)
+        
+        return max_similarity >= threshold, most_similar_text, max_similarity
+
+def is_text_duplicate(text, existing_texts, threshold=0.85):
+    """
+    Check if a text is a duplicate of any existing text.
+    
+    Args:
+        text (str): Text to check
+        existing_texts (list): List of existing texts or a TextSimilarityIndex
+                               (the index can be reused across calls)
+        threshold (float): Similarity threshold (0.0 to 1.0)
         
-        is_duplicate = max_similarity >= threshold
+    Returns:
+        tuple: (is_duplicate, most_similar_text, similarity_score)
+    """
+    try:
+        # Проверка входных данных на корректность
+        if not isinstance(text, str) or text is None:
+            return False, None, 0.0
+            
+        if isinstance(existing_texts, TextSimilarityIndex):
+            index = existing_texts
+        elif isinstance(existing_texts, list) and existing_texts:
+            # Некорректные значения пропускаются при построении индекса
+            index = TextSimilarityIndex(existing_texts)
+        else:
+            return False, None, 0.0
         
-        return is_duplicate, most_similar_text, max_similarity
+        return index.query(text, threshold)
     
     except Exception as e:
         # В случае любой ошибки возвращаем "не дубликат"